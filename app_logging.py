@@ -0,0 +1,172 @@
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+import time
+
+# -----------------------------------------------------
+# 非阻塞的日誌設定
+# -----------------------------------------------------
+# 音訊與 WebSocket 接收路徑上不直接寫 stdout：
+# - 各模組使用 logging.getLogger(__name__)，只有 setup_logging() 設定的等級以上才會處理
+# - 紀錄放進有上限的佇列（QueueHandler），由背景執行緒（QueueListener）格式化並寫出；
+#   佇列滿了就丟棄並計數，呼叫端永遠不會被卡住
+# - 同一行程式（相同的 logger 與訊息樣板）的 INFO 以下紀錄，每 interval 秒最多 burst 筆，
+#   超過的部分只計數，下一筆放行的紀錄會附上略過的數量（例如每個音訊塊一筆的 DEBUG 訊息）
+# - 寫出前遮蔽病患資料：函式呼叫參數用 redact_arguments() 只保留識別碼，
+#   訊息中「姓名: ...」或 "name": "..." 之類的欄位另外由 RedactFilter 以 *** 取代
+#
+# 用法：
+#     setup_logging('INFO')          # 程式啟動時呼叫一次
+#     ...
+#     shutdown_logging()             # 結束前寫完佇列中的紀錄
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+LOG_QUEUE_SIZE = 10000          # 最多暫存幾筆尚未寫出的紀錄
+RATE_LIMIT_BURST = 5            # 每個訊息樣板在 RATE_LIMIT_INTERVAL 秒內最多寫出幾筆
+RATE_LIMIT_INTERVAL = 1.0
+
+# 函式呼叫參數中可以原樣記錄的欄位（識別碼與查詢條件），其他欄位都視為病患資料
+SAFE_ARGUMENTS = frozenset({
+    'patient_id', 'record_id', 'session_id', 'role', 'metric', 'days',
+    'page_size', 'page_token', 'reviewed', 'min_age', 'max_age',
+})
+
+# 訊息中可能出現病患資料的欄位：中文標籤（姓名: 王小明）或 JSON / dict 的鍵（"name": "王小明"）
+_REDACT_PATTERNS = (
+    re.compile(r'((?:姓名|性別|年齡|飲食|運動|不適|回饋|評估|筆記|內容)\s*[:：]\s*)[^,，\n]+'),
+    # 鍵名前面不能是文字或底線，避免 message / page_token 之類的字被當成 age
+    re.compile(r'''((?<![\w])["']?(?:name|gender|age|diet|exercise|inconvenience|feedback|evaluation|notes|content|transcript)["']?\s*[:=]\s*)(?:"[^"]*"|'[^']*'|[^,}\s]+)'''),
+)
+
+
+# 函式呼叫參數的可記錄版本：只保留 SAFE_ARGUMENTS，其他欄位以 *** 取代
+def redact_arguments(arguments):
+    if not isinstance(arguments, dict):
+        return '***'
+    return {key: value if key in SAFE_ARGUMENTS else '***' for key, value in arguments.items()}
+
+
+def redact_text(text):
+    for pattern in _REDACT_PATTERNS:
+        text = pattern.sub(r'\1***', text)
+    return text
+
+
+# 在背景執行緒格式化完訊息後遮蔽病患資料；例外的 traceback（例如 logger.exception 時
+# 例外訊息中的 SQL 參數）與 stack_info 也先在這裡格式化並遮蔽，Formatter 會直接使用 exc_text
+class RedactFilter(logging.Filter):
+    _formatter = logging.Formatter()
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = redact_text(message)
+        if redacted != message:
+            record.msg, record.args = redacted, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = redact_text(record.exc_text)
+        if record.stack_info:
+            record.stack_info = redact_text(record.stack_info)
+        return True
+
+
+# 依 (logger, 訊息樣板) 限制 INFO 以下紀錄的數量；WARNING 以上一律放行
+class RateLimitFilter(logging.Filter):
+    def __init__(self, burst=RATE_LIMIT_BURST, interval=RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}    # (logger, 樣板) -> [視窗開始時間, 本視窗已放行, 略過數]
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                skipped = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                skipped = 0
+            else:
+                window[2] += 1
+                self.suppressed += 1
+                return False
+        if skipped:
+            record.msg = f'{record.msg}（略過 {skipped} 筆相同訊息）'
+        return True
+
+
+# 不會阻塞的 QueueHandler：佇列滿了就丟棄；訊息的格式化留給背景執行緒
+class DropQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    # 同一個行程內的佇列不需要序列化，直接傳遞 LogRecord
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_queue_handler = None
+_rate_limit = None
+
+
+# 設定根 logger：呼叫端只把紀錄放進佇列，由背景執行緒寫到 stderr（與 path 指定的檔案）
+def setup_logging(level='INFO', path=None, burst=RATE_LIMIT_BURST, interval=RATE_LIMIT_INTERVAL):
+    global _listener, _queue_handler, _rate_limit
+    shutdown_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if path:
+        handlers.append(logging.FileHandler(path, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(RedactFilter())
+
+    _rate_limit = RateLimitFilter(burst, interval)
+    _queue_handler = DropQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(_rate_limit)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+
+# 停止背景執行緒（會先寫完佇列中的紀錄）
+def shutdown_logging():
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    _listener = None
+    _queue_handler = None
+
+
+def logging_stats():
+    return {
+        'dropped': _queue_handler.dropped if _queue_handler is not None else 0,
+        'rate_limited': _rate_limit.suppressed if _rate_limit is not None else 0,
+        'queued': _queue_handler.queue.qsize() if _queue_handler is not None else 0,
+    }
@@ -0,0 +1,387 @@
+import collections
+import threading
+import time
+
+import numpy as np
+
+# -----------------------------------------------------
+# 音訊緩衝 / 佇列
+# -----------------------------------------------------
+
+# 有上限的執行緒安全佇列：滿了就丟掉最舊的資料，音訊回呼（生產者）永遠不會被阻塞，
+# 網路端（消費者）太慢時記憶體用量也不會無限成長。
+# on_put 會在每次放入後（鎖外）被呼叫，asyncio 消費者可用它喚醒事件迴圈。
+class DropOldestQueue:
+    def __init__(self, maxsize, on_put=None):
+        self.maxsize = maxsize
+        self.on_put = on_put
+        self._items = collections.deque()   # [(放入時間, 資料)]
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._put = 0
+        self._dropped = 0
+        self._max_depth = 0
+        self._batches = 0
+        self._batched_items = 0
+
+    # 放入一筆資料（不會阻塞）；回傳 False 表示佇列已關閉
+    def put(self, item):
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self._dropped += 1
+            self._items.append((time.monotonic(), item))
+            self._put += 1
+            if len(self._items) > self._max_depth:
+                self._max_depth = len(self._items)
+            self._cond.notify()
+        if self.on_put is not None:
+            self.on_put()
+        return True
+
+    # 取出最多 max_items 筆資料（需持有鎖）
+    def _take_batch_locked(self, max_items):
+        count = min(max_items, len(self._items))
+        batch = [self._items.popleft()[1] for _ in range(count)]
+        self._batches += 1
+        self._batched_items += count
+        return batch
+
+    # 阻塞直到至少有一筆資料，再於延遲預算內湊批。
+    # 佇列關閉且已清空時回傳空串列。
+    def get_batch(self, max_items, max_wait):
+        with self._cond:
+            while not self._items:
+                if self._closed:
+                    return []
+                self._cond.wait()
+
+            deadline = self._items[0][0] + max_wait
+            while len(self._items) < max_items and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._take_batch_locked(max_items)
+
+    # get_batch 的非阻塞版本（給 asyncio 使用）：
+    # 可以出批時回傳 (批次, None)；還在延遲預算內時回傳 ([], 還需等待的秒數)；佇列為空時回傳 ([], None)
+    def poll_batch(self, max_items, max_wait):
+        with self._cond:
+            if not self._items:
+                return [], None
+            remaining = self._items[0][0] + max_wait - time.monotonic()
+            if len(self._items) < max_items and remaining > 0 and not self._closed:
+                return [], remaining
+            return self._take_batch_locked(max_items), None
+
+    # 丟棄佇列中所有資料，回傳丟棄的筆數
+    def clear(self):
+        with self._cond:
+            count = len(self._items)
+            self._items.clear()
+        return count
+
+    # 關閉佇列並喚醒所有等待中的消費者
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    # 佇列深度與丟棄統計
+    def stats(self):
+        with self._cond:
+            return {
+                'maxsize': self.maxsize,
+                'depth': len(self._items),
+                'max_depth': self._max_depth,
+                'put': self._put,
+                'dropped': self._dropped,
+                'batches': self._batches,
+                'avg_batch': round(self._batched_items / self._batches, 2) if self._batches else 0.0,
+            }
+
+
+# read_padded 的輸出暫存區與同樣大小的靜音：只在需要更大時重新配置，
+# 裝置取樣率與傳輸取樣率不同時每次讀取的大小會變動（例如 44.1kHz），以切片使用同一塊空間
+def _reserve(scratch, silence, nbytes):
+    if len(scratch) >= nbytes:
+        return scratch, silence
+    return bytearray(nbytes), memoryview(bytes(nbytes))
+
+
+# 預先配置、容量固定的環形緩衝區，給播放端使用：
+# - 寫入（WebSocket 接收端）與讀取（PortAudio 回呼）只在複製資料與更新索引時短暫持鎖
+# - 以 memoryview 切片讀寫，每次成本只跟本次讀寫量有關，與緩衝內剩餘的音訊量無關
+# - clear() 只重設索引，O(1)，供使用者插話（barge-in）時使用
+# - 寫不下的部分直接丟棄並計入 overrun
+class AudioRingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0    # 下一個讀取位置
+        self._size = 0     # 目前緩衝的位元組數
+        self._lock = threading.Lock()
+
+        # read_padded 用的輸出暫存區（只有單一讀取端：播放回呼）
+        self._scratch = bytearray()
+        self._silence = memoryview(b'')
+        self._playing = False
+
+        self._written = 0
+        self._read = 0
+        self._max_fill = 0
+        self._overruns = 0
+        self._overrun_bytes = 0
+        self._underruns = 0
+        self._underrun_bytes = 0
+
+    # 寫入音訊資料，回傳實際寫入的位元組數
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        with self._lock:
+            count = len(data)
+            free = self.capacity - self._size
+            if count > free:
+                self._overruns += 1
+                self._overrun_bytes += count - free
+                count = free
+            end = (self._start + self._size) % self.capacity
+            first = min(count, self.capacity - end)
+            self._view[end:end + first] = data[:first]
+            self._view[:count - first] = data[first:count]
+            self._size += count
+            self._written += count
+            if self._size > self._max_fill:
+                self._max_fill = self._size
+        return count
+
+    # 讀出最多 len(out) 位元組到可寫的 memoryview，回傳實際讀取的位元組數
+    def read_into(self, out):
+        with self._lock:
+            count = min(len(out), self._size)
+            first = min(count, self.capacity - self._start)
+            out[:first] = self._view[self._start:self._start + first]
+            out[first:count] = self._view[:count - first]
+            self._start = (self._start + count) % self.capacity
+            self._size -= count
+            self._read += count
+        return count
+
+    # 預先配置 read_padded 的暫存區（播放回呼每次最多讀取的位元組數），回呼中不再配置記憶體
+    def reserve(self, nbytes):
+        self._scratch, self._silence = _reserve(self._scratch, self._silence, nbytes)
+
+    # 讀出剛好 nbytes 位元組，不足的部分補靜音；回傳 (音訊 bytes, 實際有資料的位元組數)。
+    # 播放中途資料不夠（含回應自然結束的那一次）會計入 underrun。
+    def read_padded(self, nbytes):
+        self.reserve(nbytes)
+        out = memoryview(self._scratch)[:nbytes]
+        count = self.read_into(out)
+        if count < nbytes:
+            out[count:] = self._silence[count:nbytes]
+            if self._playing:
+                with self._lock:
+                    self._underruns += 1
+                    self._underrun_bytes += nbytes - count
+        self._playing = count == nbytes
+        return bytes(out), count
+
+    # 清空緩衝（只重設索引）
+    def clear(self):
+        with self._lock:
+            self._start = 0
+            self._size = 0
+        self._playing = False
+
+    def __len__(self):
+        return self._size
+
+    # 尚未播放的位元組數（RealtimeSession 用來推算插話時播放到的位置）
+    def unplayed_bytes(self):
+        return self._size
+
+    # 緩衝填充量與 underrun / overrun 統計
+    def stats(self):
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'fill': self._size,
+                'max_fill': self._max_fill,
+                'written': self._written,
+                'read': self._read,
+                'overruns': self._overruns,
+                'overrun_bytes': self._overrun_bytes,
+                'underruns': self._underruns,
+                'underrun_bytes': self._underrun_bytes,
+            }
+
+
+# 自適應抖動緩衝（jitter buffer），包在 AudioRingBuffer 外面給喇叭使用，介面與 AudioRingBuffer 相同：
+# - 每段回應先累積 target_ms 的音訊才開始播放；資料等待超過 target_ms 或回應已結束（end_of_stream）
+#   時不再等待，開始延遲最多就是 target_ms
+# - target_ms 依音訊到達時間的抖動調整：以 RFC 3550 的方式估計（到達間隔與音訊長度的差，
+#   只計入晚到的部分，1/16 的指數移動平均），target_ms = min_ms + JITTER_FACTOR × 抖動，限制在 max_ms 以內；
+#   網路穩定時開始延遲接近 min_ms，抖動大時自動加深
+# - 播放途中資料不夠（underrun）：已有的尾端淡出 fade_ms 而不是直接切斷，之後重新累積 target_ms 再播放，
+#   恢復時淡入，避免喀聲；回應自然結束（呼叫過 end_of_stream）不算 underrun
+# - 寫入（WebSocket 接收端）與讀取（PortAudio 回呼）可以在不同執行緒
+# - on_clear 會在每次 clear() 後（鎖外）被呼叫，讀取端可用它重設自己保留的狀態（例如取樣率轉換）
+JITTER_MIN_MS = 40          # 最小的預先緩衝深度
+JITTER_MAX_MS = 400         # 最大的預先緩衝深度
+JITTER_INITIAL_MS = 20      # 還沒有量測資料時假設的抖動
+JITTER_FACTOR = 3           # 預先緩衝深度為抖動估計值的幾倍（加上 min_ms）
+JITTER_FADE_MS = 5          # underrun 時淡出 / 恢復時淡入的長度
+JITTER_STREAM_GAP_S = 1.0   # 兩段音訊的間隔超過這個秒數，視為新的一段串流重新計時
+
+
+class JitterBuffer:
+    def __init__(self, capacity, rate, min_ms=JITTER_MIN_MS, max_ms=JITTER_MAX_MS,
+                 initial_jitter_ms=JITTER_INITIAL_MS, fade_ms=JITTER_FADE_MS, on_clear=None):
+        self.buffer = AudioRingBuffer(capacity)
+        self.on_clear = on_clear
+        self.bytes_per_second = rate * 2    # 播放端一律是 pcm16
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.fade_samples = rate * fade_ms // 1000
+        self._lock = threading.Lock()
+
+        self._jitter = initial_jitter_ms / 1000    # 抖動估計值（秒）
+        self._stream_start = None   # 目前串流第一段音訊的到達時間
+        self._media = 0.0           # 目前串流已收到的音訊長度（秒）
+        self._last_transit = 0.0    # 上一段音訊的到達時間減去它在串流中的時間位置
+        self._last_arrival = 0.0
+
+        self._playing = False
+        self._waiting_since = None  # 開始累積預先緩衝的時間
+        self._ended = False         # 目前的回應已送完（end_of_stream）
+        self._fade_in = False
+
+        self._scratch = bytearray()
+        self._silence = memoryview(b'')
+
+        self._starts = 0
+        self._start_delay_total = 0.0
+        self._start_delay_max = 0.0
+        self._underruns = 0
+        self._underrun_bytes = 0
+
+    # 目前的預先緩衝深度（毫秒）
+    def target_ms(self):
+        return min(self.max_ms, self.min_ms + JITTER_FACTOR * self._jitter * 1000)
+
+    def write(self, data):
+        now = time.monotonic()
+        duration = len(data) / self.bytes_per_second
+        with self._lock:
+            if self._stream_start is None or now - self._last_arrival > JITTER_STREAM_GAP_S:
+                self._stream_start = now
+                self._media = 0.0
+                self._last_transit = 0.0
+            else:
+                transit = now - self._stream_start - self._media
+                late = max(0.0, transit - self._last_transit)
+                # 變大時較快跟上（1/4），變小時慢慢回落（1/16），偶發的大延遲不會馬上被平均掉
+                self._jitter += (late - self._jitter) / (4 if late > self._jitter else 16)
+                self._last_transit = transit
+            self._media += duration
+            self._last_arrival = now
+            self._ended = False
+            if not self._playing and self._waiting_since is None:
+                self._waiting_since = now
+        return self.buffer.write(data)
+
+    # 目前的回應已送完：不足預先緩衝深度的音訊直接開始播放，播完後不算 underrun
+    def end_of_stream(self):
+        with self._lock:
+            self._ended = True
+            self._stream_start = None
+
+    # 是否可以開始播放（需持有鎖）
+    def _ready_locked(self, now):
+        buffered = len(self.buffer)
+        if not buffered:
+            return False
+        target_ms = self.target_ms()
+        waited = now - self._waiting_since if self._waiting_since is not None else 0.0
+        if not self._ended and buffered * 1000 < target_ms * self.bytes_per_second and waited * 1000 < target_ms:
+            return False
+        self._playing = True
+        self._starts += 1
+        self._start_delay_total += waited
+        self._start_delay_max = max(self._start_delay_max, waited)
+        self._waiting_since = None
+        return True
+
+    def reserve(self, nbytes):
+        self._scratch, self._silence = _reserve(self._scratch, self._silence, nbytes)
+
+    # 讀出剛好 nbytes 位元組，與 AudioRingBuffer.read_padded 相同：回傳 (音訊 bytes, 實際有資料的位元組數)
+    def read_padded(self, nbytes):
+        self.reserve(nbytes)
+        out = memoryview(self._scratch)[:nbytes]
+        with self._lock:
+            if not self._playing and not self._ready_locked(time.monotonic()):
+                return bytes(self._silence[:nbytes]), 0
+            count = self.buffer.read_into(out)
+            fade_in, fade_out = self._fade_in, False
+            self._fade_in = False
+            if count < nbytes:
+                self._playing = False
+                if not self._ended:
+                    self._underruns += 1
+                    self._underrun_bytes += nbytes - count
+                    self._fade_in = fade_out = True
+        samples = np.frombuffer(out, dtype='<i2')
+        if fade_in:
+            n = min(self.fade_samples, count // 2)
+            samples[:n] = samples[:n] * np.linspace(0.0, 1.0, n, endpoint=False)
+        if fade_out:
+            n = min(self.fade_samples, count // 2)
+            samples[count // 2 - n:count // 2] = samples[count // 2 - n:count // 2] * np.linspace(1.0, 0.0, n)
+        if count < nbytes:
+            out[count:] = self._silence[count:nbytes]
+        return bytes(out), count
+
+    # 清空緩衝（使用者插話），下一段音訊重新累積預先緩衝
+    def clear(self):
+        with self._lock:
+            self.buffer.clear()
+            self._playing = False
+            self._waiting_since = None
+            self._fade_in = False
+            self._stream_start = None
+        if self.on_clear is not None:
+            self.on_clear()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def unplayed_bytes(self):
+        return self.buffer.unplayed_bytes()
+
+    # 緩衝深度、預先緩衝與 underrun 統計（underrun 只計播放途中斷音，不含回應自然結束）
+    def stats(self):
+        stats = self.buffer.stats()
+        with self._lock:
+            stats.update({
+                'depth_ms': round(stats['fill'] * 1000 / self.bytes_per_second, 1),
+                'target_ms': round(self.target_ms(), 1),
+                'jitter_ms': round(self._jitter * 1000, 1),
+                'playing': self._playing,
+                'starts': self._starts,
+                'avg_start_delay_ms': round(self._start_delay_total * 1000 / self._starts, 1) if self._starts else 0.0,
+                'max_start_delay_ms': round(self._start_delay_max * 1000, 1),
+                'underruns': self._underruns,
+                'underrun_bytes': self._underrun_bytes,
+                'underrun_ms': round(self._underrun_bytes * 1000 / self.bytes_per_second, 1),
+            })
+        return stats
@@ -0,0 +1,110 @@
+import numpy as np
+
+# -----------------------------------------------------
+# Realtime API 的音訊格式與 G.711 編解碼
+# -----------------------------------------------------
+# Realtime API 支援 pcm16（24kHz、每個樣本 2 位元組）與 g711_ulaw / g711_alaw（8kHz、每個樣本 1 位元組），
+# G.711 的傳輸量約為 pcm16 的 1/6（取樣率 1/3、樣本大小 1/2），適合電話來源或頻寬有限的連線。
+# 編解碼以查表完成：
+# - 解碼：256 項的表，uint8 → int16
+# - 編碼：65536 項的表，以 int16 樣本的 uint16 表示直接查表 → uint8
+# 兩張表在載入模組時以 NumPy 向量運算一次建好（ITU-T G.711 的參考演算法），之後每個音訊塊只需要一次查表。
+
+# µ-law：14 位元線性輸入，偏移 0x21，上限 8159；解碼端以 16 位元表示，偏移 0x84
+_ULAW_BIAS = 0x21
+_ULAW_CLIP = 8159
+_ULAW_SEGMENT_ENDS = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+_ULAW_DECODE_BIAS = 0x84
+# A-law：13 位元線性輸入，各區段的上限
+_ALAW_SEGMENT_ENDS = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+# 所有 int16 樣本，依 uint16 表示排列（索引 i 對應 np.uint16(i).view(np.int16)）
+_ALL_SAMPLES = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)
+
+
+def _ulaw_encode_table():
+    samples = _ALL_SAMPLES >> 2
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), _ULAW_CLIP) + _ULAW_BIAS
+    segment = np.searchsorted(_ULAW_SEGMENT_ENDS, magnitude)   # 第一個 >= magnitude 的區段
+    code = (np.minimum(segment, 7) << 4) | ((magnitude >> (np.minimum(segment, 7) + 1)) & 0x0F)
+    code = np.where(segment >= 8, 0x7F, code)
+    return ((code ^ mask) & 0xFF).astype(np.uint8)
+
+
+def _ulaw_decode_table():
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + _ULAW_DECODE_BIAS) << exponent) - _ULAW_DECODE_BIAS
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _alaw_encode_table():
+    samples = _ALL_SAMPLES >> 3
+    mask = np.where(samples >= 0, 0xD5, 0x55)
+    magnitude = np.where(samples >= 0, samples, -samples - 1)
+    segment = np.searchsorted(_ALAW_SEGMENT_ENDS, magnitude)   # 第一個 >= magnitude 的區段，超出範圍為 8
+    shift = np.where(segment < 2, 1, segment)
+    code = (np.minimum(segment, 7) << 4) | ((magnitude >> shift) & 0x0F)
+    code = np.where(segment >= 8, 0x7F, code)
+    return ((code ^ mask) & 0xFF).astype(np.uint8)
+
+
+def _alaw_decode_table():
+    codes = np.arange(256, dtype=np.int32) ^ 0x55
+    segment = (codes & 0x70) >> 4
+    value = (codes & 0x0F) << 4
+    value = np.where(segment == 0, value + 8, value + 0x108)
+    value = np.where(segment > 1, value << np.maximum(segment - 1, 0), value)
+    return np.where(codes & 0x80, value, -value).astype(np.int16)
+
+
+ULAW_ENCODE = _ulaw_encode_table()
+ULAW_DECODE = _ulaw_decode_table()
+ALAW_ENCODE = _alaw_encode_table()
+ALAW_DECODE = _alaw_decode_table()
+
+
+# pcm16（little-endian）→ G.711
+def _encoder(table):
+    def encode(pcm):
+        return table[np.frombuffer(pcm, dtype='<u2')].tobytes()
+    return encode
+
+
+# G.711 → pcm16（little-endian）
+def _decoder(table):
+    table = table.astype('<i2')
+
+    def decode(data):
+        return table[np.frombuffer(data, dtype=np.uint8)].tobytes()
+    return decode
+
+
+ulaw_encode = _encoder(ULAW_ENCODE)
+ulaw_decode = _decoder(ULAW_DECODE)
+alaw_encode = _encoder(ALAW_ENCODE)
+alaw_decode = _decoder(ALAW_DECODE)
+
+
+# 一種傳輸格式：取樣率、每個樣本的位元組數，以及與 pcm16 之間的轉換（pcm16 本身為 None，不需轉換）
+class AudioFormat:
+    def __init__(self, name, rate, sample_width, encode=None, decode=None):
+        self.name = name
+        self.rate = rate
+        self.sample_width = sample_width
+        self.encode = encode
+        self.decode = decode
+
+    # 每秒的傳輸位元組數
+    @property
+    def bytes_per_second(self):
+        return self.rate * self.sample_width
+
+
+AUDIO_FORMATS = {
+    'pcm16': AudioFormat('pcm16', 24000, 2),
+    'g711_ulaw': AudioFormat('g711_ulaw', 8000, 1, ulaw_encode, ulaw_decode),
+    'g711_alaw': AudioFormat('g711_alaw', 8000, 1, alaw_encode, alaw_decode),
+}
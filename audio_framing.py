@@ -0,0 +1,61 @@
+import binascii
+import json
+
+# -----------------------------------------------------
+# 音訊訊息的快速編碼 / 解析
+# -----------------------------------------------------
+# 音訊訊息佔了 WebSocket 流量的絕大部分，每則都完整經過 dict + json.dumps / json.loads 的成本很高：
+# - 上傳：input_audio_buffer.append 的 JSON 除了 base64 以外都是固定的，直接以預先產生的前後綴字串拼接
+#   （base64 字元不需要 JSON 跳脫）
+# - 接收：response.audio.delta 只找出 "delta" 字串的位置，把其餘幾百個字元交給 json.loads 取得
+#   response_id / item_id 等欄位，數十 KB 的 base64 不會被複製成 Python dict 的值；
+#   不是音訊事件或格式不符合預期時回傳 None，由呼叫端走一般的 json.loads
+# - base64 以 binascii 解碼成新的 bytes（Python 沒有解碼到既有緩衝的 API），播放緩衝再以 memoryview
+#   複製一次到預先配置的空間；快速路徑省下的是 JSON 解析，不是這一次複製
+#
+# python framing_benchmark.py 比較與原本寫法的速度。
+
+APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+APPEND_SUFFIX = '"}'
+
+AUDIO_DELTA_TYPE = '"response.audio.delta"'
+_DELTA_KEY = '"delta"'
+
+
+# pcm16 → input_audio_buffer.append 訊息（JSON 字串）
+def encode_append(pcm):
+    return APPEND_PREFIX + binascii.b2a_base64(pcm, newline=False).decode('ascii') + APPEND_SUFFIX
+
+
+# response.audio.delta → (不含 delta 的事件 dict, base64 字串)；其他訊息回傳 None
+def parse_audio_delta(message):
+    if not isinstance(message, str):
+        return None
+    start = message.find(_DELTA_KEY)
+    if start < 0:
+        return None
+    # 跳過 "delta" 與字串值之間的冒號與空白
+    start += len(_DELTA_KEY)
+    while start < len(message) and message[start] in ': \t':
+        start += 1
+    if message[start:start + 1] != '"':
+        return None
+    start += 1
+    end = message.find('"', start)
+    if end < 0:
+        return None
+    # 事件類型只在 delta 以外的部分尋找（其他 *.delta 事件也有 delta 欄位）
+    if message.find(AUDIO_DELTA_TYPE, 0, start) < 0 and message.find(AUDIO_DELTA_TYPE, end) < 0:
+        return None
+    try:
+        event = json.loads(message[:start] + message[end:])
+    except ValueError:
+        return None
+    if event.get('type') != 'response.audio.delta':
+        return None
+    return event, message[start:end]
+
+
+# base64 → 新的 pcm16 bytes；非 base64 字元會被略過（例如 JSON 把 / 跳脫成 \/ 時多出的反斜線）
+def decode_audio(b64):
+    return binascii.a2b_base64(b64)
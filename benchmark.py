@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+import websockets
+
+from app_logging import setup_logging, shutdown_logging
+from audio_buffers import JitterBuffer
+from metrics import METRICS
+from mock_realtime_server import MockRealtimeServer
+from realtime_session import PLAYBACK_BUFFER_SECONDS, RATE, RealtimeSession
+from tool_executor import ToolExecutor
+from tool_registry import ToolRegistry
+
+# -----------------------------------------------------
+# 端對端延遲量測
+# -----------------------------------------------------
+# 在同一個事件迴圈中啟動 MockRealtimeServer，讓多個 RealtimeSession 連線進行固定腳本的對話：
+# - 麥克風：每 20ms 送出一段靜音
+# - 喇叭：每 20ms 從播放緩衝讀出一段（與 CLI 相同的 JitterBuffer 與 read_padded）
+# - 函式呼叫：使用只在量測時註冊的 bench_lookup，以 sleep 模擬資料庫查詢，不需要 MySQL
+# 量測結果：
+# - speech_to_first_audio_ms：收到 speech_started 到第一段 AI 音訊實際從喇叭播出
+#   （包含腳本中的 speech_ms、response_delay_ms 與抖動緩衝的預先緩衝時間）
+# - tool_rtt_ms：伺服器送出函式呼叫到收到 response.create
+# - underruns：每個對話在回應播放途中斷音的次數（每段回應自然結束的那一次不算）
+# - jitter_target_ms：對話結束時抖動緩衝調整出的預先緩衝深度
+# - cancel_rtt_ms（--barge-in-ms）：模擬插話到伺服器收到 response.cancel
+# - recover_ms（--drop-after-turns）：連線異常中斷到重新連線並重送完 session 配置與對話摘要
+#
+# 用法：
+#     python benchmark.py --sessions 20 --turns 10
+#     python benchmark.py --jitter-ms 80 --json result.json --max-first-audio-p95 500
+
+FRAME_MS = 20
+FRAME_BYTES = RATE * 2 * FRAME_MS // 1000
+
+BENCH_SESSION_UPDATE = json.dumps({"type": "session.update", "session": {"tools": []}})
+
+
+# 記錄每次 speech_started（clear）之後第一段音訊播出時間的播放緩衝
+class RecordingPlayback:
+    def __init__(self, capacity):
+        self.buffer = JitterBuffer(capacity, RATE)
+        self.first_audio_latencies = []
+        self._speech_started_at = None
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def end_of_stream(self):
+        self.buffer.end_of_stream()
+
+    def clear(self):
+        self._speech_started_at = time.perf_counter()
+        self.buffer.clear()
+
+    def read_padded(self, nbytes):
+        audio, count = self.buffer.read_padded(nbytes)
+        if count and self._speech_started_at is not None:
+            self.first_audio_latencies.append(time.perf_counter() - self._speech_started_at)
+            self._speech_started_at = None
+        return audio, count
+
+    def unplayed_bytes(self):
+        return self.buffer.unplayed_bytes()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def stats(self):
+        return self.buffer.stats()
+
+
+# 只給量測使用的函式註冊表
+def build_bench_tools(tool_ms):
+    tools = ToolRegistry()
+
+    @tools.tool("量測用的查詢")
+    def bench_lookup(patient_id: int):
+        time.sleep(tool_ms / 1000)
+        return f"📌 病人資料：\n姓名: 測試{patient_id}, 年齡: 30, 性別: 男"
+
+    return tools
+
+
+# 以固定週期執行 fn（依絕對時間排程，不會累積誤差）
+async def _every(period, fn):
+    next_at = time.perf_counter()
+    while True:
+        fn()
+        next_at += period
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+
+async def run_session(url, tools, executor):
+    playback = RecordingPlayback(RATE * 2 * PLAYBACK_BUFFER_SECONDS)
+    session = RealtimeSession(
+        url,
+        'benchmark',
+        playback=playback,
+        tools=tools,
+        tool_executor=executor,
+        session_update=BENCH_SESSION_UPDATE,
+        force_ipv4=False
+    )
+    silence = bytes(FRAME_BYTES)
+    async with session:
+        loops = [
+            asyncio.create_task(_every(FRAME_MS / 1000, lambda: session.send_audio(silence))),
+            asyncio.create_task(_every(FRAME_MS / 1000, lambda: playback.read_padded(FRAME_BYTES))),
+        ]
+        try:
+            await session.wait_closed()
+        finally:
+            for task in loops:
+                task.cancel()
+            await asyncio.gather(*loops, return_exceptions=True)
+
+    playback_stats = playback.stats()
+    return {
+        'first_audio': playback.first_audio_latencies,
+        'underruns': playback_stats['underruns'],
+        'jitter_target_ms': playback_stats['target_ms'],
+        'session': session.stats(),
+    }
+
+
+def summarize(values, scale=1.0):
+    if not values:
+        return {'count': 0}
+    values = np.asarray(values, dtype=np.float64) * scale
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'count': len(values),
+        'p50': round(float(p50), 2),
+        'p95': round(float(p95), 2),
+        'p99': round(float(p99), 2),
+        'max': round(float(values.max()), 2),
+    }
+
+
+async def run_benchmark(args):
+    mock = MockRealtimeServer(
+        turns=args.turns,
+        tool_every=args.tool_every,
+        speech_ms=args.speech_ms,
+        response_delay_ms=args.response_delay_ms,
+        response_audio_ms=args.response_audio_ms,
+        delta_ms=args.delta_ms,
+        jitter_ms=args.jitter_ms,
+        barge_in_ms=args.barge_in_ms,
+        drop_after_turns=args.drop_after_turns,
+        seed=args.seed
+    )
+    tools = build_bench_tools(args.tool_ms)
+    executor = ToolExecutor(max_workers=args.tool_workers, max_pending=args.sessions * 2)
+
+    started = time.perf_counter()
+    async with websockets.serve(mock.handler, '127.0.0.1', 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        url = f'ws://127.0.0.1:{port}'
+        sessions = await asyncio.gather(
+            *(run_session(url, tools, executor) for _ in range(args.sessions))
+        )
+    executor.shutdown()
+
+    return {
+        'config': {key: value for key, value in vars(args).items() if not key.startswith('max_') and key != 'json'},
+        'elapsed_s': round(time.perf_counter() - started, 2),
+        'speech_to_first_audio_ms': summarize([v for s in sessions for v in s['first_audio']], 1000),
+        'tool_rtt_ms': summarize(mock.tool_rtts, 1000),
+        'underruns': summarize([s['underruns'] for s in sessions]),
+        'jitter_target_ms': summarize([s['jitter_target_ms'] for s in sessions]),
+        'cancel_rtt_ms': summarize(mock.cancel_rtts, 1000),
+        'recover_ms': summarize([s['session']['last_recover_ms'] for s in sessions if s['session']['reconnects']]),
+        'late_deltas_dropped': sum(s['session']['late_deltas_dropped'] for s in sessions),
+        'tool_executor': executor.stats(),
+        'mock_server': mock.stats(),
+        # 用戶端熱路徑的延遲直方圖（ws_event_ms、ws_send_ms、tool_exec_ms 等）
+        'metrics': METRICS.snapshot()['histograms'],
+    }
+
+
+def print_report(result):
+    rows = [
+        ('語音開始→第一段音訊 (ms)', result['speech_to_first_audio_ms']),
+        ('函式呼叫往返 (ms)', result['tool_rtt_ms']),
+        ('播放中斷 (次/對話)', result['underruns']),
+        ('預先緩衝深度 (ms)', result['jitter_target_ms']),
+        ('插話→取消回應 (ms)', result['cancel_rtt_ms']),
+        ('斷線→恢復對話 (ms)', result['recover_ms']),
+    ]
+    print(f"{'指標':<24}{'次數':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name, summary in rows:
+        if not summary['count']:
+            print(f"{name:<24}{0:>8}")
+            continue
+        print(f"{name:<24}{summary['count']:>8}{summary['p50']:>10}{summary['p95']:>10}"
+              f"{summary['p99']:>10}{summary['max']:>10}")
+    print(f"總耗時: {result['elapsed_s']} 秒，函式呼叫統計: {result['tool_executor']}")
+    if result['cancel_rtt_ms']['count']:
+        print(f"插話後丟棄的遲到音訊: {result['late_deltas_dropped']} 段")
+
+
+# 超過門檻的項目（給 CI 判斷是否退步）
+def check_thresholds(result, args):
+    checks = [
+        ('speech_to_first_audio_ms', args.max_first_audio_p95),
+        ('tool_rtt_ms', args.max_tool_rtt_p95),
+        ('underruns', args.max_underruns_p95),
+    ]
+    return [
+        f"{key} p95 = {result[key]['p95']} > {limit}"
+        for key, limit in checks
+        if limit is not None and result[key]['count'] and result[key]['p95'] > limit
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RealtimeSession 端對端延遲量測（使用本機模擬伺服器）')
+    parser.add_argument('--sessions', type=int, default=10, help='同時進行的對話數')
+    parser.add_argument('--turns', type=int, default=5, help='每個對話的輪數')
+    parser.add_argument('--tool-every', type=int, default=2, help='每幾輪發出一次函式呼叫（0 表示不發出）')
+    parser.add_argument('--tool-ms', type=float, default=5.0, help='模擬的資料庫查詢時間')
+    parser.add_argument('--tool-workers', type=int, default=4)
+    parser.add_argument('--speech-ms', type=int, default=300)
+    parser.add_argument('--response-delay-ms', type=int, default=50)
+    parser.add_argument('--response-audio-ms', type=int, default=1000)
+    parser.add_argument('--delta-ms', type=int, default=40)
+    parser.add_argument('--jitter-ms', type=int, default=0, help='每段音訊送出時間的隨機延遲上限')
+    parser.add_argument('--barge-in-ms', type=int, help='每段回應播放幾毫秒後模擬使用者插話')
+    parser.add_argument('--drop-after-turns', type=int, help='每個對話在第幾輪之後斷線一次（測試重新連線）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='將結果寫入 JSON 檔案')
+    parser.add_argument('--max-first-audio-p95', type=float, help='語音開始→第一段音訊 p95 上限（ms）')
+    parser.add_argument('--max-tool-rtt-p95', type=float, help='函式呼叫往返 p95 上限（ms）')
+    parser.add_argument('--max-underruns-p95', type=float, help='每個對話播放中斷次數 p95 上限')
+    args = parser.parse_args()
+
+    # 量測時只顯示警告以上的日誌
+    setup_logging('WARNING')
+    try:
+        result = asyncio.run(run_benchmark(args))
+    finally:
+        shutdown_logging()
+
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    failures = check_thresholds(result, args)
+    for failure in failures:
+        print(f"❌ 超過門檻: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
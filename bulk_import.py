@@ -0,0 +1,283 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+
+from mysql.connector import errors
+
+from medical_tools import DB_POOL, TOOLS, backfill_sensor_readings
+
+# -----------------------------------------------------
+# 病人 / 健康紀錄批次匯入（CSV 或 JSONL）
+# -----------------------------------------------------
+# - 逐列讀取檔案，不會把整個檔案載入記憶體
+# - 每一列用 add_patient / add_patient_record 的參數規則檢查與轉型（與 AI 的函式呼叫相同）
+# - 每 batch_size 列以 executemany 在同一個交易中寫入；某一列寫入失敗時改為逐列寫入，
+#   只略過有問題的列，錯誤寫到錯誤報告（JSONL），不會中斷整批
+# - 每提交一批就更新 checkpoint 檔，中斷後再執行同樣的指令會從上次提交的位置繼續；
+#   checkpoint 記錄檔案大小與開頭內容的雜湊，檔案換過或被修改時拒絕繼續（需以 --restart 重新匯入），
+#   也記錄錯誤報告寫到的位置，繼續時先截掉還沒提交的那一批寫下的錯誤，重新處理時不會重複
+#
+# 用法：
+#     python bulk_import.py patients clinic_patients.csv
+#     python bulk_import.py records clinic_records.jsonl --batch-size 2000
+#
+# patients 檔案的欄位：name, age, gender，可另外提供 id 保留原本的病人ID；
+# records 檔案的欄位：patient_id, height, weight, diet, exercise, inconvenience, sensor_data
+# （CSV 中的 sensor_data 為 JSON 字串，例如 {"grip": 30.5}）。
+
+IMPORT_BATCH_SIZE = 1000       # 每個交易寫入幾列
+PROGRESS_INTERVAL = 5.0        # 每隔幾秒印出一次進度
+IDENTITY_HEAD_BYTES = 64 * 1024   # 計算檔案雜湊時讀取開頭幾個位元組
+
+# 由檢查過的參數產生 (INSERT 語句, 參數)
+def _patient_insert(kwargs, row):
+    if row.get('id') is not None:
+        try:
+            patient_id = int(row['id'])
+        except (TypeError, ValueError):
+            raise ValueError(f"id: 需要整數，收到 {row['id']!r}") from None
+        return ("INSERT INTO patients (id, name, age, gender) VALUES (%s, %s, %s, %s)",
+                (patient_id, kwargs['name'], kwargs['age'], kwargs['gender']))
+    return ("INSERT INTO patients (name, age, gender) VALUES (%s, %s, %s)",
+            (kwargs['name'], kwargs['age'], kwargs['gender']))
+
+
+def _record_insert(kwargs, row):
+    return ("""INSERT INTO patient_records
+             (patient_id, height, weight, diet, exercise, inconvenience, sensor_data)
+             VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+            (kwargs['patient_id'], kwargs['height'], kwargs['weight'], kwargs['diet'], kwargs['exercise'],
+             kwargs['inconvenience'], json.dumps(kwargs['sensor_data'] or {}, ensure_ascii=False)))
+
+
+# 匯入種類 -> (檢查用的工具, 產生 INSERT 語句與參數的函式, 提交前要執行的函式(cursor, 本批第一個新增的ID))
+IMPORT_KINDS = {
+    'patients': ('add_patient', _patient_insert, None),
+    # 健康紀錄的數值另外寫入 sensor_readings
+    'records': ('add_patient_record', _record_insert, backfill_sensor_readings),
+}
+
+# 單一列資料有問題時的錯誤（其他資料庫錯誤會中斷匯入，之後可從 checkpoint 繼續）
+ROW_ERRORS = (errors.IntegrityError, errors.DataError)
+
+
+# 逐列讀取檔案，產生 (列號, 資料 dict 或 None, 錯誤訊息或 None)；列號從 1 開始，不含 CSV 標題列
+def read_rows(path, fmt):
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for number, row in enumerate(csv.DictReader(f), 1):
+                row = {key: value for key, value in row.items() if value not in ('', None)}
+                if isinstance(row.get('sensor_data'), str):
+                    try:
+                        row['sensor_data'] = json.loads(row['sensor_data'])
+                    except ValueError as e:
+                        yield number, None, f"sensor_data 不是有效的 JSON: {e}"
+                        continue
+                yield number, row, None
+    else:
+        with open(path, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield number, json.loads(line), None
+                except ValueError as e:
+                    yield number, None, f"不是有效的 JSON: {e}"
+
+
+# 匯入檔案的識別資訊（大小與開頭內容的 SHA-256），用來確認 checkpoint 屬於同一個檔案
+def file_identity(path):
+    with open(path, 'rb') as f:
+        head = f.read(IDENTITY_HEAD_BYTES)
+    return {'size': os.path.getsize(path), 'head_sha256': hashlib.sha256(head).hexdigest()}
+
+
+class BulkImporter:
+    def __init__(self, kind, path, fmt=None, batch_size=IMPORT_BATCH_SIZE, checkpoint_path=None,
+                 error_path=None, resume=True):
+        tool_name, self._to_insert, self._before_commit = IMPORT_KINDS[kind]
+        self.tool = TOOLS[tool_name]
+        self.kind = kind
+        self.path = path
+        self.fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path or f"{path}.checkpoint"
+        self.error_path = error_path or f"{path}.errors.jsonl"
+        self.resume = resume
+
+        self._stats = {
+            'rows_read': 0,
+            'rows_skipped': 0,      # checkpoint 之前已匯入的列
+            'rows_imported': 0,
+            'rows_failed': 0,
+            'batches': 0,
+            'batch_fallbacks': 0,   # executemany 失敗改為逐列寫入的批次
+        }
+        self._elapsed = 0.0
+        self._identity = None
+
+    # 讀取 checkpoint，回傳 (已提交的最後一列, 錯誤報告的位元組數)；
+    # 種類或檔案與 checkpoint 不符時丟出 ValueError，不會從錯誤的列號繼續
+    def _load_checkpoint(self, identity):
+        if not self.resume or not os.path.exists(self.checkpoint_path):
+            return 0, 0
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('kind') != self.kind or checkpoint.get('file') != identity:
+            raise ValueError(f"❌ checkpoint {self.checkpoint_path} 與匯入檔案 {self.path} 不符"
+                             f"（檔案已更換或修改），請確認檔案或以 --restart 重新匯入")
+        return checkpoint['last_row'], checkpoint.get('errors_offset', 0)
+
+    # 先寫到暫存檔再改名，中斷時不會留下寫了一半的 checkpoint
+    def _save_checkpoint(self, last_row, errors_offset=0):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'kind': self.kind, 'file': self._identity, 'last_row': last_row,
+                       'errors_offset': errors_offset, **self._stats}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _report_error(self, error_file, number, message):
+        self._stats['rows_failed'] += 1
+        error_file.write(json.dumps({'row': number, 'error': message}, ensure_ascii=False) + "\n")
+
+    # 寫入一批 [(列號, SQL, 參數)]：先以 executemany 一次寫入，失敗時逐列寫入並略過有問題的列
+    def _write_batch(self, connection, batch, error_file):
+        self._stats['batches'] += 1
+        cursor = connection.cursor()
+        try:
+            try:
+                by_query = {}
+                for _, query, values in batch:
+                    by_query.setdefault(query, []).append(values)
+                first_ids = []
+                for query, rows in by_query.items():
+                    cursor.executemany(query, rows)
+                    first_ids.append(cursor.lastrowid)
+                self._finish_write(cursor, first_ids)
+                connection.commit()
+                self._stats['rows_imported'] += len(batch)
+                return
+            except ROW_ERRORS:
+                connection.rollback()
+                self._stats['batch_fallbacks'] += 1
+
+            # InnoDB 只回滾失敗的那一個語句，其他列仍在同一個交易中
+            first_ids = []
+            for number, query, values in batch:
+                try:
+                    cursor.execute(query, values)
+                    first_ids.append(cursor.lastrowid)
+                    self._stats['rows_imported'] += 1
+                except ROW_ERRORS as err:
+                    self._report_error(error_file, number, str(err))
+            self._finish_write(cursor, first_ids)
+            connection.commit()
+        finally:
+            cursor.close()
+
+    def _finish_write(self, cursor, first_ids):
+        first_ids = [row_id for row_id in first_ids if row_id]
+        if self._before_commit is not None and first_ids:
+            self._before_commit(cursor, min(first_ids))
+
+    def run(self):
+        start = time.monotonic()
+        last_report = start
+        self._identity = file_identity(self.path)
+        resume_after, errors_offset = self._load_checkpoint(self._identity)
+        if resume_after:
+            print(f"從第 {resume_after + 1} 列繼續匯入")
+
+        with DB_POOL.connection() as connection, \
+                open(self.error_path, 'a' if resume_after else 'w', encoding='utf-8') as error_file:
+            # 中斷時還沒提交的那一批會重新處理，它已寫下的錯誤先截掉
+            if error_file.tell() > errors_offset:
+                error_file.truncate(errors_offset)
+            batch = []
+            last_row = resume_after
+            for number, row, error in read_rows(self.path, self.fmt):
+                self._stats['rows_read'] += 1
+                if number <= resume_after:
+                    self._stats['rows_skipped'] += 1
+                    continue
+                last_row = number
+                if error is None:
+                    try:
+                        kwargs = self.tool.bind(row)
+                        batch.append((number, *self._to_insert(kwargs, row)))
+                    except ValueError as e:
+                        # 包含 ToolArgumentError
+                        error = str(e)
+                if error is not None:
+                    self._report_error(error_file, number, error)
+
+                if len(batch) >= self.batch_size:
+                    self._write_batch(connection, batch, error_file)
+                    self._checkpoint(error_file, last_row)
+                    batch = []
+                    now = time.monotonic()
+                    if now - last_report >= PROGRESS_INTERVAL:
+                        last_report = now
+                        self._elapsed = now - start
+                        print(f"進度: {self.stats()}")
+
+            if batch:
+                self._write_batch(connection, batch, error_file)
+            self._checkpoint(error_file, last_row)
+
+        self._elapsed = time.monotonic() - start
+        return self.stats()
+
+    # 一批提交後，記錄已處理到哪一列與錯誤報告寫到的位置
+    def _checkpoint(self, error_file, last_row):
+        error_file.flush()
+        self._save_checkpoint(last_row, error_file.tell())
+
+    def stats(self):
+        processed = self._stats['rows_imported'] + self._stats['rows_failed']
+        return {
+            **self._stats,
+            'elapsed_s': round(self._elapsed, 1),
+            'rows_per_s': round(processed / self._elapsed) if self._elapsed else 0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批次匯入病人資料或健康紀錄')
+    parser.add_argument('kind', choices=sorted(IMPORT_KINDS))
+    parser.add_argument('path', help='CSV 或 JSONL 檔案')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='檔案格式（預設依副檔名判斷）')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument('--checkpoint', help='checkpoint 檔案（預設為 <檔案>.checkpoint）')
+    parser.add_argument('--errors', help='錯誤報告檔案（預設為 <檔案>.errors.jsonl）')
+    parser.add_argument('--restart', action='store_true', help='忽略 checkpoint，從頭開始匯入')
+    args = parser.parse_args()
+
+    importer = BulkImporter(
+        args.kind,
+        args.path,
+        fmt=args.format,
+        batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint,
+        error_path=args.errors,
+        resume=not args.restart
+    )
+    try:
+        print(f"匯入完成: {importer.run()}")
+        if importer.stats()['rows_failed']:
+            print(f"有問題的列已寫入 {importer.error_path}")
+    except ValueError as e:
+        print(e)
+        raise SystemExit(1)
+    except KeyboardInterrupt:
+        print(f"已中斷，再次執行即可從上次提交的位置繼續: {importer.stats()}")
+    finally:
+        DB_POOL.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errors
+
+from metrics import METRICS
+
+# -----------------------------------------------------
+# MySQL 連線池
+# -----------------------------------------------------
+
+# 無法從連線池取得連線（建立連線失敗、等待逾時或連線池已關閉）
+class PoolUnavailableError(errors.PoolError):
+    pass
+
+
+# 有上限的連線池：
+# - 最多同時建立 max_size 條連線，全部借出時最多等待 checkout_timeout 秒
+# - 閒置超過 health_check_interval 秒的連線，借出前先 ping 確認仍可用
+# - 閒置超過 max_idle_seconds 秒的連線直接關閉，避免被 MySQL 的 wait_timeout 斷線
+# - 歸還時一律回滾未結束的交易並清掉未讀結果，讓下一個借用者拿到乾淨的連線
+class ConnectionPool:
+    def __init__(self, db_config, max_size=8, checkout_timeout=5.0,
+                 max_idle_seconds=300.0, health_check_interval=30.0):
+        self.db_config = dict(db_config)
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []    # [(connection, 最後使用時間)]，由舊到新；從尾端借出讓常用連線保持溫熱
+        self._size = 0     # 目前已建立的連線數（閒置 + 借出中）
+        self._closed = False
+
+        self._created = 0
+        self._discarded = 0
+        self._evicted = 0
+        self._health_check_failures = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_histogram = METRICS.histogram('db_pool_wait_ms')
+
+    # 建立實體連線；失敗時釋放剛才預留的名額
+    def _open(self):
+        try:
+            connection = mysql.connector.connect(**self.db_config)
+        except errors.Error as err:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise PoolUnavailableError(f"無法連接到資料庫: {err}") from err
+        with self._cond:
+            self._created += 1
+        return connection
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    # 取出閒置過久的連線（需持有鎖），回傳待關閉的清單
+    def _evict_idle_locked(self, now):
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.max_idle_seconds:
+            expired.append(self._idle.pop(0)[0])
+        self._size -= len(expired)
+        self._evicted += len(expired)
+        return expired
+
+    # 借出一條連線，必要時等待其他借用者歸還
+    def acquire(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        with self._cond:
+            expired = self._evict_idle_locked(start)
+            while True:
+                if self._closed:
+                    raise PoolUnavailableError("資料庫連線池已關閉")
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    connection, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolUnavailableError(f"等待資料庫連線逾時（{timeout} 秒）")
+                if not waited:
+                    self._waits += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+        # 關閉、建立連線與健康檢查都在鎖外進行，避免卡住其他執行緒
+        for stale in expired:
+            self._close_quietly(stale)
+
+        if connection is None:
+            connection = self._open()
+        elif start - last_used > self.health_check_interval and not self._is_healthy(connection):
+            with self._cond:
+                self._health_check_failures += 1
+            self._close_quietly(connection)
+            connection = self._open()
+
+        wait = time.monotonic() - start
+        self._wait_histogram.observe(wait * 1000)
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+        return connection
+
+    @staticmethod
+    def _is_healthy(connection):
+        try:
+            return connection.is_connected()
+        except Exception:
+            return False
+
+    # 歸還連線；discard=True 或無法清理時直接關閉，讓出名額
+    def release(self, connection, discard=False):
+        if not discard:
+            try:
+                if connection.unread_result:
+                    connection.consume_results()
+                if connection.in_transaction:
+                    connection.rollback()
+            except errors.Error:
+                discard = True
+
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+                self._discarded += 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+        if discard or self._closed:
+            self._close_quietly(connection)
+
+    # 以 with 區塊借用連線，離開時一定歸還（發生例外時未提交的交易會被回滾）
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        discard = False
+        try:
+            yield connection
+        except (errors.InterfaceError, errors.OperationalError):
+            # 連線層級的錯誤，這條連線很可能已經不能用了
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    # 關閉所有閒置連線；借出中的連線會在歸還時關閉
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    # 連線池大小與等待時間統計
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                'created': self._created,
+                'discarded': self._discarded,
+                'evicted': self._evicted,
+                'health_check_failures': self._health_check_failures,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'avg_wait_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000, 3),
+            }
@@ -0,0 +1,95 @@
+import argparse
+import base64
+import json
+import os
+import timeit
+
+from audio_buffers import AudioRingBuffer
+from audio_framing import decode_audio, encode_append, parse_audio_delta
+
+# -----------------------------------------------------
+# 音訊訊息編碼 / 解析的微基準測試
+# -----------------------------------------------------
+# 比較原本的寫法（dict + json.dumps / 完整 json.loads + b64decode + 複製到 bytearray）
+# 與 audio_framing 的快速路徑，每則訊息的平均時間（微秒）。
+#
+# 用法：
+#     python framing_benchmark.py
+#     python framing_benchmark.py --uplink-ms 60 --delta-ms 200 --number 20000
+
+RATE = 24000
+
+
+def old_encode(pcm):
+    encoded_chunk = base64.b64encode(pcm).decode('utf-8')
+    return json.dumps({'type': 'input_audio_buffer.append', 'audio': encoded_chunk})
+
+
+def old_receive(message, playback):
+    event = json.loads(message)
+    if event['type'] == 'response.audio.delta':
+        audio_content = bytearray(base64.b64decode(event['delta']))
+        playback.write(audio_content)
+
+
+def new_receive(message, playback):
+    event, delta = parse_audio_delta(message)
+    playback.write(decode_audio(delta))
+
+
+def _audio_delta_message(pcm):
+    return json.dumps({
+        'type': 'response.audio.delta',
+        'event_id': 'event_00000000000000000001',
+        'response_id': 'resp_00000000000000000001',
+        'item_id': 'item_00000000000000000001',
+        'output_index': 0,
+        'content_index': 0,
+        'delta': base64.b64encode(pcm).decode('ascii'),
+    }, separators=(',', ':'))
+
+
+def _measure(fn, number, repeat):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='音訊訊息編碼 / 解析的微基準測試')
+    parser.add_argument('--uplink-ms', type=int, default=60, help='每則上傳訊息的音訊長度')
+    parser.add_argument('--delta-ms', type=int, default=100, help='每則 response.audio.delta 的音訊長度')
+    parser.add_argument('--number', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    uplink_pcm = os.urandom(RATE * 2 * args.uplink_ms // 1000)
+    delta_pcm = os.urandom(RATE * 2 * args.delta_ms // 1000)
+    message = _audio_delta_message(delta_pcm)
+
+    # 兩種寫法的結果必須相同
+    assert json.loads(encode_append(uplink_pcm)) == json.loads(old_encode(uplink_pcm))
+    assert decode_audio(parse_audio_delta(message)[1]) == delta_pcm
+
+    # 每次寫入後清空，量測時緩衝不會滿
+    playback = AudioRingBuffer(len(delta_pcm) * 2)
+
+    def receive(fn):
+        def run():
+            fn(message, playback)
+            playback.clear()
+        return run
+
+    rows = [
+        (f'上傳 input_audio_buffer.append（{args.uplink_ms}ms）',
+         _measure(lambda: old_encode(uplink_pcm), args.number, args.repeat),
+         _measure(lambda: encode_append(uplink_pcm), args.number, args.repeat)),
+        (f'接收 response.audio.delta（{args.delta_ms}ms）',
+         _measure(receive(old_receive), args.number, args.repeat),
+         _measure(receive(new_receive), args.number, args.repeat)),
+    ]
+    print(f"{'訊息':<40}{'原本 (µs)':>12}{'快速路徑 (µs)':>16}{'加速':>8}")
+    for name, old, new in rows:
+        print(f"{name:<40}{old:>12.2f}{new:>16.2f}{old / new:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
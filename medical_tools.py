@@ -0,0 +1,813 @@
+import base64
+import functools
+import json
+from contextlib import contextmanager
+from typing import Annotated, Literal, Optional, TypedDict, get_type_hints
+
+import mysql.connector
+
+import sensor_analytics
+from db_pool import ConnectionPool
+from sensor_analytics import CohortSnapshot
+from tool_cache import ToolCache
+from tool_registry import ToolContext, ToolRegistry
+
+# 醫療系統的資料庫函式與提供給 AI 的函式（工具）定義。
+# 這裡不依賴音訊裝置或 API Key，可以被命令列程式、asyncio 用戶端與其他服務共用。
+
+# 資料庫連線設定
+DB_CONFIG = {
+    'host': '',
+    'port': '',
+    'user': '',
+    'password': '',
+    'database': ''  # 改為醫療系統資料庫
+}
+
+# 資料庫連線池設定
+DB_POOL_SIZE = 8               # 連線池最多同時建立幾條連線
+DB_POOL_TIMEOUT = 5            # 連線全部借出時，最多等待幾秒
+DB_POOL_MAX_IDLE = 300         # 閒置超過幾秒的連線會被關閉
+DB_POOL_PING_INTERVAL = 30     # 閒置超過幾秒的連線，借出前先 ping 確認仍可用
+
+# 所有資料庫函式共用的連線池（連線在第一次使用時才建立）
+DB_POOL = ConnectionPool(
+    DB_CONFIG,
+    max_size=DB_POOL_SIZE,
+    checkout_timeout=DB_POOL_TIMEOUT,
+    max_idle_seconds=DB_POOL_MAX_IDLE,
+    health_check_interval=DB_POOL_PING_INTERVAL
+)
+
+# 病人資料查詢結果的快取設定
+TOOL_CACHE_SIZE = 1024         # 最多快取幾筆查詢結果
+TOOL_CACHE_TTL = 60            # 快取結果的有效秒數
+
+# 提供給 AI 的所有函式都註冊在這裡，session 配置的 tools 與函式呼叫的分派都由它產生；
+# 同一次問診中重複查詢同一位病人時直接使用快取，寫入該病人的資料時清掉快取
+TOOLS = ToolRegistry(cache=ToolCache(TOOL_CACHE_SIZE, TOOL_CACHE_TTL))
+
+# 使用者身份：對話一開始是 GUEST，只能確認身份；確認後才換成該身份的工具與指示
+GUEST = 'guest'
+PATIENT = 'patient'
+DOCTOR = 'doctor'
+
+# 常用的參數型別（描述會出現在 JSON schema 中）
+PatientId = Annotated[int, "病人ID"]
+SessionId = Annotated[int, "對話ID"]
+Height = Annotated[float, "身高(公分)"]
+Weight = Annotated[float, "體重(公斤)"]
+Diet = Annotated[str, "飲食狀況"]
+Exercise = Annotated[str, "運動狀況"]
+Inconvenience = Annotated[str, "身體不適狀況"]
+
+# 分頁查詢：每頁筆數有上限，回應大小不會隨資料表成長
+PAGE_SIZE = 20                 # 預設每頁筆數
+MAX_PAGE_SIZE = 50             # 每頁筆數上限
+PageSize = Annotated[int, f"每頁筆數（預設 {PAGE_SIZE}，最多 {MAX_PAGE_SIZE}）"]
+PageToken = Annotated[str, "上一頁回傳的 page_token，查詢第一頁時不用提供"]
+MAX_MESSAGE_CHARS = 300        # 查看對話內容時，單則訊息最多顯示幾個字
+
+
+# 感測器數據
+class SensorData(TypedDict, total=False):
+    grip: float
+    sit_up: float
+
+# 寫入 sensor_readings 的指標：每筆健康紀錄的身高、體重與各項感測器數據各存成一列
+SENSOR_METRICS = tuple(get_type_hints(SensorData))
+METRICS = ('height', 'weight') + SENSOR_METRICS
+METRIC_LABELS = {'height': '身高', 'weight': '體重', 'grip': '握力', 'sit_up': '仰臥起坐', 'bmi': 'BMI'}
+Metric = Annotated[Literal[METRICS], "健康指標"]
+CohortMetric = Annotated[Literal[METRICS + ('bmi',)], "健康指標"]
+
+MAX_TREND_POINTS = 1000        # 趨勢分析最多使用最近幾筆量測值
+COHORT_REFRESH_SECONDS = 300   # 族群統計快照每隔幾秒重新載入
+
+# -----------------------------------------------------
+# 分頁（keyset pagination）
+# -----------------------------------------------------
+# 以上一頁最後一筆的排序鍵作為下一頁的起點（WHERE 排序鍵 > 上一頁最後一筆），
+# 不使用 OFFSET，任何一頁的成本都只跟每頁筆數有關（需要 schema_indexes.sql 中的索引）。
+
+def _page_limit(page_size):
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+# 排序鍵 → 不透明的分頁 token
+def _encode_page_token(*values):
+    raw = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+# 分頁 token → 排序鍵；格式不符時丟出 ValueError
+def _decode_page_token(token, count):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError(token) from None
+    # 排序鍵只會是數字或字串，被篡改的 token 不能把陣列或物件帶進 SQL 參數
+    if (not isinstance(values, list) or len(values) != count
+            or not all(isinstance(v, (int, float, str)) for v in values)):
+        raise ValueError(token)
+    return values
+
+# 逐列讀取查詢結果（查詢時多取一筆，用來判斷是否還有下一頁），
+# 回傳 (本頁資料, 下一頁的 token 或 None)；key(row) 取出該列的排序鍵
+def _read_page(cursor, limit, key):
+    # 預設的 cursor 不緩衝，資料逐列從伺服器讀取；查詢有 LIMIT，最多 limit + 1 列
+    rows = list(cursor)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _encode_page_token(*key(rows[-1]))
+
+def _page_footer(next_token):
+    return f"（還有更多資料，查詢下一頁請帶入 page_token: {next_token}）"
+
+# LIKE 前綴查詢，跳脫使用者輸入中的萬用字元
+def _like_prefix(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+# -----------------------------------------------------
+# 身份確認
+# -----------------------------------------------------
+
+# 確認使用者身份，之後 RealtimeSession 會換上該身份的工具與指示
+@TOOLS.tool("確認使用者身份（醫生或病患）後呼叫", roles=(GUEST,))
+def set_user_role(
+    role: Annotated[Literal["patient", "doctor"], "使用者身份：patient 為病患，doctor 為醫生"],
+    context: ToolContext
+):
+    context.role = role
+    return f"✅ 已確認使用者身份：{'病患' if role == PATIENT else '醫生'}"
+
+# -----------------------------------------------------
+# 資料庫操作函式
+# -----------------------------------------------------
+
+# 從連線池借出連線並建立 cursor，結束時自動關閉 cursor 並歸還連線
+# （發生例外時未提交的交易會被回滾；無法取得連線時丟出 PoolUnavailableError）
+@contextmanager
+def db_cursor():
+    with DB_POOL.connection() as connection:
+        cursor = connection.cursor()
+        try:
+            yield connection, cursor
+        finally:
+            cursor.close()
+
+# -----------------------------------------------------
+# 健康指標（sensor_readings）
+# -----------------------------------------------------
+# patient_records.sensor_data 是 JSON 字串，無法在 SQL 中彙整；每筆紀錄的數值另外以
+# (patient_id, record_id, metric, value, measured_at) 寫入 sensor_readings（見 schema_sensor_readings.sql），
+# 趨勢與族群統計都從這裡讀取。
+
+INSERT_READING = "INSERT INTO sensor_readings (patient_id, record_id, metric, value) VALUES (%s, %s, %s, %s)"
+
+# 一筆紀錄要寫入的量測值 [(patient_id, record_id, metric, value)]
+def _readings(patient_id, record_id, height=None, weight=None, sensor_data=None):
+    values = {'height': height, 'weight': weight, **(sensor_data or {})}
+    return [
+        (patient_id, record_id, metric, values[metric])
+        for metric in METRICS if values.get(metric) is not None
+    ]
+
+# 由 patient_records 補寫還沒有量測值的紀錄（id >= min_record_id），用於批次匯入與舊資料轉換
+_BACKFILL_SOURCES = " UNION ALL ".join(
+    [f"SELECT id, patient_id, '{metric}' AS metric, {metric} AS value FROM patient_records WHERE id >= %s"
+     for metric in ('height', 'weight')] +
+    [f"SELECT id, patient_id, '{metric}', CAST(JSON_UNQUOTE(JSON_EXTRACT(sensor_data, '$.{metric}')) AS DECIMAL(12, 4))"
+     f" FROM patient_records WHERE id >= %s" for metric in SENSOR_METRICS]
+)
+BACKFILL_READINGS = f"""INSERT INTO sensor_readings (patient_id, record_id, metric, value)
+    SELECT src.patient_id, src.id, src.metric, src.value FROM ({_BACKFILL_SOURCES}) AS src
+    WHERE src.value IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM sensor_readings r WHERE r.record_id = src.id)"""
+
+def backfill_sensor_readings(cursor, min_record_id=0):
+    cursor.execute(BACKFILL_READINGS, (min_record_id,) * len(METRICS))
+    return cursor.rowcount
+
+# 族群快照的資料：每位病人各指標最新的一筆量測值與年齡、性別
+def _load_cohort():
+    with db_cursor() as (connection, cursor):
+        cursor.execute("""SELECT r.patient_id, r.metric, r.value, p.age, p.gender
+                        FROM sensor_readings r
+                        JOIN (SELECT patient_id, metric, MAX(id) AS id FROM sensor_readings
+                              GROUP BY patient_id, metric) latest ON latest.id = r.id
+                        JOIN patients p ON p.id = r.patient_id""")
+        return list(cursor)
+
+COHORTS = CohortSnapshot(_load_cohort, COHORT_REFRESH_SECONDS)
+
+# 開啟新的對話
+@TOOLS.tool("開啟新的對話", roles=(PATIENT,))
+def start_conversation(patient_id: PatientId, context: ToolContext):
+    try:
+        with db_cursor() as (connection, cursor):
+            cursor.execute("INSERT INTO conversation_sessions (patient_id) VALUES (%s)", (patient_id,))
+            connection.commit()
+            session_id = cursor.lastrowid
+        # 之後的逐字稿會記錄到這個對話
+        context.patient_id = patient_id
+        context.conversation_id = session_id
+        return f"✅ 已開啟新的對話，對話ID：{session_id}"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 新增病人資料
+@TOOLS.tool("新增病人基本資料", roles=(PATIENT,))
+def add_patient(
+    name: Annotated[str, "病人姓名"],
+    age: Annotated[int, "病人年齡"],
+    gender: Annotated[Literal["男", "女"], "病人性別"]
+):
+    try:
+        with db_cursor() as (connection, cursor):
+            query = "INSERT INTO patients (name, age, gender) VALUES (%s, %s, %s)"
+            values = (name, age, gender)
+            cursor.execute(query, values)
+            connection.commit()
+            patient_id = cursor.lastrowid
+        return f"✅ 病人 {name} 資料已成功新增！病人ID：{patient_id}"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 新增病人資訊紀錄
+@TOOLS.tool("新增病人健康紀錄", roles=(PATIENT,), invalidates="patient_id")
+def add_patient_record(
+    patient_id: PatientId,
+    height: Height,
+    weight: Weight,
+    diet: Diet = "",
+    exercise: Exercise = "",
+    inconvenience: Inconvenience = "",
+    sensor_data: Annotated[SensorData, "感測器數據"] = None
+):
+    try:
+        with db_cursor() as (connection, cursor):
+            query = """INSERT INTO patient_records 
+                     (patient_id, height, weight, diet, exercise, inconvenience, sensor_data) 
+                     VALUES (%s, %s, %s, %s, %s, %s, %s)"""
+            
+            sensor_data_json = json.dumps(sensor_data or {}, ensure_ascii=False)
+            values = (patient_id, height, weight, diet, exercise, inconvenience, sensor_data_json)
+            cursor.execute(query, values)
+            cursor.executemany(INSERT_READING, _readings(patient_id, cursor.lastrowid, height, weight, sensor_data))
+            connection.commit()
+        return f"✅ 病人 {patient_id} 的健康紀錄已成功新增！"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 更新病人資訊紀錄（只更新有提供的欄位）
+@TOOLS.tool("更新病人健康紀錄", roles=(PATIENT, DOCTOR), invalidates="patient_id")
+def update_patient_record(
+    patient_id: PatientId,
+    record_id: Annotated[int, "紀錄ID"],
+    height: Optional[Height] = None,
+    weight: Optional[Weight] = None,
+    diet: Optional[Diet] = None,
+    exercise: Optional[Exercise] = None,
+    inconvenience: Optional[Inconvenience] = None,
+    sensor_data: Optional[Annotated[SensorData, "感測器數據"]] = None
+):
+    fields = {
+        'height': height,
+        'weight': weight,
+        'diet': diet,
+        'exercise': exercise,
+        'inconvenience': inconvenience,
+        'sensor_data': json.dumps(sensor_data, ensure_ascii=False) if sensor_data is not None else None,
+    }
+    fields = {column: value for column, value in fields.items() if value is not None}
+    if not fields:
+        return "❌ 沒有提供要更新的欄位"
+
+    try:
+        with db_cursor() as (connection, cursor):
+            # MySQL 的 rowcount 是實際改變的列數，寫入相同的值時為 0，紀錄是否存在要另外確認（並鎖住該列）
+            cursor.execute(
+                "SELECT 1 FROM patient_records WHERE id = %s AND patient_id = %s FOR UPDATE",
+                (record_id, patient_id)
+            )
+            updated = cursor.fetchone() is not None
+            if updated:
+                assignments = ", ".join(f"{column} = %s" for column in fields)
+                query = f"UPDATE patient_records SET {assignments} WHERE id = %s AND patient_id = %s"
+                cursor.execute(query, (*fields.values(), record_id, patient_id))
+            # 換掉這筆紀錄中有更新的量測值（有提供 sensor_data 時整組換掉，即使是空的），保留原本的量測時間
+            readings = _readings(patient_id, record_id, height, weight, sensor_data)
+            replaced = [metric for metric, value in (('height', height), ('weight', weight)) if value is not None]
+            if sensor_data is not None:
+                replaced.extend(SENSOR_METRICS)
+            if updated and replaced:
+                cursor.execute("SELECT MIN(measured_at) FROM sensor_readings WHERE record_id = %s", (record_id,))
+                (measured_at,) = cursor.fetchone()
+                placeholders = ", ".join(["%s"] * len(replaced))
+                cursor.execute(
+                    f"DELETE FROM sensor_readings WHERE record_id = %s AND metric IN ({placeholders})",
+                    (record_id, *replaced)
+                )
+                if readings:
+                    cursor.executemany(
+                        """INSERT INTO sensor_readings (patient_id, record_id, metric, value, measured_at)
+                     VALUES (%s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))""",
+                        [(*reading, measured_at) for reading in readings]
+                    )
+            connection.commit()
+        if updated:
+            return f"✅ 病人 {patient_id} 的健康紀錄 {record_id} 已成功更新！"
+        else:
+            return f"❌ 找不到病人 {patient_id} 的健康紀錄 {record_id}"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 查詢病人資料
+@TOOLS.tool("查詢病人資料", roles=(DOCTOR,), cache_by="patient_id")
+def query_patient(patient_id: PatientId):
+    try:
+        with db_cursor() as (connection, cursor):
+            query = "SELECT * FROM patients WHERE id = %s"
+            cursor.execute(query, (patient_id,))
+            result = cursor.fetchone()
+        
+        if result:
+            return f"📌 病人資料：\n姓名: {result[1]}, 年齡: {result[2]}, 性別: {result[3]}"
+        else:
+            return f"❌ 找不到病人 ID: {patient_id} 的資料"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 列出病人（分頁，可依姓名開頭、年齡、性別篩選）
+@TOOLS.tool("列出病人資料（分頁）", roles=(DOCTOR,))
+def list_patients(
+    name: Annotated[str, "姓名開頭"] = None,
+    age: Annotated[int, "年齡"] = None,
+    gender: Annotated[Literal["男", "女"], "性別"] = None,
+    page_size: PageSize = PAGE_SIZE,
+    page_token: PageToken = None
+):
+    limit = _page_limit(page_size)
+    conditions = []
+    params = []
+    if page_token:
+        try:
+            (after_id,) = _decode_page_token(page_token, 1)
+        except ValueError:
+            return "❌ 無效的 page_token"
+        conditions.append("id > %s")
+        params.append(after_id)
+    if name:
+        conditions.append("name LIKE %s")
+        params.append(_like_prefix(name))
+    if age is not None:
+        conditions.append("age = %s")
+        params.append(age)
+    if gender:
+        conditions.append("gender = %s")
+        params.append(gender)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    try:
+        with db_cursor() as (connection, cursor):
+            query = f"SELECT id, name, age, gender FROM patients {where} ORDER BY id LIMIT %s"
+            cursor.execute(query, (*params, limit + 1))
+            records, next_token = _read_page(cursor, limit, lambda r: (r[0],))
+
+        if records:
+            lines = ["📋 病人列表："]
+            lines.extend(f"ID: {r[0]}, 姓名: {r[1]}, 年齡: {r[2]}, 性別: {r[3]}" for r in records)
+            if next_token:
+                lines.append(_page_footer(next_token))
+            return "\n".join(lines)
+        elif conditions:
+            return "❌ 找不到符合條件的病人"
+        else:
+            return "資料表為空"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 依 (created_at, id) 分頁時下一頁的條件，回傳 (SQL 條件, 參數)；token 無效時丟出 ValueError
+def _created_at_after(page_token, newest_first=True):
+    if not page_token:
+        return "", ()
+    created_at, last_id = _decode_page_token(page_token, 2)
+    op = "<" if newest_first else ">"
+    return f" AND (created_at {op} %s OR (created_at = %s AND id {op} %s))", (created_at, created_at, int(last_id))
+
+# 查詢醫生評估報告（由新到舊分頁）
+@TOOLS.tool("查詢醫生評估報告（分頁，由新到舊）", roles=(DOCTOR,), cache_by="patient_id")
+def get_doctor_reports(patient_id: PatientId, page_size: PageSize = PAGE_SIZE, page_token: PageToken = None):
+    limit = _page_limit(page_size)
+    try:
+        after, after_params = _created_at_after(page_token)
+    except ValueError:
+        return "❌ 無效的 page_token"
+
+    try:
+        with db_cursor() as (connection, cursor):
+            query = f"""SELECT id, feedback, evaluation, reviewed, notes, created_at FROM doctor_reports
+                     WHERE patient_id = %s{after} ORDER BY created_at DESC, id DESC LIMIT %s"""
+            cursor.execute(query, (patient_id, *after_params, limit + 1))
+            reports, next_token = _read_page(cursor, limit, lambda r: (r[5], r[0]))
+
+        if reports:
+            lines = [f"📋 病人 {patient_id} 的醫生報告："]
+            lines.extend(
+                f"ID: {report[0]}, 回饋: {report[1]}, 評估: {report[2]}, 已審閱: {report[3]}, 筆記: {report[4]}"
+                for report in reports
+            )
+            if next_token:
+                lines.append(_page_footer(next_token))
+            return "\n".join(lines)
+        else:
+            return f"❌ 找不到病人 {patient_id} 的醫生報告"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 刪除病患時要一併刪除的資料表（依刪除順序）與對應的病人ID欄位，最後才刪除 patients
+CASCADE_TABLES = (
+    ('sensor_readings', 'patient_id'),
+    ('patient_records', 'patient_id'),
+    ('doctor_reports', 'patient_id'),
+    ('patient_feedback', 'patient_id'),
+    ('conversation_messages', 'patient_id'),
+    ('conversation_sessions', 'patient_id'),
+)
+DELETE_CHUNK_SIZE = 1000       # 每個 DELETE 最多刪幾筆，避免單一語句鎖住大量資料列
+
+# 以 LIMIT 分批刪除 table 中 column = value 的資料，回傳刪除的總筆數；
+# after_chunk 會在每批刪除後被呼叫（可用來提交交易或回報進度）
+def delete_in_chunks(cursor, table, column, value, chunk_size=DELETE_CHUNK_SIZE, after_chunk=None):
+    total = 0
+    while True:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} = %s LIMIT %s", (value, chunk_size))
+        deleted = cursor.rowcount
+        total += deleted
+        if after_chunk is not None:
+            after_chunk(deleted)
+        if deleted < chunk_size:
+            return total
+
+# 刪除病患資料：在同一個交易中分批刪除所有相關記錄，任何一步失敗就整個回滾
+@TOOLS.tool("刪除病患資料（包含所有相關記錄）", roles=(DOCTOR,), invalidates="patient_id")
+def delete_patient(patient_id: Annotated[int, "病患ID"]):
+    try:
+        with db_cursor() as (connection, cursor):
+            connection.start_transaction()
+            try:
+                # 先刪除相關的記錄
+                counts = {
+                    table: delete_in_chunks(cursor, table, column, patient_id)
+                    for table, column in CASCADE_TABLES
+                }
+                # 最後刪除病患基本資料
+                cursor.execute("DELETE FROM patients WHERE id = %s", (patient_id,))
+                found = cursor.rowcount
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        if not found:
+            return f"❌ 找不到病患 ID: {patient_id}（已清除 {sum(counts.values())} 筆相關記錄）"
+        return f"✅ 已成功刪除病患 ID: {patient_id} 的所有相關資料（共 {sum(counts.values())} 筆相關記錄）"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 新增醫生評估報告（僅醫生可見）
+@TOOLS.tool("新增醫生評估報告", roles=(PATIENT, DOCTOR), invalidates="patient_id")
+def insert_doctor_report(
+    patient_id: PatientId,
+    feedback: Annotated[str, "病患回饋"],
+    evaluation: Annotated[str, "評估報告"],
+    reviewed: Annotated[bool, "是否已審閱"] = False,
+    notes: Annotated[str, "醫生筆記"] = ""
+):
+    try:
+        with db_cursor() as (connection, cursor):
+            query = """INSERT INTO doctor_reports 
+                     (patient_id, feedback, evaluation, reviewed, notes) 
+                     VALUES (%s, %s, %s, %s, %s)"""
+            
+            values = (patient_id, feedback, evaluation, reviewed, notes)
+            cursor.execute(query, values)
+            connection.commit()
+        return f"✅ 已成功新增醫生評估報告"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 新增意見回饋（病患可見）
+@TOOLS.tool("新增病患可見的意見回饋", roles=(PATIENT, DOCTOR), invalidates="patient_id")
+def insert_feedback(patient_id: PatientId, feedback: Annotated[str, "意見回饋內容"]):
+    try:
+        with db_cursor() as (connection, cursor):
+            query = """INSERT INTO patient_feedback 
+                     (patient_id, feedback) 
+                     VALUES (%s, %s)"""
+            
+            values = (patient_id, feedback)
+            cursor.execute(query, values)
+            connection.commit()
+        return f"✅ 已成功新增意見回饋"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 查詢病患的意見回饋（由新到舊分頁）
+@TOOLS.tool("查詢病患的意見回饋（分頁，由新到舊）", roles=(PATIENT, DOCTOR), cache_by="patient_id")
+def get_patient_feedback(patient_id: PatientId, page_size: PageSize = PAGE_SIZE, page_token: PageToken = None):
+    limit = _page_limit(page_size)
+    try:
+        after, after_params = _created_at_after(page_token)
+    except ValueError:
+        return "❌ 無效的 page_token"
+
+    try:
+        with db_cursor() as (connection, cursor):
+            query = f"""SELECT id, feedback, created_at FROM patient_feedback
+                     WHERE patient_id = %s{after} ORDER BY created_at DESC, id DESC LIMIT %s"""
+            cursor.execute(query, (patient_id, *after_params, limit + 1))
+            feedbacks, next_token = _read_page(cursor, limit, lambda r: (r[2], r[0]))
+
+        if feedbacks:
+            lines = ["📋 您的意見回饋："]
+            for feedback_id, feedback, created_at in feedbacks:
+                lines.append(f"時間: {created_at}")
+                lines.append(f"內容: {feedback}")
+            if next_token:
+                lines.append(_page_footer(next_token))
+            return "\n".join(lines)
+        else:
+            return f"❌ 目前沒有意見回饋"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 查詢病人的對話記錄（由新到舊分頁）
+@TOOLS.tool("查詢病人的對話記錄（分頁，由新到舊）", roles=(DOCTOR,))
+def get_conversation_sessions(patient_id: PatientId, page_size: PageSize = PAGE_SIZE, page_token: PageToken = None):
+    limit = _page_limit(page_size)
+    try:
+        after, after_params = _created_at_after(page_token)
+    except ValueError:
+        return "❌ 無效的 page_token"
+
+    try:
+        with db_cursor() as (connection, cursor):
+            query = f"""SELECT id, created_at, end_time FROM conversation_sessions
+                     WHERE patient_id = %s{after} ORDER BY created_at DESC, id DESC LIMIT %s"""
+            cursor.execute(query, (patient_id, *after_params, limit + 1))
+            sessions, next_token = _read_page(cursor, limit, lambda r: (r[1], r[0]))
+
+        if sessions:
+            lines = [f"📋 病人 {patient_id} 的對話記錄："]
+            for session_id, created_at, end_time in sessions:
+                lines.append(f"對話ID: {session_id}, 開始: {created_at}, 結束: {end_time or '進行中'}")
+            if next_token:
+                lines.append(_page_footer(next_token))
+            return "\n".join(lines)
+        else:
+            return f"❌ 找不到病人 {patient_id} 的對話記錄"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# 查看特定對話的詳細內容（依時間順序分頁）；第一頁附上整段對話的摘要，
+# 單則訊息超過 MAX_MESSAGE_CHARS 字會被截斷，長對話也只會回傳一個固定大小的視窗
+@TOOLS.tool("查看特定對話的詳細內容（分頁，依時間順序）", roles=(DOCTOR,))
+def get_patient_conversation(
+    patient_id: PatientId,
+    session_id: SessionId,
+    page_size: PageSize = PAGE_SIZE,
+    page_token: PageToken = None
+):
+    limit = _page_limit(page_size)
+    try:
+        after, after_params = _created_at_after(page_token, newest_first=False)
+    except ValueError:
+        return "❌ 無效的 page_token"
+
+    try:
+        with db_cursor() as (connection, cursor):
+            summary = None
+            if not page_token:
+                cursor.execute(
+                    """SELECT COUNT(*), SUM(role = 'user'), MIN(created_at), MAX(created_at)
+                     FROM conversation_messages WHERE patient_id = %s AND session_id = %s""",
+                    (patient_id, session_id)
+                )
+                summary = cursor.fetchone()
+            query = f"""SELECT id, role, content, created_at FROM conversation_messages
+                     WHERE patient_id = %s AND session_id = %s{after}
+                     ORDER BY created_at, id LIMIT %s"""
+            cursor.execute(query, (patient_id, session_id, *after_params, limit + 1))
+            messages, next_token = _read_page(cursor, limit, lambda r: (r[3], r[0]))
+
+        if messages:
+            lines = [f"📋 對話 {session_id} 的內容："]
+            if summary:
+                total, user_count, first_at, last_at = summary
+                lines.append(f"共 {total} 則訊息（使用者 {int(user_count or 0)} 則），時間: {first_at} ~ {last_at}")
+            for message_id, role, content, created_at in messages:
+                if len(content) > MAX_MESSAGE_CHARS:
+                    content = content[:MAX_MESSAGE_CHARS] + "…"
+                lines.append(f"[{created_at}] {role}: {content}")
+            if next_token:
+                lines.append(_page_footer(next_token))
+            return "\n".join(lines)
+        else:
+            return f"❌ 找不到對話 {session_id} 的內容"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+def _fmt(value):
+    return f"{value:.1f}"
+
+def _fmt_change(value):
+    return f"{value:+.1f}"
+
+# 查詢病人某項健康指標的變化趨勢
+@TOOLS.tool("查詢病人健康指標（身高、體重、握力、仰臥起坐）的變化趨勢", roles=(DOCTOR,), cache_by="patient_id")
+def get_sensor_trend(patient_id: PatientId, metric: Metric, days: Annotated[int, "只看最近幾天"] = None):
+    label = METRIC_LABELS[metric]
+    since = " AND measured_at >= NOW() - INTERVAL %s DAY" if days else ""
+    params = (patient_id, metric, *((days,) if days else ()), MAX_TREND_POINTS)
+    try:
+        with db_cursor() as (connection, cursor):
+            query = f"""SELECT measured_at, value FROM sensor_readings
+                     WHERE patient_id = %s AND metric = %s{since}
+                     ORDER BY measured_at DESC, id DESC LIMIT %s"""
+            cursor.execute(query, params)
+            rows = list(cursor)
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+    if not rows:
+        return f"❌ 找不到病人 {patient_id} 的{label}紀錄"
+    times, values = zip(*reversed(rows))
+    summary = sensor_analytics.trend(sensor_analytics.to_seconds(times), values)
+    change_pct = f"（{summary['change_pct']:+.1f}%）" if summary['change_pct'] is not None else ""
+    return "\n".join([
+        f"📈 病人 {patient_id} 的{label}趨勢（{summary['count']} 筆，{times[0]} ~ {times[-1]}）：",
+        f"最新: {_fmt(summary['last'])}，最初: {_fmt(summary['first'])}，"
+        f"變化: {_fmt_change(summary['change'])}{change_pct}",
+        f"平均: {_fmt(summary['mean'])}，最低: {_fmt(summary['min'])}，最高: {_fmt(summary['max'])}",
+        f"每 30 天變化: {_fmt_change(summary['slope_per_30d'])}",
+    ])
+
+# 由身高體重計算病人的 BMI
+@TOOLS.tool("計算病人的 BMI 與變化", roles=(PATIENT, DOCTOR), cache_by="patient_id")
+def get_patient_bmi(patient_id: PatientId):
+    try:
+        with db_cursor() as (connection, cursor):
+            query = """SELECT record_id, metric, value FROM sensor_readings
+                     WHERE patient_id = %s AND metric IN ('height', 'weight')
+                     ORDER BY measured_at DESC, id DESC LIMIT %s"""
+            cursor.execute(query, (patient_id, 2 * MAX_TREND_POINTS))
+            rows = list(cursor)
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+    heights = [(record_id, value) for record_id, metric, value in rows if metric == 'height']
+    weights = [(record_id, value) for record_id, metric, value in rows if metric == 'weight']
+    if not heights or not weights:
+        return f"❌ 找不到病人 {patient_id} 的身高體重紀錄"
+    records, values = sensor_analytics.bmi_by_record(*zip(*heights), *zip(*weights))
+    if not len(records):
+        return f"❌ 找不到病人 {patient_id} 同時有身高與體重的紀錄"
+
+    latest = float(values[-1])
+    lines = [f"📌 病人 {patient_id} 的 BMI：{latest:.1f}（{sensor_analytics.bmi_category(latest)}）"]
+    if len(values) > 1:
+        lines.append(f"共 {len(values)} 筆紀錄，與第一筆相比變化: {latest - float(values[0]):+.1f}")
+    try:
+        rank = COHORTS.rank('bmi', latest)
+    except mysql.connector.Error:
+        rank = None
+    if rank is not None:
+        lines.append(f"在所有病人中約為第 {rank:.0f} 百分位")
+    return "\n".join(lines)
+
+# 族群百分位數（可依性別、年齡篩選），並可標出某位病人的位置
+@TOOLS.tool("查詢所有病人某項健康指標的百分位數分布", roles=(DOCTOR,))
+def get_cohort_percentiles(
+    metric: CohortMetric,
+    gender: Annotated[Literal["男", "女"], "性別"] = None,
+    min_age: Annotated[int, "最低年齡"] = None,
+    max_age: Annotated[int, "最高年齡"] = None,
+    patient_id: Annotated[int, "要標出位置的病人ID"] = None
+):
+    label = METRIC_LABELS[metric]
+    try:
+        result = COHORTS.percentiles(metric, gender, min_age, max_age)
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+    if result is None:
+        return f"❌ 沒有符合條件的{label}資料"
+
+    percentiles, count = result
+    lines = [f"📊 {label}的族群分布（{count} 位病人）："]
+    lines.append("，".join(f"P{p}: {_fmt(value)}" for p, value in percentiles.items()))
+    if patient_id is not None:
+        value = COHORTS.latest(metric, patient_id)
+        if value is None:
+            lines.append(f"病人 {patient_id} 沒有{label}資料")
+        else:
+            rank = COHORTS.rank(metric, value, gender, min_age, max_age)
+            lines.append(f"病人 {patient_id} 最新數值 {_fmt(value)}，約為第 {rank:.0f} 百分位")
+    return "\n".join(lines)
+
+# 結束對話
+@TOOLS.tool("結束對話", roles=(PATIENT,))
+def end_conversation(session_id: SessionId, context: ToolContext):
+    try:
+        with db_cursor() as (connection, cursor):
+            query = "UPDATE conversation_sessions SET end_time = CURRENT_TIMESTAMP WHERE id = %s"
+            cursor.execute(query, (session_id,))
+            connection.commit()
+        if context.conversation_id == session_id:
+            context.conversation_id = None
+        return f"✅ 對話 {session_id} 已成功結束"
+    except mysql.connector.Error as err:
+        return f"⚠️ 發生錯誤: {err}"
+
+# -----------------------------------------------------
+# Session 配置
+# -----------------------------------------------------
+
+# 各身份共用的指示
+COMMON_INSTRUCTIONS = (
+    "請使用繁體中文回應用戶的問題，並且盡可能使用函式來執行資料庫操作。"
+    "如果用戶的指令不明確，請詢問更多細節。"
+)
+
+# 各身份的指示，只會傳送目前身份需要的部分
+ROLE_INSTRUCTIONS = {
+    GUEST: (
+        "你是一個醫療保健助手，首先需要確認使用者的身份（醫生或病患）。"
+        "確認後立即使用 set_user_role 記錄身份，之後才能使用其他功能。\n"
+    ),
+    PATIENT: (
+        "你是一個醫療保健助手，目前的使用者是病患：\n"
+        "1. 使用 start_conversation 開啟新的對話\n"
+        "2. 像個專業醫生一樣與病患對話，了解其症狀和健康狀況\n"
+        "3. 使用 add_patient 記錄病患基本資料\n"
+        "4. 使用 add_patient_record 記錄病患的健康狀況\n"
+        "5. 使用 update_patient_record 更新病患的資訊\n"
+        "6. 在對話結束時：\n"
+        "   - 使用 insert_feedback 提供病患可見的意見回饋\n"
+        "   - 使用 insert_doctor_report 記錄醫生內部評估報告\n"
+        "7. 使用 end_conversation 結束對話\n"
+    ),
+    DOCTOR: (
+        "你是一個醫療保健助手，目前的使用者是醫生：\n"
+        "1. 提供查詢病患資料的功能\n"
+        "2. 允許修改病患紀錄\n"
+        "3. 可以撰寫和修改醫生評估報告\n"
+        "4. 可以查看所有病患的對話記錄\n"
+        "5. 可以刪除病患資料（包含所有相關記錄）\n"
+        "6. 可以查詢健康指標的變化趨勢、BMI 與族群百分位數\n"
+    ),
+}
+
+# 建立 session 後要傳給伺服器的配置，如聲音等；instructions 與 tools 依身份產生
+SESSION_CONFIG = {
+    "type": "session.update",
+    "session": {
+        "turn_detection": {
+            "type": "server_vad",
+            "threshold": 0.5,
+            "prefix_padding_ms": 300,
+            "silence_duration_ms": 500
+        },
+        "voice": "alloy",
+        "temperature": 1,
+        "max_response_output_tokens": 4096,
+        "modalities": ["text", "audio"],
+        "input_audio_format": "pcm16",
+        "output_audio_format": "pcm16",
+        "input_audio_transcription": {
+            "model": "whisper-1"
+        },
+        "tool_choice": "auto"
+    }
+}
+
+
+def _role_session(role):
+    return {"instructions": ROLE_INSTRUCTIONS[role] + COMMON_INSTRUCTIONS, "tools": TOOLS.schemas(role)}
+
+# 序列化後的完整 session.update 訊息（預設只有確認身份用的工具）；每個身份與音訊格式只在第一次呼叫時產生。
+# audio_format 為 pcm16、g711_ulaw 或 g711_alaw，上傳與回傳使用相同的格式
+@functools.lru_cache(maxsize=None)
+def build_session_update(role=GUEST, audio_format="pcm16"):
+    session = {
+        **SESSION_CONFIG["session"],
+        "input_audio_format": audio_format,
+        "output_audio_format": audio_format,
+        **_role_session(role),
+    }
+    return json.dumps({**SESSION_CONFIG, "session": session})
+
+# 確認身份後傳送的 session.update，只更新 instructions 與 tools，其他設定沿用
+@functools.lru_cache(maxsize=None)
+def build_role_update(role):
+    return json.dumps({"type": "session.update", "session": _role_session(role)})
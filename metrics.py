@@ -0,0 +1,255 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# -----------------------------------------------------
+# 延遲與計數指標（直方圖 / 計數器 / 即時數值）
+# -----------------------------------------------------
+# 熱路徑上每次記錄只做一次二分搜尋和一個短暫的鎖，可以在 PortAudio 回呼與事件迴圈中使用。
+# 指標以名稱加上標籤區分，例如 METRICS.histogram('ws_event_ms', type='response.audio.delta')。
+# 匯出方式：
+# - snapshot()：JSON 可序列化的 dict（百分位數由桶的計數內插估算）
+# - prometheus()：Prometheus 文字格式（realtime_server 的 GET /metrics）
+# - MetricsDumper：每隔幾秒把 snapshot() 寫入檔案（gpt_sql_assistant）
+#
+# 目前記錄的指標：
+#   ws_event_ms{type}          WebSocket 事件從解析到分派完成的時間
+#   ws_send_ms{kind}           送出訊息給 OpenAI 的時間（包含等待送出鎖）
+#   client_send_ms             realtime_server 把 AI 音訊送給用戶端的時間
+#   tool_exec_ms{tool}         函式實際執行的時間（主要是資料庫查詢，快取命中不計）
+#   db_pool_wait_ms            向連線池借連線的等待時間
+#   mic_queue_depth            上傳任務每次取資料時麥克風佇列中的音訊塊數
+#   playback_fill_ms           喇叭回呼每次播放時播放緩衝中尚未播放的長度
+#   portaudio_callback_ms{stream}  PortAudio 回呼的執行時間
+#   portaudio_underflows / portaudio_overflows  PortAudio 回報的裝置層級斷音 / 溢位
+#   playback_underruns / mic_queue_dropped     播放緩衝斷音次數與麥克風佇列丟棄數（即時數值）
+
+# 毫秒延遲的預設桶邊界
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# 佇列長度（個數）的桶邊界
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+# 播放緩衝長度（毫秒音訊）的桶邊界
+FILL_BUCKETS_MS = (0, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000, 120000)
+
+METRICS_DUMP_INTERVAL = 10.0   # MetricsDumper 預設每隔幾秒寫一次檔案
+
+logger = logging.getLogger(__name__)
+
+
+# 固定桶邊界的直方圖；桶 i 計數 buckets[i-1] < 值 <= buckets[i]，最後一桶為超過上限的值
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    # 以 perf_counter() 的起始時間記錄經過的毫秒數
+    def observe_since(self, start):
+        self.observe((time.perf_counter() - start) * 1000)
+
+    # 在第 q 個百分位所在的桶內線性內插（超過最後一個邊界時以最大值為上限）
+    def _percentile(self, counts, count, maximum, q):
+        target = q / 100 * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and cumulative + bucket_count >= target:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else maximum
+                upper = min(upper, maximum)
+                return lower + (upper - lower) * (target - cumulative) / bucket_count
+            cumulative += bucket_count
+        return maximum
+
+    # (各桶計數, 總次數, 總和, 最大值) 的一致副本
+    def state(self):
+        with self._lock:
+            return list(self._counts), self._count, self._sum, self._max
+
+    def snapshot(self):
+        counts, count, total, maximum = self.state()
+        if not count:
+            return {'count': 0}
+        return {
+            'count': count,
+            'sum': round(total, 3),
+            'avg': round(total / count, 3),
+            'p50': round(self._percentile(counts, count, maximum, 50), 3),
+            'p95': round(self._percentile(counts, count, maximum, 95), 3),
+            'p99': round(self._percentile(counts, count, maximum, 99), 3),
+            'max': round(maximum, 3),
+            'buckets': counts,
+        }
+
+
+class Counter:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_name(name, label_key, extra=()):
+    labels = label_key + tuple(extra)
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+# 所有指標的集合；同樣的名稱與標籤只會建立一次，呼叫端可以保留回傳的物件避免重複查詢
+class Metrics:
+    def __init__(self):
+        self._histograms = {}   # (名稱, 標籤) -> Histogram
+        self._counters = {}     # (名稱, 標籤) -> Counter
+        self._gauges = {}       # (名稱, 標籤) -> 取得目前數值的函式
+        self._lock = threading.Lock()
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS_MS, **labels):
+        key = (name, _label_key(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def counter(self, name, **labels):
+        key = (name, _label_key(labels))
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, Counter())
+        return counter
+
+    # 註冊即時數值（例如緩衝統計），匯出時才呼叫 fn()
+    def gauge(self, name, fn, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = fn
+
+    # with METRICS.timer('name', tag=...): 記錄區塊的執行毫秒數
+    @contextmanager
+    def timer(self, name, **labels):
+        histogram = self.histogram(name, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe_since(start)
+
+    def _gauge_values(self):
+        with self._lock:
+            gauges = list(self._gauges.items())
+        values = []
+        for key, fn in gauges:
+            try:
+                values.append((key, fn()))
+            except Exception:
+                continue
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        return {
+            'timestamp': time.time(),
+            'histograms': {_format_name(name, labels): h.snapshot() for (name, labels), h in histograms},
+            'counters': {_format_name(name, labels): c.value for (name, labels), c in counters},
+            'gauges': {_format_name(name, labels): value for (name, labels), value in self._gauge_values()},
+        }
+
+    # Prometheus 文字格式（text/plain; version=0.0.4）
+    def prometheus(self):
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), histogram in histograms:
+            declare(name, 'histogram')
+            counts, count, total, _ = histogram.state()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f"{_format_name(name + '_bucket', labels, [('le', bound)])} {cumulative}")
+            lines.append(f'{_format_name(name + "_sum", labels)} {total}')
+            lines.append(f'{_format_name(name + "_count", labels)} {count}')
+        for (name, labels), counter in counters:
+            declare(name, 'counter')
+            lines.append(f'{_format_name(name, labels)} {counter.value}')
+        for (name, labels), value in sorted(self._gauge_values()):
+            declare(name, 'gauge')
+            lines.append(f'{_format_name(name, labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    # 把 snapshot() 寫入 JSON 檔；先寫暫存檔再改名，讀取端不會讀到寫了一半的檔案
+    def dump(self, path):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+# 在背景執行緒定期把指標寫入檔案，close() 時再寫最後一次
+class MetricsDumper:
+    def __init__(self, metrics, path, interval=METRICS_DUMP_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-dump', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _dump_quietly(self):
+        try:
+            self.metrics.dump(self.path)
+        except OSError as e:
+            logger.warning('⚠️ 無法寫入指標檔 %s: %s', self.path, e)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._dump_quietly()
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._dump_quietly()
+
+
+# 整個程式共用的指標
+METRICS = Metrics()
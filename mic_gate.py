@@ -0,0 +1,121 @@
+import collections
+import threading
+
+import numpy as np
+
+# -----------------------------------------------------
+# 麥克風上傳閘門（靜音抑制 + 回音閘門）
+# -----------------------------------------------------
+# 在麥克風回呼中決定哪些音訊塊要上傳，靜音與 AI 自己的聲音不送到伺服器：
+# - 以音訊塊的平均能量（NumPy 向量運算，不取對數）與門檻比較判斷是否有人說話
+# - 說話結束後繼續上傳 hangover_ms 的靜音：必須比伺服器 VAD 的 silence_duration_ms 長，
+#   伺服器才能偵測到語音結束並開始回應
+# - 閘門關閉時保留最近 preroll_ms 的音訊，開啟時一併送出，避免切掉開頭的子音
+#   （對應伺服器 VAD 的 prefix_padding_ms）
+# - AI 播放中（echo=True）門檻提高 echo_margin_db，喇叭的回音不會觸發上傳，
+#   但使用者大聲插話仍然可以打斷 AI
+#
+# 用法（PortAudio 麥克風回呼）：
+#     for frame in mic_gate.process(in_data, echo=time.time() < mic_on_at):
+#         mic_queue.put(frame)
+# 輸入不是 pcm16（例如直接轉送 G.711）時，傳入 sample_width 與 decode 轉成 pcm16 再計算能量。
+
+RATE = 24000
+THRESHOLD_DBFS = -45.0     # 平均能量超過這個值（相對於滿刻度的 dB）視為說話
+HANGOVER_MS = 800          # 說話結束後繼續上傳的時間（伺服器 silence_duration_ms 為 500）
+PREROLL_MS = 300           # 閘門開啟時補送的前段音訊（伺服器 prefix_padding_ms 為 300）
+ECHO_MARGIN_DB = 15.0      # AI 播放中提高的門檻
+
+
+def _energy_threshold(dbfs):
+    # dBFS 以 pcm16 滿刻度 32768 為 0 dB；比較平均平方值即可，不需要開根號或取對數
+    return (32768.0 * 10 ** (dbfs / 20)) ** 2
+
+
+# pcm16 音訊塊的平均平方值
+def frame_energy(pcm):
+    samples = np.frombuffer(pcm, dtype='<i2').astype(np.float32)
+    if not len(samples):
+        return 0.0
+    return float(np.dot(samples, samples)) / len(samples)
+
+
+class MicGate:
+    def __init__(self, rate=RATE, threshold_dbfs=THRESHOLD_DBFS, hangover_ms=HANGOVER_MS,
+                 preroll_ms=PREROLL_MS, echo_margin_db=ECHO_MARGIN_DB, sample_width=2, decode=None):
+        self.rate = rate
+        self.decode = decode
+        self.threshold = _energy_threshold(threshold_dbfs)
+        self.echo_threshold = _energy_threshold(threshold_dbfs + echo_margin_db)
+        self.hangover_bytes = rate * sample_width * hangover_ms // 1000
+        self.preroll_bytes = rate * sample_width * preroll_ms // 1000
+
+        self._preroll = collections.deque()    # [(音訊塊, 擋下的原因)]
+        self._preroll_size = 0
+        self._open = False
+        self._hangover_left = 0    # 閘門還要保持開啟的位元組數
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'frames_in': 0,
+            'frames_sent': 0,
+            'frames_silent': 0,     # 沒有上傳的靜音音訊塊
+            'frames_echo': 0,       # AI 播放中被擋下的音訊塊（不含之後當作前段音訊送出的部分）
+            'bytes_in': 0,
+            'bytes_sent': 0,
+            'openings': 0,
+        }
+
+    # 處理一個音訊塊，回傳要上傳的音訊塊清單（可能為空，開啟時包含前段音訊）
+    def process(self, pcm, echo=False):
+        energy = frame_energy(pcm if self.decode is None else self.decode(pcm))
+        with self._lock:
+            self._stats['frames_in'] += 1
+            self._stats['bytes_in'] += len(pcm)
+            speaking = energy >= (self.echo_threshold if echo else self.threshold)
+
+            if speaking:
+                self._hangover_left = self.hangover_bytes
+                if not self._open:
+                    self._open = True
+                    self._stats['openings'] += 1
+                    for _, reason in self._preroll:
+                        self._stats[reason] -= 1
+                    frames = [frame for frame, _ in self._preroll] + [pcm]
+                    self._preroll.clear()
+                    self._preroll_size = 0
+                    return self._sent(frames)
+                return self._sent([pcm])
+
+            if self._open and self._hangover_left > 0:
+                self._hangover_left -= len(pcm)
+                return self._sent([pcm])
+
+            self._open = False
+            reason = 'frames_echo' if echo and energy >= self.threshold else 'frames_silent'
+            self._stats[reason] += 1
+            self._preroll.append((pcm, reason))
+            self._preroll_size += len(pcm)
+            while self._preroll_size - len(self._preroll[0][0]) >= self.preroll_bytes:
+                self._preroll_size -= len(self._preroll.popleft()[0])
+            return []
+
+    def _sent(self, frames):
+        self._stats['frames_sent'] += len(frames)
+        self._stats['bytes_sent'] += sum(len(frame) for frame in frames)
+        return frames
+
+    # 立即關閉閘門並清掉前段音訊（例如對話結束）
+    def reset(self):
+        with self._lock:
+            self._open = False
+            self._hangover_left = 0
+            self._preroll.clear()
+            self._preroll_size = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['open'] = self._open
+        stats['saved_pct'] = round(100 - stats['bytes_sent'] / stats['bytes_in'] * 100, 1) if stats['bytes_in'] else 0.0
+        return stats
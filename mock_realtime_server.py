@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import struct
+import time
+
+import websockets
+
+# -----------------------------------------------------
+# 本機模擬的 OpenAI Realtime 伺服器
+# -----------------------------------------------------
+# 依固定腳本模擬 Realtime API 的事件，不需要 API Key、麥克風或資料庫，給測試與效能量測使用：
+#   session.created
+#   每一輪：input_audio_buffer.speech_started → speech_stopped → 使用者語音的轉錄
+#          →（每 tool_every 輪）response.function_call_arguments.done，等待用戶端的 response.create
+#          → response.audio.delta × N（依 delta_ms 即時送出，可加入隨機抖動）→ response.audio.done
+#          → response.audio_transcript.done → response.done
+# 設定 barge_in_ms 時，每段回應播放 barge_in_ms 後模擬使用者插話（再送一次 speech_started），
+# 收到用戶端的 response.cancel 才停止送出音訊，並以 status=cancelled 的 response.done 結束這一輪。
+# 用戶端送來的事件只做統計；函式呼叫從送出到收到 response.create 的時間記錄在 tool_rtts，
+# 插話到收到 response.cancel 的時間記錄在 cancel_rtts，conversation.item.truncate 的 audio_end_ms 記錄在 truncations。
+# 設定 drop_after_turns 時，連線在該輪開始前直接中斷（不送 close frame，用戶端視為異常中斷）；
+# 收過對話摘要（role=system 的 conversation.item.create）的連線視為已恢復，不再中斷，並從頭執行腳本。
+#
+# 單獨執行：python mock_realtime_server.py --port 8766
+# （例如 python realtime_server.py --url ws://127.0.0.1:8766 即可在本機測試多人伺服器）
+
+RATE = 24000
+
+
+# 一段 440Hz 的 pcm16 測試音
+def _tone(duration_ms, rate=RATE, amplitude=4000):
+    count = rate * duration_ms // 1000
+    samples = (int(amplitude * math.sin(2 * math.pi * 440 * i / rate)) for i in range(count))
+    return struct.pack(f'<{count}h', *samples)
+
+
+class MockRealtimeServer:
+    def __init__(self, turns=5, tool_every=2, speech_ms=300, response_delay_ms=50, response_audio_ms=1000,
+                 delta_ms=40, jitter_ms=0, turn_gap_ms=300, barge_in_ms=None, drop_after_turns=None,
+                 tool_name='bench_lookup', seed=None):
+        self.turns = turns
+        self.tool_every = tool_every
+        self.speech_ms = speech_ms
+        self.response_delay_ms = response_delay_ms
+        self.response_audio_ms = response_audio_ms
+        self.delta_ms = delta_ms
+        self.jitter_ms = jitter_ms
+        self.turn_gap_ms = turn_gap_ms
+        self.barge_in_ms = barge_in_ms
+        self.drop_after_turns = drop_after_turns
+        self.tool_name = tool_name
+        self._random = random.Random(seed)
+
+        # 每個 delta 的音訊內容固定，只編碼一次
+        self._delta = base64.b64encode(_tone(delta_ms)).decode('ascii')
+
+        self.sessions = 0
+        self.tool_rtts = []          # 秒
+        self.cancel_rtts = []        # 秒
+        self.truncations = []        # audio_end_ms
+        self.deltas_after_barge_in = 0
+        self.client_events = {}      # 用戶端事件類型 -> 次數
+        self.client_audio_bytes = 0
+        self.drops = 0
+        self.restores = 0
+
+    async def handler(self, ws):
+        self.sessions += 1
+        response_created = asyncio.Event()
+        response_cancelled = asyncio.Event()
+        restored = asyncio.Event()
+        receiver = asyncio.create_task(self._receive(ws, response_created, response_cancelled, restored))
+        aborted = False
+        try:
+            await self._send(ws, {'type': 'session.created', 'session': {}})
+            for turn in range(self.turns):
+                if turn == self.drop_after_turns and not restored.is_set():
+                    self.drops += 1
+                    # 模擬網路中斷：不送關閉訊框，之後也不能再呼叫 ws.close()；
+                    # 等連線確實關閉，websockets 在 handler 結束後的關閉交握才會直接略過
+                    aborted = True
+                    ws.transport.abort()
+                    await ws.wait_closed()
+                    return
+                await self._turn(ws, turn, response_created, response_cancelled)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            receiver.cancel()
+            if not aborted:
+                await ws.close()
+
+    async def _receive(self, ws, response_created, response_cancelled, restored):
+        try:
+            async for message in ws:
+                event = json.loads(message)
+                event_type = event.get('type')
+                self.client_events[event_type] = self.client_events.get(event_type, 0) + 1
+                if event_type == 'input_audio_buffer.append':
+                    self.client_audio_bytes += len(event.get('audio', '')) * 3 // 4
+                elif event_type == 'response.create':
+                    response_created.set()
+                elif event_type == 'response.cancel':
+                    response_cancelled.set()
+                elif event_type == 'conversation.item.truncate':
+                    self.truncations.append(event.get('audio_end_ms'))
+                elif event_type == 'conversation.item.create' and event.get('item', {}).get('role') == 'system':
+                    self.restores += 1
+                    restored.set()
+        except websockets.ConnectionClosed:
+            pass
+
+    @staticmethod
+    async def _send(ws, event):
+        # 與 Realtime API 相同，送出不含空白的 JSON
+        await ws.send(json.dumps(event, separators=(',', ':')))
+
+    async def _turn(self, ws, turn, response_created, response_cancelled):
+        await self._send(ws, {'type': 'input_audio_buffer.speech_started', 'audio_start_ms': 0, 'item_id': f'item_{turn}'})
+        await asyncio.sleep(self.speech_ms / 1000)
+        await self._send(ws, {'type': 'input_audio_buffer.speech_stopped', 'audio_end_ms': self.speech_ms, 'item_id': f'item_{turn}'})
+        await self._send(ws, {'type': 'conversation.item.input_audio_transcription.completed',
+                              'item_id': f'item_{turn}', 'transcript': f'第 {turn + 1} 輪的問題'})
+
+        if self.tool_every and turn % self.tool_every == self.tool_every - 1:
+            response_created.clear()
+            sent_at = time.perf_counter()
+            await self._send(ws, {
+                'type': 'response.function_call_arguments.done',
+                'name': self.tool_name,
+                'call_id': f'call_{turn}',
+                'arguments': json.dumps({'patient_id': turn + 1}),
+            })
+            await response_created.wait()
+            self.tool_rtts.append(time.perf_counter() - sent_at)
+
+        await asyncio.sleep(self.response_delay_ms / 1000)
+        response_id = f'resp_{turn}'
+        response_cancelled.clear()
+        await self._send(ws, {'type': 'response.created', 'response': {'id': response_id}})
+        # 以即時的速度送出音訊，抖動只會讓送出時間延後
+        start = time.perf_counter()
+        barge_in_at = None
+        deltas = max(1, self.response_audio_ms // self.delta_ms)
+        for i in range(deltas):
+            if response_cancelled.is_set():
+                self.cancel_rtts.append(time.perf_counter() - barge_in_at)
+                break
+            if barge_in_at is None and self.barge_in_ms is not None and i * self.delta_ms >= self.barge_in_ms:
+                barge_in_at = time.perf_counter()
+                await self._send(ws, {'type': 'input_audio_buffer.speech_started',
+                                      'audio_start_ms': 0, 'item_id': f'barge_in_{turn}'})
+            if barge_in_at is not None:
+                self.deltas_after_barge_in += 1
+            await self._send(ws, {'type': 'response.audio.delta', 'response_id': response_id,
+                                  'item_id': f'audio_{turn}', 'content_index': 0, 'delta': self._delta})
+            due = start + (i + 1) * self.delta_ms / 1000
+            if self.jitter_ms:
+                due += self._random.uniform(0, self.jitter_ms) / 1000
+            # 等到下一段音訊的時間，期間收到 response.cancel 就立即停止
+            try:
+                await asyncio.wait_for(response_cancelled.wait(), max(0.0, due - time.perf_counter()))
+            except asyncio.TimeoutError:
+                pass
+        status = 'cancelled' if response_cancelled.is_set() else 'completed'
+        if status == 'completed':
+            await self._send(ws, {'type': 'response.audio.done', 'response_id': response_id, 'item_id': f'audio_{turn}'})
+            await self._send(ws, {'type': 'response.audio_transcript.done', 'response_id': response_id,
+                                  'item_id': f'audio_{turn}', 'transcript': f'第 {turn + 1} 輪的回答'})
+        await self._send(ws, {'type': 'response.done', 'response': {'id': response_id, 'status': status}})
+        await asyncio.sleep(self.turn_gap_ms / 1000)
+
+    def stats(self):
+        return {
+            'sessions': self.sessions,
+            'tool_calls': len(self.tool_rtts),
+            'cancels': len(self.cancel_rtts),
+            'truncations': len(self.truncations),
+            'deltas_after_barge_in': self.deltas_after_barge_in,
+            'drops': self.drops,
+            'restores': self.restores,
+            'client_audio_bytes': self.client_audio_bytes,
+            'client_events': dict(self.client_events),
+        }
+
+    async def serve(self, host, port):
+        async with websockets.serve(self.handler, host, port):
+            print(f'模擬 Realtime 伺服器已啟動: ws://{host}:{port}')
+            await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本機模擬的 OpenAI Realtime 伺服器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--tool-every', type=int, default=2, help='每幾輪發出一次函式呼叫（0 表示不發出）')
+    parser.add_argument('--jitter-ms', type=int, default=0)
+    parser.add_argument('--barge-in-ms', type=int, help='回應播放幾毫秒後模擬使用者插話')
+    parser.add_argument('--drop-after-turns', type=int, help='每條連線在第幾輪之後中斷一次（測試重新連線）')
+    args = parser.parse_args()
+
+    server = MockRealtimeServer(turns=args.turns, tool_every=args.tool_every, jitter_ms=args.jitter_ms,
+                                barge_in_ms=args.barge_in_ms, drop_after_turns=args.drop_after_turns)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print(f'模擬伺服器統計: {server.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import threading
+import time
+
+import mysql.connector
+
+from medical_tools import CASCADE_TABLES, DB_POOL, DELETE_CHUNK_SIZE, TOOLS, db_cursor, delete_in_chunks
+
+# -----------------------------------------------------
+# 批次刪除病患資料（例如依資料保存政策定期清理）
+# -----------------------------------------------------
+# 與 delete_patient 不同，這裡每一批 DELETE 都各自提交，單一交易持有的鎖最多只有 chunk_size 筆資料列，
+# 批次之間可以暫停 pause 秒讓線上的寫入先進行。中途失敗時已刪除的部分不會回滾，
+# 但每個步驟都可以重複執行，用同樣的病患ID再跑一次就會從中斷的地方繼續。
+#
+# 用法：
+#     python patient_purge.py 12 15 18
+#     python patient_purge.py --ids-file expired_patients.txt --chunk-size 500 --pause 0.05
+
+
+# 在背景執行緒中依序刪除多位病患的所有資料，可隨時查詢進度或要求停止
+class PatientPurge:
+    def __init__(self, patient_ids, chunk_size=DELETE_CHUNK_SIZE, pause=0.0):
+        self.patient_ids = list(dict.fromkeys(patient_ids))
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._started_at = None
+        self._finished_at = None
+        self._progress = {
+            'state': 'pending',
+            'patients_total': len(self.patient_ids),
+            'patients_done': 0,
+            'patients_failed': 0,
+            'current_patient': None,
+            'rows_deleted': {table: 0 for table, _ in CASCADE_TABLES + (('patients', 'id'),)},
+            'chunks': 0,
+            'errors': [],
+        }
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._set(state='running')
+        self._thread = threading.Thread(target=self._run, name='patient-purge', daemon=True)
+        self._thread.start()
+        return self
+
+    # 要求停止：目前這一批刪完後就結束
+    def cancel(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _set(self, **fields):
+        with self._lock:
+            self._progress.update(fields)
+
+    def _run(self):
+        try:
+            for patient_id in self.patient_ids:
+                if self._stop.is_set():
+                    break
+                self._set(current_patient=patient_id)
+                try:
+                    completed = self._purge_patient(patient_id)
+                except mysql.connector.Error as err:
+                    with self._lock:
+                        self._progress['patients_failed'] += 1
+                        self._progress['errors'].append({'patient_id': patient_id, 'error': str(err)})
+                    continue
+                finally:
+                    # 不論成功與否，該病患的快取都已不可靠
+                    TOOLS.cache.invalidate(patient_id)
+                if not completed:
+                    break
+                with self._lock:
+                    self._progress['patients_done'] += 1
+        finally:
+            self._finished_at = time.monotonic()
+            self._set(state='cancelled' if self._stop.is_set() else 'finished', current_patient=None)
+
+    # 刪除單一病患：相關資料表逐批提交，最後在自己的交易中刪除 patients；中途被要求停止時回傳 False
+    def _purge_patient(self, patient_id):
+        with db_cursor() as (connection, cursor):
+            for table, column in CASCADE_TABLES:
+                def after_chunk(deleted, table=table):
+                    connection.commit()
+                    with self._lock:
+                        self._progress['rows_deleted'][table] += deleted
+                        self._progress['chunks'] += 1
+                    if self.pause:
+                        time.sleep(self.pause)
+
+                delete_in_chunks(cursor, table, column, patient_id, self.chunk_size, after_chunk)
+                if self._stop.is_set():
+                    return False
+
+            cursor.execute("DELETE FROM patients WHERE id = %s", (patient_id,))
+            connection.commit()
+            with self._lock:
+                self._progress['rows_deleted']['patients'] += cursor.rowcount
+        return True
+
+    # 目前進度（可從其他執行緒呼叫）
+    def progress(self):
+        with self._lock:
+            progress = {
+                **self._progress,
+                'rows_deleted': dict(self._progress['rows_deleted']),
+                'errors': list(self._progress['errors']),
+            }
+        if self._started_at is not None:
+            end = self._finished_at if self._finished_at is not None else time.monotonic()
+            progress['elapsed_s'] = round(end - self._started_at, 1)
+        return progress
+
+
+def _read_ids(path):
+    with open(path, encoding='utf-8') as f:
+        return [int(line) for line in (line.strip() for line in f) if line and not line.startswith('#')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批次刪除病患的所有資料')
+    parser.add_argument('patient_ids', nargs='*', type=int, help='要刪除的病患ID')
+    parser.add_argument('--ids-file', help='每行一個病患ID的檔案')
+    parser.add_argument('--chunk-size', type=int, default=DELETE_CHUNK_SIZE, help='每個 DELETE 最多刪幾筆')
+    parser.add_argument('--pause', type=float, default=0.0, help='每批刪除後暫停幾秒')
+    parser.add_argument('--report-interval', type=float, default=5.0, help='每隔幾秒印出一次進度')
+    args = parser.parse_args()
+
+    patient_ids = list(args.patient_ids)
+    if args.ids_file:
+        patient_ids.extend(_read_ids(args.ids_file))
+    if not patient_ids:
+        parser.error('請提供至少一個病患ID')
+
+    purge = PatientPurge(patient_ids, chunk_size=args.chunk_size, pause=args.pause).start()
+    try:
+        while not purge.join(args.report_interval):
+            progress = purge.progress()
+            print(f"進度: {progress['patients_done']}/{progress['patients_total']} 位病患，"
+                  f"已刪除 {sum(progress['rows_deleted'].values())} 筆資料")
+    except KeyboardInterrupt:
+        print('正在停止（目前這一批刪完後結束）...')
+        purge.cancel()
+        purge.join()
+    finally:
+        print(f'刪除結果: {purge.progress()}')
+        DB_POOL.close()
+
+
+if __name__ == '__main__':
+    main()
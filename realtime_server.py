@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import urllib.parse
+from http import HTTPStatus
+
+import websockets
+
+from app_logging import logging_stats, setup_logging, shutdown_logging
+from audio_buffers import DropOldestQueue
+from audio_codecs import AUDIO_FORMATS
+from medical_tools import COHORTS, DB_POOL, DB_POOL_SIZE, GUEST, TOOLS, build_session_update
+from metrics import METRICS
+from mic_gate import MicGate
+from realtime_session import RealtimeSession
+from tool_executor import ToolExecutor
+from transcript_writer import TranscriptWriter
+
+# -----------------------------------------------------
+# 多人語音對話伺服器
+# -----------------------------------------------------
+# 瀏覽器或電話閘道透過本機 WebSocket 連線，每條連線是一個獨立的語音對話，
+# 由伺服器轉送到 OpenAI Realtime API：
+# - 用戶端 → 伺服器：二進位訊息為麥克風音訊；文字訊息 {"type": "stop"} 結束對話
+# - 伺服器 → 用戶端：二進位訊息為 AI 的音訊；文字訊息 {"type": "clear"} 表示使用者插話，
+#   用戶端應清空尚未播放的音訊
+# - 音訊格式預設為 pcm16（24kHz、單聲道）；連線網址加上 ?format=g711_ulaw 或 ?format=g711_alaw
+#   時雙向都是 8kHz G.711，與 OpenAI 之間原樣轉送不經過轉碼（適合電話閘道）
+# - GET /stats 回傳所有對話的資源使用統計（JSON）
+# - GET /metrics 回傳延遲直方圖與計數器（Prometheus 文字格式，見 metrics.py）
+# 資料庫連線池、函式呼叫執行緒池、逐字稿寫入與 session 配置（每種音訊格式序列化一次）由所有對話共用。
+# 用戶端的麥克風音訊預設經過 MicGate，靜音不轉送給 OpenAI（回音消除由用戶端負責）。
+
+WS_URL = 'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-12-17'
+
+MAX_SESSIONS = 200              # 同時進行的對話上限，超過時拒絕新連線
+# 所有對話共用的函式呼叫執行緒數：每個函式呼叫都要借一條資料庫連線，執行緒比連線池大只會卡在借連線上、
+# 吃掉逾時時間，所以與連線池大小相同
+TOOL_WORKERS = DB_POOL_SIZE
+TOOL_MAX_PENDING = 256          # 所有對話共用的函式呼叫排隊上限
+TOOL_TIMEOUT = 10               # 單一函式呼叫的逾時秒數
+CLIENT_OUT_MAX_CHUNKS = 500     # 每個用戶端最多暫存幾段尚未送出的 AI 音訊，滿了就丟掉最舊的
+
+_CLIENT_SEND_TIME = METRICS.histogram('client_send_ms')
+
+logger = logging.getLogger(__name__)
+
+
+# 轉送給用戶端的 AI 音訊：實作 RealtimeSession 需要的 write / clear，
+# 資料先放進有上限的佇列，由 ClientSession 的送出任務依序傳給用戶端
+class ClientAudioSink:
+    def __init__(self, max_chunks, on_ready):
+        self.queue = DropOldestQueue(max_chunks, on_put=on_ready)
+        self.on_ready = on_ready
+        self.clear_pending = False
+
+    def write(self, pcm):
+        self.queue.put(bytes(pcm))
+        return len(pcm)
+
+    def clear(self):
+        self.queue.clear()
+        self.clear_pending = True
+        self.on_ready()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def stats(self):
+        return self.queue.stats()
+
+
+# 一個用戶端連線對應的對話狀態：自己的 RealtimeSession、音訊佇列與統計
+class ClientSession:
+    def __init__(self, server, client, session_id, audio_format='pcm16'):
+        self.server = server
+        self.client = client
+        self.session_id = session_id
+        self.audio_format = AUDIO_FORMATS[audio_format]
+        self.started_at = time.monotonic()
+
+        self._out_ready = asyncio.Event()
+        self.audio_out = ClientAudioSink(CLIENT_OUT_MAX_CHUNKS, self._out_ready.set)
+        self.realtime = RealtimeSession(
+            server.url,
+            server.api_key,
+            playback=self.audio_out,
+            tool_executor=server.tool_executor,
+            session_update=build_session_update(GUEST, audio_format),
+            transcripts=server.transcripts,
+            audio_format=audio_format,
+            transcode=False
+        )
+
+        # 用戶端音訊原樣轉送，閘門以解碼後的 pcm16 計算能量
+        self.mic_gate = MicGate(
+            self.audio_format.rate,
+            sample_width=self.audio_format.sample_width,
+            decode=self.audio_format.decode
+        ) if server.mic_gate else None
+        self.client_audio_in_bytes = 0
+        self.client_audio_out_bytes = 0
+        self.invalid_client_messages = 0
+
+    # 執行對話，直到用戶端離線、要求結束或 OpenAI 端關閉連線
+    async def run(self):
+        async with self.realtime:
+            tasks = [
+                asyncio.create_task(self._client_to_realtime()),
+                asyncio.create_task(self._realtime_to_client()),
+                asyncio.create_task(self.realtime.wait_closed()),
+            ]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    # 用戶端的麥克風音訊 → RealtimeSession 的上傳佇列；文字訊息為控制指令（{"type": "stop"}）
+    async def _client_to_realtime(self):
+        try:
+            async for message in self.client:
+                if isinstance(message, bytes):
+                    self.client_audio_in_bytes += len(message)
+                    if self.mic_gate is None:
+                        self.realtime.send_audio(message)
+                        continue
+                    for frame in self.mic_gate.process(message):
+                        self.realtime.send_audio(frame)
+                elif self._control_type(message) == 'stop':
+                    return
+        except websockets.ConnectionClosed:
+            return
+
+    # 控制指令的類型；不是 JSON 物件時略過並計數，不會結束對話（INFO 等級，大量送出時受日誌的頻率限制）
+    def _control_type(self, message):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            self.invalid_client_messages += 1
+            logger.info('對話 %s 收到無效的控制訊息（%d 字），已略過', self.session_id, len(message))
+            return None
+        return payload.get('type')
+
+    # AI 音訊 → 用戶端
+    async def _realtime_to_client(self):
+        try:
+            while True:
+                await self._out_ready.wait()
+                self._out_ready.clear()
+                if self.audio_out.clear_pending:
+                    self.audio_out.clear_pending = False
+                    await self.client.send(json.dumps({'type': 'clear'}))
+                while True:
+                    chunks, _ = self.audio_out.queue.poll_batch(16, 0)
+                    if not chunks:
+                        break
+                    for chunk in chunks:
+                        start = time.perf_counter()
+                        await self.client.send(chunk)
+                        _CLIENT_SEND_TIME.observe_since(start)
+                        self.client_audio_out_bytes += len(chunk)
+        except websockets.ConnectionClosed:
+            return
+
+    def stats(self):
+        return {
+            'session_id': self.session_id,
+            'audio_format': self.audio_format.name,
+            'uptime_s': round(time.monotonic() - self.started_at, 1),
+            'client_audio_in_bytes': self.client_audio_in_bytes,
+            'client_audio_out_bytes': self.client_audio_out_bytes,
+            'invalid_client_messages': self.invalid_client_messages,
+            'mic_gate': self.mic_gate.stats() if self.mic_gate is not None else {},
+            'realtime': self.realtime.stats(),
+        }
+
+
+class RealtimeServer:
+    def __init__(self, url, api_key, max_sessions=MAX_SESSIONS, tool_workers=TOOL_WORKERS, mic_gate=True):
+        if tool_workers > DB_POOL.max_size:
+            raise ValueError(f"tool_workers（{tool_workers}）不可超過資料庫連線池大小（{DB_POOL.max_size}）")
+        self.url = url
+        self.api_key = api_key
+        self.max_sessions = max_sessions
+        self.mic_gate = mic_gate
+        self.tool_executor = ToolExecutor(max_workers=tool_workers, max_pending=TOOL_MAX_PENDING, timeout=TOOL_TIMEOUT)
+        self.transcripts = TranscriptWriter(DB_POOL)
+        self.sessions = {}
+        self._next_id = 1
+        self._rejected = 0
+
+    # 處理一條用戶端連線
+    async def handle_client(self, client):
+        if len(self.sessions) >= self.max_sessions:
+            self._rejected += 1
+            await client.close(1013, 'server busy')
+            return
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(client.path).query)
+        audio_format = query.get('format', ['pcm16'])[0]
+        if audio_format not in AUDIO_FORMATS:
+            await client.close(1008, 'unsupported audio format')
+            return
+
+        session_id = self._next_id
+        self._next_id += 1
+        session = ClientSession(self, client, session_id, audio_format)
+        self.sessions[session_id] = session
+        logger.info('🟢 對話 %s 開始（目前 %d 個）', session_id, len(self.sessions))
+        try:
+            await session.run()
+        except Exception:
+            logger.exception('對話 %s 發生錯誤', session_id)
+        finally:
+            del self.sessions[session_id]
+            logger.info('🔴 對話 %s 結束: %s', session_id, session.stats())
+
+    # GET /stats 回傳統計、GET /metrics 回傳指標，其他路徑照常進行 WebSocket 握手
+    async def process_request(self, path, request_headers):
+        path = urllib.parse.urlsplit(path).path
+        if path == '/stats':
+            body = json.dumps(self.stats(), ensure_ascii=False).encode('utf-8')
+            return HTTPStatus.OK, [('Content-Type', 'application/json; charset=utf-8')], body
+        if path == '/metrics':
+            body = METRICS.prometheus().encode('utf-8')
+            return HTTPStatus.OK, [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')], body
+        return None
+
+    def stats(self):
+        return {
+            'active_sessions': len(self.sessions),
+            'max_sessions': self.max_sessions,
+            'rejected_sessions': self._rejected,
+            'tool_executor': self.tool_executor.stats(),
+            'db_pool': DB_POOL.stats(),
+            'transcripts': self.transcripts.stats(),
+            'tool_cache': TOOLS.cache.stats(),
+            'cohorts': COHORTS.stats(),
+            'logging': logging_stats(),
+            'sessions': [session.stats() for session in self.sessions.values()],
+        }
+
+    async def serve(self, host, port):
+        async with websockets.serve(self.handle_client, host, port, process_request=self.process_request):
+            logger.info('語音對話伺服器已啟動: ws://%s:%s（最多 %d 個對話）', host, port, self.max_sessions)
+            await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多人語音對話伺服器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS)
+    parser.add_argument('--tool-workers', type=int, default=TOOL_WORKERS, help='不可超過資料庫連線池大小')
+    parser.add_argument('--url', default=WS_URL)
+    parser.add_argument('--no-mic-gate', action='store_true', help='轉送用戶端的所有麥克風音訊（包含靜音）')
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--log-file', help='另外寫入的日誌檔')
+    args = parser.parse_args()
+    setup_logging(args.log_level, args.log_file)
+
+    api_key = os.getenv('OPENAI_API_KEY', '')
+    if not api_key:
+        raise ValueError("缺少 API Key，請設定 'OPENAI_API_KEY' 環境變數。")
+
+    server = RealtimeServer(args.url, api_key, max_sessions=args.max_sessions, tool_workers=args.tool_workers,
+                            mic_gate=not args.no_mic_gate)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info('正在關閉伺服器...')
+    finally:
+        server.tool_executor.shutdown()
+        server.transcripts.close()
+        DB_POOL.close()
+        shutdown_logging()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,651 @@
+import asyncio
+import collections
+import json
+import logging
+import random
+import socket
+import time
+from datetime import datetime
+
+import websockets
+
+from audio_buffers import AudioRingBuffer, DropOldestQueue
+from audio_codecs import AUDIO_FORMATS
+from audio_framing import decode_audio, encode_append, parse_audio_delta
+from medical_tools import GUEST, TOOLS, build_role_update, build_session_update
+from metrics import DEPTH_BUCKETS, METRICS
+from tool_executor import ToolExecutor
+from tool_registry import ToolContext
+
+# -----------------------------------------------------
+# OpenAI Realtime 的 asyncio 用戶端
+# -----------------------------------------------------
+
+RATE = AUDIO_FORMATS['pcm16'].rate   # pcm16 的取樣率（Hz）
+MIC_QUEUE_MAX_CHUNKS = 50         # 麥克風佇列最多保留幾個音訊塊，滿了就丟掉最舊的
+PLAYBACK_BUFFER_SECONDS = 120     # 播放緩衝最多可存幾秒的 AI 音訊
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024   # 單一 WebSocket 訊息大小上限
+MAX_UNASSIGNED_TRANSCRIPTS = 200       # 開啟對話前最多暫存幾段逐字稿
+TRANSCRIPT_ORDER_WAIT_S = 5.0          # 前一則對話項目的逐字稿最多等幾秒，之後的逐字稿才不再等它
+CANCELLED_RESPONSES_KEPT = 8           # 記住最近幾個已取消的回應，丟棄它們遲到的音訊
+
+# 連線異常中斷時重新連線：等待時間 RECONNECT_BASE_DELAY × 2^n（上限 RECONNECT_MAX_DELAY），
+# 再乘上 0.5–1 的隨機值，避免大量對話同時重連
+RECONNECT_BASE_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10.0
+RECONNECT_MAX_ATTEMPTS = 8             # 連續失敗幾次後放棄
+RESTORE_MAX_TURNS = 20                 # 重新連線後重送最近幾段對話
+RESTORE_TURN_CHARS = 300               # 每段對話最多重送幾個字
+RESTORE_MAX_CHARS = 3000               # 重送的對話摘要總長度上限
+RESTORE_PROMPT = '（連線中斷後已重新連線）以下是先前的對話紀錄，請直接接續對話，不要重新問候或重新確認身份：\n'
+
+# 所有對話共用的延遲指標（見 metrics.py）
+_SEND_TIME = {kind: METRICS.histogram('ws_send_ms', kind=kind) for kind in ('audio', 'control', 'function_result')}
+_MIC_QUEUE_DEPTH = METRICS.histogram('mic_queue_depth', DEPTH_BUCKETS)
+_RECOVER_TIME = METRICS.histogram('reconnect_recover_ms')
+_EVENT_TIME = {}   # 事件類型 -> ws_event_ms 直方圖
+
+logger = logging.getLogger(__name__)
+
+
+_AUDIO_DELTA_TIME = METRICS.histogram('ws_event_ms', type='response.audio.delta')
+
+
+def _event_timer(event_type):
+    histogram = _EVENT_TIME.get(event_type)
+    if histogram is None:
+        histogram = _EVENT_TIME[event_type] = METRICS.histogram('ws_event_ms', type=event_type)
+    return histogram
+
+
+# 一個與 OpenAI Realtime API 的語音對話：
+# - 由單一事件迴圈擁有 WebSocket：接收任務只負責解析與分派事件，上傳任務負責送出麥克風音訊
+# - 音訊 I/O 透過執行緒安全的佇列 / 緩衝銜接：裝置回呼把麥克風資料放進 mic_queue
+#   （或呼叫 send_audio），AI 音訊寫入 playback（任何有 write / clear 的物件）
+# - 函式呼叫由 tools（ToolRegistry）分派，交給 ToolExecutor 的執行緒池執行，結果經由同一把送出鎖回傳
+# - 一開始只提供確認身份的工具；函式呼叫改變了 context.role 時，先送出該身份的 session.update
+#   （role_update(role) 產生）再回傳結果，之後每一輪只帶該身份需要的工具與指示
+# - 使用者插話（speech_started）時：回應還在產生就送出 response.cancel，AI 音訊還沒播完就以
+#   conversation.item.truncate 把該則回應截斷在實際播放到的位置（讓伺服器的對話紀錄與使用者聽到的一致），
+#   之後才到達的同一個回應的音訊直接丟棄，不解碼也不寫入播放緩衝。
+#   播放位置由 playback.unplayed_bytes()（尚未播放的位元組數）推算；沒有這個方法時以寫入後經過的時間估算
+# - response.audio.done 時呼叫 playback.end_of_stream()（有這個方法時，例如 JitterBuffer），
+#   讓抖動緩衝不再等待預先緩衝，並把播完視為正常結束而不是 underrun
+# - 有傳入 transcripts（TranscriptWriter）時，使用者與 AI 的逐字稿會交給它在背景寫入資料庫；
+#   start_conversation 之前的逐字稿先暫存，開啟對話後再一起寫入。
+#   使用者語音的轉錄常在 AI 開始（甚至結束）回應之後才完成，逐字稿依對話項目建立（conversation.item.created）
+#   的順序與時間記錄：前面的項目還沒有逐字稿時，後面的先保留，最多等 TRANSCRIPT_ORDER_WAIT_S 秒
+# - audio_format 選擇傳輸格式（pcm16 / g711_ulaw / g711_alaw，見 audio_codecs.py）：transcode=True 時
+#   麥克風與播放端仍是該格式取樣率的 pcm16，由這裡編解碼；transcode=False 時音訊原樣轉送
+#   （例如電話閘道本身就是 G.711）
+# - 連線異常中斷（不是伺服器正常關閉）時，以指數退避加隨機抖動重新連線，最多 max_reconnect_attempts 次；
+#   新連線的 session.created 之後重送 session 配置與目前身份的工具，再以一則 system 訊息重送最近的對話摘要，
+#   對話可以在幾秒內接續而不用重來。中斷期間麥克風音訊留在 mic_queue，插話事件則捨棄；
+#   中斷前開始的函式呼叫，結果在中斷期間或重新連線後才完成時也捨棄（call_id 屬於舊連線的回應，
+#   新連線的伺服器不認得），以連線代數（_generation）判斷
+# - 關閉時直接取消任務，不需要輪詢停止旗標
+#
+# 用法：
+#     async with RealtimeSession(url, api_key) as session:
+#         session.send_audio(pcm16_bytes)
+#         await session.wait_closed()
+class RealtimeSession:
+    def __init__(self, url, api_key, *, mic_queue=None, playback=None, tools=None, tool_executor=None,
+                 session_update=None, role_update=None, transcripts=None, mic_batch_ms=60, mic_batch_max_chunks=2,
+                 audio_format='pcm16', transcode=True, reconnect=True, max_reconnect_attempts=RECONNECT_MAX_ATTEMPTS,
+                 force_ipv4=True):
+        self.url = url
+        self.api_key = api_key
+        self.audio_format = AUDIO_FORMATS[audio_format]
+        self._encode = self.audio_format.encode if transcode else None
+        self._decode = self.audio_format.decode if transcode else None
+        # 播放端每秒的位元組數（推算插話時的播放位置用）
+        self.playback_bytes_per_second = self.audio_format.rate * 2 if transcode else self.audio_format.bytes_per_second
+        self.mic_queue = mic_queue if mic_queue is not None else DropOldestQueue(MIC_QUEUE_MAX_CHUNKS)
+        self.playback = playback if playback is not None else AudioRingBuffer(
+            self.playback_bytes_per_second * PLAYBACK_BUFFER_SECONDS
+        )
+        self.tools = tools if tools is not None else TOOLS
+        # session.update 預設使用 medical_tools 快取好的字串，不會在每次 session.created 時重建
+        self.session_update = session_update if session_update is not None else build_session_update(
+            GUEST, self.audio_format.name
+        )
+        self.role_update = role_update if role_update is not None else build_role_update
+        self.context = ToolContext(GUEST)
+        self._session_role = GUEST    # 伺服器目前使用的工具與指示所對應的身份
+        self.transcripts = transcripts
+        self._unassigned_transcripts = collections.deque(maxlen=MAX_UNASSIGNED_TRANSCRIPTS)
+        # 等待逐字稿的對話項目（依建立順序）：item_id -> [角色, 建立時間, 逐字稿或 None, 最多等到的時間]
+        self._transcript_items = collections.OrderedDict()
+        self.mic_batch_seconds = mic_batch_ms / 1000
+        self.mic_batch_max_chunks = mic_batch_max_chunks
+        self.force_ipv4 = force_ipv4
+        self.reconnect = reconnect
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self._history = collections.deque(maxlen=RESTORE_MAX_TURNS)    # 重新連線後重送的 (角色, 逐字稿)
+        self._disconnected_at = None    # 連線中斷的時間；重送完對話摘要後清除
+        self._generation = 0            # 連線代數，每次重新連線加一
+
+        # 沒有傳入共用的執行緒池時，自己建立一個並在關閉時一併停止
+        self._owns_executor = tool_executor is None
+        self.tool_executor = tool_executor if tool_executor is not None else ToolExecutor()
+
+        self._ws = None
+        self._loop = None
+        self._send_lock = None
+        self._mic_ready = None
+        self._connected = None
+        self._supervisor_task = None
+        self._uplink_task = None
+        self._background_tasks = set()
+
+        # 目前的回應與正在播放的 AI 音訊（插話時取消 / 截斷用）
+        self._response_id = None
+        self._response_active = False
+        self._audio_item = None             # (item_id, content_index)
+        self._audio_item_bytes = 0          # 這則音訊已寫入播放緩衝的位元組數
+        self._audio_item_started_at = 0.0   # 第一段音訊寫入的時間
+        self._cancelled_responses = collections.deque(maxlen=CANCELLED_RESPONSES_KEPT)
+
+        self._stats = {
+            'events': 0,
+            'bad_events': 0,    # 格式錯誤或處理失敗而略過的事件
+            'audio_in_bytes': 0,
+            'audio_out_bytes': 0,
+            'audio_messages_out': 0,
+            'tool_calls': 0,
+            'role_updates': 0,
+            'transcripts': 0,
+            'transcripts_missing': 0,    # 等不到逐字稿而略過的對話項目
+            'barge_ins': 0,
+            'responses_cancelled': 0,
+            'items_truncated': 0,
+            'late_deltas_dropped': 0,
+            'late_bytes_dropped': 0,
+            'reconnects': 0,
+            'reconnect_attempts': 0,
+            'reconnect_failures': 0,
+            'stale_tool_results': 0,    # 重新連線前開始、之後才完成而捨棄的函式呼叫結果
+            'last_recover_ms': 0.0,
+            'max_recover_ms': 0.0,
+        }
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # 建立 WebSocket 連線並啟動接收 / 上傳任務
+    async def connect(self):
+        self._loop = asyncio.get_running_loop()
+        self._send_lock = asyncio.Lock()
+        self._mic_ready = asyncio.Event()
+        self._connected = asyncio.Event()
+
+        self._ws = await self._open()
+        self._connected.set()
+        logger.info('已連接到 OpenAI WebSocket')
+
+        # 麥克風佇列有新資料時喚醒上傳任務（可能從 PortAudio 執行緒呼叫）
+        self.mic_queue.on_put = self._wake_uplink
+        self._supervisor_task = asyncio.create_task(self._supervise())
+        self._uplink_task = asyncio.create_task(self._uplink_loop())
+
+    async def _open(self):
+        extra = {'family': socket.AF_INET} if self.force_ipv4 else {}
+        return await websockets.connect(
+            self.url,
+            extra_headers={
+                'Authorization': f'Bearer {self.api_key}',
+                'OpenAI-Beta': 'realtime=v1'
+            },
+            max_size=MAX_MESSAGE_BYTES,
+            **extra
+        )
+
+    # 關閉連線：取消所有任務並關閉 WebSocket
+    async def close(self):
+        self.mic_queue.on_put = None
+        tasks = [task for task in (self._uplink_task, self._supervisor_task) if task is not None]
+        tasks.extend(self._background_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 不會再有逐字稿，保留中的直接送出
+        self._release_transcripts(force=True)
+
+        if self._ws is not None:
+            await self._ws.close()
+            logger.info('WebSocket 連接已關閉')
+        if self._owns_executor:
+            self.tool_executor.shutdown()
+
+    # 等待伺服器關閉連線（或重新連線失敗）
+    async def wait_closed(self):
+        if self._supervisor_task is not None:
+            await asyncio.shield(self._supervisor_task)
+
+    # 送出一段 pcm16 麥克風音訊（執行緒安全，不會阻塞）
+    def send_audio(self, pcm):
+        self.mic_queue.put(pcm)
+
+    # 透過送出鎖傳送一則文字訊息，確保訊息一則一則完整送出；kind 為 ws_send_ms 的標籤
+    async def send_text(self, message, kind='control'):
+        start = time.perf_counter()
+        async with self._send_lock:
+            await self._ws.send(message)
+        _SEND_TIME[kind].observe_since(start)
+
+    async def send_json(self, event, kind='control'):
+        await self.send_text(json.dumps(event), kind)
+
+    def _wake_uplink(self):
+        try:
+            self._loop.call_soon_threadsafe(self._mic_ready.set)
+        except RuntimeError:
+            # 事件迴圈已關閉
+            pass
+
+    # 上傳任務：等待麥克風資料，並在延遲預算內把多個音訊塊合併成一則 input_audio_buffer.append
+    async def _uplink_loop(self):
+        while True:
+            # 重新連線期間音訊留在佇列中
+            await self._connected.wait()
+            self._mic_ready.clear()
+            _MIC_QUEUE_DEPTH.observe(len(self.mic_queue))
+            mic_chunks, delay = self.mic_queue.poll_batch(self.mic_batch_max_chunks, self.mic_batch_seconds)
+            if mic_chunks:
+                audio = b''.join(mic_chunks)
+                if self._encode is not None:
+                    audio = self._encode(audio)
+                try:
+                    await self.send_text(encode_append(audio), 'audio')
+                except websockets.ConnectionClosed:
+                    # 這一批丟棄，等待重新連線（_supervise 可能已經換上新的連線）
+                    if self._ws.closed:
+                        self._connected.clear()
+                    continue
+                self._stats['audio_out_bytes'] += len(audio)
+                self._stats['audio_messages_out'] += 1
+                continue
+            try:
+                # delay 為 None 代表佇列為空，一直等到有新資料
+                await asyncio.wait_for(self._mic_ready.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    # 接收事件直到連線結束；伺服器以 1000 正常結束對話、或重新連線失敗時結束，
+    # 其他情況（網路中斷、伺服器重啟的 1001 等）重新連線
+    async def _supervise(self):
+        while True:
+            await self._receive_loop()
+            if self._ws.close_code == 1000 or not self.reconnect:
+                return
+            self._connected.clear()
+            if self._disconnected_at is None:
+                self._disconnected_at = time.monotonic()
+            # 中斷前的回應不會再有後續事件，已收到的音訊照常播完
+            self._response_id = None
+            self._response_active = False
+            self._audio_item = None
+            self._release_transcripts(force=True)
+            end_of_stream = getattr(self.playback, 'end_of_stream', None)
+            if end_of_stream is not None:
+                end_of_stream()
+            if not await self._reconnect():
+                return
+
+    # 以指數退避加隨機抖動重新連線；成功時回傳 True
+    async def _reconnect(self):
+        for attempt in range(self.max_reconnect_attempts):
+            delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.info('%.1f 秒後重新連線（第 %d 次）', delay, attempt + 1)
+            await asyncio.sleep(delay)
+            self._stats['reconnect_attempts'] += 1
+            try:
+                ws = await self._open()
+            except websockets.InvalidStatusCode as e:
+                # API Key 錯誤之類的問題重試也不會成功
+                if e.status_code in (401, 403):
+                    logger.error('重新連線被拒絕: %s', e)
+                    break
+                logger.warning('重新連線失敗: %s', e)
+                continue
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                logger.warning('重新連線失敗: %s', e)
+                continue
+            self._ws = ws
+            self._generation += 1
+            # 新連線的伺服器端是預設配置，session.created 後重送
+            self._session_role = GUEST
+            self._stats['reconnects'] += 1
+            self._connected.set()
+            logger.info('已重新連接到 OpenAI WebSocket')
+            return True
+        self._stats['reconnect_failures'] += 1
+        logger.error('無法重新連線，結束對話')
+        return False
+
+    # 接收任務：只負責解析與分派事件，不做任何阻塞的工作；每種事件的處理時間記錄在 ws_event_ms。
+    # 音訊事件走 audio_framing 的快速路徑，不完整解析整則 JSON
+    # 單一事件格式錯誤或處理時發生例外只略過該事件並計數，不會結束對話
+    async def _receive_loop(self):
+        try:
+            async for message in self._ws:
+                try:
+                    self._handle_message(message)
+                except Exception:
+                    self._stats['bad_events'] += 1
+                    logger.exception('處理 WebSocket 事件時發生錯誤，已略過（%d 字）', len(message))
+        except websockets.ConnectionClosed as e:
+            logger.warning('WebSocket 連線中斷: %s', e)
+        finally:
+            logger.debug('接收任務結束')
+
+    def _handle_message(self, message):
+        start = time.perf_counter()
+        audio_delta = parse_audio_delta(message)
+        if audio_delta is not None:
+            self._stats['events'] += 1
+            self._handle_audio_delta(*audio_delta)
+            _AUDIO_DELTA_TIME.observe_since(start)
+            return
+        event = json.loads(message)
+        self._handle_event(event)
+        _event_timer(event['type']).observe_since(start)
+
+    def _handle_event(self, message):
+        event_type = message['type']
+        self._stats['events'] += 1
+        logger.debug('⚡️ 收到 WebSocket 事件: %s', event_type)
+
+        # session.created 代表成功建立會話
+        if event_type == 'session.created':
+            self._spawn(self._send_session_update())
+
+        # response.audio.delta 代表 AI 端傳來新的音訊資料
+        elif event_type == 'response.audio.delta':
+            self._handle_audio_delta(message, message['delta'])
+
+        # input_audio_buffer.speech_started 表示伺服器偵測到使用者語音開始
+        elif event_type == 'input_audio_buffer.speech_started':
+            logger.info('🔵 語音開始，清空緩衝並停止播放')
+            self._barge_in()
+            self.playback.clear()
+
+        # 回應開始 / 結束，記錄目前的回應ID
+        elif event_type == 'response.created':
+            self._response_id = message.get('response', {}).get('id')
+            self._response_active = True
+        elif event_type == 'response.done':
+            if message.get('response', {}).get('id') == self._response_id:
+                self._response_active = False
+            # 回應已結束（例如被取消），沒有逐字稿的 AI 項目不再等待
+            for item in message.get('response', {}).get('output') or ():
+                entry = self._transcript_items.get(item.get('id'))
+                if entry is not None and entry[0] == 'assistant' and entry[2] is None:
+                    del self._transcript_items[item['id']]
+            self._release_transcripts()
+
+        # response.audio.done 代表 AI 語音播放結束
+        elif event_type == 'response.audio.done':
+            logger.debug('🔵 AI 語音播放結束')
+            end_of_stream = getattr(self.playback, 'end_of_stream', None)
+            if end_of_stream is not None:
+                end_of_stream()
+
+        # 對話項目建立的順序就是實際的發言順序，逐字稿依此排序
+        elif event_type == 'conversation.item.created':
+            self._add_transcript_item(message.get('item') or {})
+
+        # 使用者語音的轉錄（whisper-1）完成 / 失敗
+        elif event_type == 'conversation.item.input_audio_transcription.completed':
+            self._record_transcript('user', message.get('transcript', ''), message.get('item_id'))
+        elif event_type == 'conversation.item.input_audio_transcription.failed':
+            self._record_transcript('user', '', message.get('item_id'))
+
+        # AI 語音回應的逐字稿 / 純文字回應完成
+        elif event_type == 'response.audio_transcript.done':
+            self._record_transcript('assistant', message.get('transcript', ''), message.get('item_id'))
+        elif event_type == 'response.text.done':
+            self._record_transcript('assistant', message.get('text', ''), message.get('item_id'))
+
+        # response.function_call_arguments.done 代表 AI 執行函式呼叫參數已傳完
+        elif event_type == 'response.function_call_arguments.done':
+            self._stats['tool_calls'] += 1
+            self._spawn(self._run_function_call(
+                message.get('name', ''),
+                message.get('call_id', ''),
+                message.get('arguments', '{}')
+            ))
+
+    # message 為事件的其他欄位，delta 為 base64 音訊
+    def _handle_audio_delta(self, message, delta):
+        # 已取消的回應遲到的音訊：不解碼直接丟棄
+        response_id = message.get('response_id')
+        if response_id is not None and response_id in self._cancelled_responses:
+            self._stats['late_deltas_dropped'] += 1
+            self._stats['late_bytes_dropped'] += len(delta) * 3 // 4
+            return
+        item = (message.get('item_id'), message.get('content_index', 0))
+        if item != self._audio_item:
+            self._audio_item = item
+            self._audio_item_bytes = 0
+            self._audio_item_started_at = time.monotonic()
+        audio_content = decode_audio(delta)
+        self._stats['audio_in_bytes'] += len(audio_content)    # 傳輸的位元組數（解碼前）
+        if self._decode is not None:
+            audio_content = self._decode(audio_content)
+        self.playback.write(audio_content)
+        self._audio_item_bytes += len(audio_content)
+        logger.debug('🔵 收到 %d 位元組，總緩衝大小: %d', len(audio_content), len(self.playback))
+
+    # 目前這則 AI 音訊實際播放到第幾毫秒
+    def _played_ms(self):
+        unplayed_bytes = getattr(self.playback, 'unplayed_bytes', None)
+        if unplayed_bytes is not None:
+            played = max(0, self._audio_item_bytes - unplayed_bytes())
+        else:
+            elapsed = time.monotonic() - self._audio_item_started_at
+            played = min(self._audio_item_bytes, int(elapsed * self.playback_bytes_per_second))
+        return played * 1000 // self.playback_bytes_per_second
+
+    # 使用者插話：取消產生中的回應、把播到一半的音訊截斷在實際播放的位置（需在清空播放緩衝前呼叫）
+    def _barge_in(self):
+        events = []
+        if self._response_active:
+            events.append({'type': 'response.cancel'})
+            # 還不知道回應ID（response.created 沒有帶 id）時只取消，不記錄；
+            # 記錄 None 會讓之後所有沒有 response_id 的音訊都被丟棄
+            if self._response_id is not None:
+                self._cancelled_responses.append(self._response_id)
+            self._response_active = False
+            self._stats['responses_cancelled'] += 1
+        if self._audio_item is not None:
+            audio_end_ms = self._played_ms()
+            if audio_end_ms < self._audio_item_bytes * 1000 // self.playback_bytes_per_second:
+                item_id, content_index = self._audio_item
+                events.append({
+                    'type': 'conversation.item.truncate',
+                    'item_id': item_id,
+                    'content_index': content_index,
+                    'audio_end_ms': audio_end_ms,
+                })
+                self._stats['items_truncated'] += 1
+            self._audio_item = None
+        if events:
+            self._stats['barge_ins'] += 1
+            self._spawn(self._send_events(events))
+
+    async def _send_events(self, events):
+        try:
+            for event in events:
+                await self.send_json(event)
+        except websockets.ConnectionClosed as e:
+            logger.warning('傳送 %s 失敗: %s', events[0]['type'], e)
+
+    # 建立背景任務並追蹤，關閉時一併取消
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    # 新的使用者 / AI 對話項目：記住建立的順序與時間，等它的逐字稿
+    def _add_transcript_item(self, item):
+        role = item.get('role')
+        if item.get('type') != 'message' or role not in ('user', 'assistant') or not item.get('id'):
+            return
+        self._transcript_items[item['id']] = [role, datetime.now(), None, time.monotonic() + TRANSCRIPT_ORDER_WAIT_S]
+
+    # 收到一則逐字稿（text 為空代表這個項目不會有逐字稿）；沒有看過建立事件的項目排在最後
+    def _record_transcript(self, role, text, item_id=None):
+        entry = self._transcript_items.get(item_id)
+        if not text:
+            if entry is not None:
+                del self._transcript_items[item_id]
+                self._release_transcripts()
+            return
+        if entry is None:
+            entry = [role, datetime.now(), None, 0.0]
+            self._transcript_items[item_id if item_id is not None else object()] = entry
+        entry[2] = text
+        self._release_transcripts()
+
+    # 依項目順序送出已有逐字稿的部分：記住最近的對話（重新連線後重送），並交給背景寫入；
+    # 最前面的項目還在等逐字稿就停下來，超過等待時間（或 force）則略過它
+    def _release_transcripts(self, force=False):
+        now = time.monotonic()
+        released = False
+        while self._transcript_items:
+            key, (role, created_at, text, wait_until) = next(iter(self._transcript_items.items()))
+            if text is None:
+                if not force and now < wait_until:
+                    break
+                self._stats['transcripts_missing'] += 1
+            else:
+                self._history.append((role, text))
+                if self.transcripts is not None:
+                    self._unassigned_transcripts.append((role, text, created_at))
+                    released = True
+            del self._transcript_items[key]
+        if released:
+            self._flush_transcripts()
+
+    def _flush_transcripts(self):
+        conversation_id = self.context.conversation_id
+        if conversation_id is None:
+            return
+        patient_id = self.context.patient_id
+        while self._unassigned_transcripts:
+            role, text, created_at = self._unassigned_transcripts.popleft()
+            self.transcripts.add(conversation_id, patient_id, role, text, created_at)
+            self._stats['transcripts'] += 1
+
+    # session.created 後傳送 session 配置；重新連線時再送出目前身份的工具與對話摘要
+    async def _send_session_update(self):
+        logger.info('傳送 session 更新（%d 字元）', len(self.session_update))
+        try:
+            await self.send_text(self.session_update)
+            if self._disconnected_at is None:
+                return
+            role = self.context.role
+            if role != self._session_role:
+                await self.send_text(self.role_update(role))
+                self._session_role = role
+            if self._history:
+                summary = self._conversation_summary()
+                await self.send_json({
+                    'type': 'conversation.item.create',
+                    'item': {'type': 'message', 'role': 'system', 'content': [{'type': 'input_text', 'text': summary}]},
+                })
+                # 摘要包含病患資料，只記錄長度
+                logger.info('已重送對話摘要（%d 段，%d 字）', len(self._history), len(summary))
+        except websockets.ConnectionClosed as e:
+            logger.warning('傳送 session 更新失敗: %s', e)
+            return
+        recover_ms = (time.monotonic() - self._disconnected_at) * 1000
+        self._disconnected_at = None
+        _RECOVER_TIME.observe(recover_ms)
+        self._stats['last_recover_ms'] = round(recover_ms, 1)
+        self._stats['max_recover_ms'] = max(self._stats['max_recover_ms'], round(recover_ms, 1))
+        logger.info('對話已恢復（%.0f ms）', recover_ms)
+
+    # 最近的對話紀錄：每段最多 RESTORE_TURN_CHARS 字，由新往舊累計到 RESTORE_MAX_CHARS 為止
+    def _conversation_summary(self):
+        lines = []
+        total = 0
+        for role, text in reversed(self._history):
+            line = f"{'使用者' if role == 'user' else 'AI'}: {text[:RESTORE_TURN_CHARS]}"
+            total += len(line) + 1
+            if lines and total > RESTORE_MAX_CHARS:
+                break
+            lines.append(line)
+        return RESTORE_PROMPT + '\n'.join(reversed(lines))
+
+    # 在執行緒池執行函式呼叫，完成（或逾時）後將結果回傳給伺服器
+    async def _run_function_call(self, name, call_id, arguments):
+        generation = self._generation
+        done = self._loop.create_future()
+
+        def on_done(result):
+            try:
+                self._loop.call_soon_threadsafe(_set_result, done, result)
+            except RuntimeError:
+                pass
+
+        self.tool_executor.submit(self.tools.call, (name, arguments, self.context), on_done)
+        result = await done
+        if self.transcripts is not None:
+            # 函式呼叫可能開啟了對話，把暫存的逐字稿寫入
+            self._flush_transcripts()
+        await self._send_function_call_result(result, call_id, generation)
+
+    # 將函式呼叫結果回傳給伺服器，結果與 response.create 一起送出，中間不會插入其他訊息；
+    # 身份有變時先送出新的 session.update，讓接下來的回應使用新的工具；
+    # generation 為開始執行時的連線代數，之後重新連線過就捨棄結果（身份的改變仍保留在 context）
+    async def _send_function_call_result(self, result, call_id, generation):
+        result_json = {
+            "type": "conversation.item.create",
+            "item": {
+                "type": "function_call_output",
+                "output": result,
+                "call_id": call_id
+            }
+        }
+        start = time.perf_counter()
+        try:
+            async with self._send_lock:
+                if generation != self._generation:
+                    self._stats['stale_tool_results'] += 1
+                    logger.warning('連線已重新建立，捨棄函式呼叫結果（%s）', call_id)
+                    return
+                role = self.context.role
+                if role != self._session_role:
+                    await self._ws.send(self.role_update(role))
+                    self._session_role = role
+                    self._stats['role_updates'] += 1
+                    logger.info('已切換為 %s 的工具與指示', role)
+                await self._ws.send(json.dumps(result_json))
+                await self._ws.send(json.dumps({"type": "response.create"}))
+            _SEND_TIME['function_result'].observe_since(start)
+            # 結果可能包含病患資料，只記錄長度
+            logger.info('已傳送函式呼叫結果（%s，%d 字）', call_id, len(result))
+        except websockets.ConnectionClosed as e:
+            logger.warning('傳送函式呼叫結果失敗: %s', e)
+
+    # 這個對話的資源使用統計
+    def stats(self):
+        return {
+            **self._stats,
+            'role': self.context.role,
+            'mic_queue': self.mic_queue.stats(),
+            'playback': self.playback.stats() if hasattr(self.playback, 'stats') else {},
+        }
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
@@ -0,0 +1,124 @@
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# -----------------------------------------------------
+# 串流取樣率轉換（音效卡原生取樣率 ↔ 傳輸格式的取樣率）
+# -----------------------------------------------------
+# 許多 USB 耳機與電話橋接只支援 16kHz 或 48kHz，音效卡改用原生取樣率開啟，由這裡在 PortAudio 回呼中轉換：
+# - 有理數比例 L/M（例如 16k→24k 為 3/2、48k→24k 為 1/2、44.1k→24k 為 80/147）的多相 FIR：
+#   以 Kaiser 窗的 sinc 設計一個低通濾波器（截止頻率為兩者中較低的 Nyquist × cutoff），
+#   拆成 L 組、每組 taps 個係數，只計算實際輸出的樣本，不會真的插零再抽取
+# - 一個音訊塊的所有輸出樣本以 NumPy 一次計算：以 sliding_window_view 取出每個輸出的輸入視窗
+#   （整列複製，比逐元素索引快 3–4 倍），與對應相位的係數（預先反轉）逐列內積
+# - 上一塊尾端的輸入樣本與相位保留在物件中，音訊塊之間沒有接縫；
+#   額外延遲約為 taps / 2 個輸入樣本（16kHz→24kHz 時約 1.5ms，48kHz→24kHz 時約 1ms）
+# - 取樣率相同時原樣回傳，不做任何運算
+#
+# 用法：
+#     mic_resampler = StreamingResampler(48000, 24000)
+#     pcm = mic_resampler.process(in_data)                  # 輸出長度隨音訊塊變化
+#     need = speaker_resampler.input_needed(frame_count)    # 播放端：剛好產生 frame_count 個樣本
+#     out = speaker_resampler.process(wire_pcm, frame_count)
+
+RESAMPLER_TAPS = 48       # 每個相位的係數數量（降取樣時再乘上 M/L）
+RESAMPLER_CUTOFF = 0.9    # 截止頻率（相對於較低的 Nyquist 頻率）
+RESAMPLER_BETA = 8.0      # Kaiser 窗參數（阻帶衰減約 80dB）
+
+
+# 多相濾波器係數：shape (L, taps)，第 p 列給相位 p 使用，第 k 個係數乘上往前第 k 個輸入樣本
+def design_polyphase(up, down, taps=RESAMPLER_TAPS, cutoff=RESAMPLER_CUTOFF, beta=RESAMPLER_BETA):
+    length = taps * up
+    # 以插零後的取樣率為準的截止頻率（相對於該取樣率的 Nyquist）
+    fc = cutoff / max(up, down)
+    n = np.arange(length) - (length - 1) / 2
+    h = fc * np.sinc(fc * n) * np.kaiser(length, beta)
+    h *= up / h.sum()     # 插零會讓振幅變成 1/L，補回來
+    return h.reshape(taps, up).T.astype(np.float32).copy()
+
+
+class StreamingResampler:
+    def __init__(self, in_rate, out_rate, taps=RESAMPLER_TAPS, cutoff=RESAMPLER_CUTOFF, beta=RESAMPLER_BETA):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        g = math.gcd(in_rate, out_rate)
+        self.up = out_rate // g
+        self.down = in_rate // g
+        # 降取樣時過渡帶要落在較低的 Nyquist 以內，係數數量依比例增加
+        self.taps = taps * max(1, -(-self.down // self.up))
+        self.passthrough = in_rate == out_rate
+        # 反轉成與輸入視窗（由舊到新）相同的順序
+        self._filters = None if self.passthrough else design_polyphase(self.up, self.down, self.taps, cutoff, beta)[:, ::-1].copy()
+        self.reset()
+
+        self._chunks = 0
+        self._samples_in = 0
+        self._samples_out = 0
+
+    # 清掉保留的輸入樣本與相位（例如使用者插話清空播放緩衝時）
+    def reset(self):
+        # 前面補 taps - 1 個靜音樣本，第一個輸出樣本就有完整的輸入視窗
+        self._buf = np.zeros(self.taps - 1, dtype=np.float32)
+        self._pos = (self.taps - 1) * self.up    # 下一個輸出樣本的位置（以插零後的樣本為單位，相對於 _buf 開頭）
+
+    # 要剛好產生 n_out 個輸出樣本還需要幾個輸入樣本
+    def input_needed(self, n_out):
+        if self.passthrough:
+            return n_out
+        if n_out <= 0:
+            return 0
+        last = (self._pos + (n_out - 1) * self.down) // self.up
+        return max(0, last + 1 - len(self._buf))
+
+    # input_needed(n_out) 的上限（與目前相位無關），用來預先配置播放端的讀取暫存區
+    def max_input_needed(self, n_out):
+        if self.passthrough or n_out <= 0:
+            return max(0, n_out)
+        return -(-n_out * self.down // self.up) + 1
+
+    # pcm16 → pcm16；max_out 限制輸出樣本數，用不到的輸入留到下一次
+    def process(self, pcm, max_out=None):
+        self._chunks += 1
+        self._samples_in += len(pcm) // 2
+        if self.passthrough:
+            self._samples_out += len(pcm) // 2
+            return pcm
+        samples = np.frombuffer(pcm, dtype='<i2')
+        buf = np.concatenate((self._buf, samples.astype(np.float32)))
+
+        # 輸入足夠的輸出樣本數：位置 pos + k * down 對應的輸入索引不超過最後一個樣本
+        available = (len(buf) * self.up - 1 - self._pos) // self.down + 1 if len(buf) * self.up > self._pos else 0
+        count = available if max_out is None else min(max_out, available)
+        positions = self._pos + np.arange(count) * self.down
+        out = np.zeros(0, dtype=np.float32)
+        if count:
+            # 第 n 個輸出樣本使用輸入 index - taps + 1 .. index
+            start = positions // self.up - (self.taps - 1)
+            windows = sliding_window_view(buf, self.taps)[start]
+            out = np.einsum('nk,nk->n', windows, self._filters[positions % self.up])
+
+        # 保留下一個輸出樣本需要的輸入視窗
+        self._pos += count * self.down
+        drop = max(0, self._pos // self.up - (self.taps - 1))
+        self._buf = buf[drop:]
+        self._pos -= drop * self.up
+
+        self._samples_out += count
+        return np.clip(np.rint(out), -32768, 32767).astype('<i2').tobytes()
+
+    # 額外延遲（毫秒）
+    @property
+    def delay_ms(self):
+        return 0.0 if self.passthrough else (self.taps - 1) / 2 * 1000 / self.in_rate
+
+    def stats(self):
+        return {
+            'in_rate': self.in_rate,
+            'out_rate': self.out_rate,
+            'ratio': f'{self.up}/{self.down}',
+            'delay_ms': round(self.delay_ms, 2),
+            'chunks': self._chunks,
+            'samples_in': self._samples_in,
+            'samples_out': self._samples_out,
+        }
@@ -0,0 +1,18 @@
+-- 分頁查詢（keyset pagination）使用的複合索引
+-- 每一頁都從索引中上一頁最後一筆之後開始讀，不需要排序或略過前面的資料列
+
+-- get_conversation_sessions：WHERE patient_id = ? ORDER BY created_at DESC, id DESC
+CREATE INDEX idx_conversation_sessions_patient_created
+    ON conversation_sessions (patient_id, created_at, id);
+
+-- get_patient_conversation：WHERE patient_id = ? AND session_id = ? ORDER BY created_at, id
+CREATE INDEX idx_conversation_messages_patient_session_created
+    ON conversation_messages (patient_id, session_id, created_at, id);
+
+-- get_doctor_reports：WHERE patient_id = ? ORDER BY created_at DESC, id DESC
+CREATE INDEX idx_doctor_reports_patient_created
+    ON doctor_reports (patient_id, created_at, id);
+
+-- get_patient_feedback：WHERE patient_id = ? ORDER BY created_at DESC, id DESC
+CREATE INDEX idx_patient_feedback_patient_created
+    ON patient_feedback (patient_id, created_at, id);
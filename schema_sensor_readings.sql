@@ -0,0 +1,29 @@
+-- 健康指標的時間序列：每筆 patient_records 的身高、體重與各項感測器數據各存成一列，
+-- 趨勢與族群統計直接以索引讀取，不需要解析 sensor_data 的 JSON
+CREATE TABLE sensor_readings (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    patient_id INT NOT NULL,
+    record_id INT NOT NULL,
+    metric VARCHAR(32) NOT NULL,
+    value DOUBLE NOT NULL,
+    measured_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_sensor_readings_patient_metric_time (patient_id, metric, measured_at, id),
+    INDEX idx_sensor_readings_record (record_id, metric)
+);
+
+-- 舊資料轉換（只需執行一次）：把既有 patient_records 的數值寫入 sensor_readings。
+-- 與 medical_tools.backfill_sensor_readings() 相同，新增感測器欄位時兩邊都要更新。
+INSERT INTO sensor_readings (patient_id, record_id, metric, value)
+SELECT src.patient_id, src.id, src.metric, src.value FROM (
+    SELECT id, patient_id, 'height' AS metric, height AS value FROM patient_records
+    UNION ALL
+    SELECT id, patient_id, 'weight', weight FROM patient_records
+    UNION ALL
+    SELECT id, patient_id, 'grip', CAST(JSON_UNQUOTE(JSON_EXTRACT(sensor_data, '$.grip')) AS DECIMAL(12, 4))
+    FROM patient_records
+    UNION ALL
+    SELECT id, patient_id, 'sit_up', CAST(JSON_UNQUOTE(JSON_EXTRACT(sensor_data, '$.sit_up')) AS DECIMAL(12, 4))
+    FROM patient_records
+) AS src
+WHERE src.value IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM sensor_readings r WHERE r.record_id = src.id);
@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+# -----------------------------------------------------
+# 感測器 / 健康數據分析（NumPy 向量化運算）
+# -----------------------------------------------------
+# 數據來源是 sensor_readings 資料表（每筆量測一列：patient_id, record_id, metric, value, measured_at），
+# 這裡只處理陣列運算，不直接連資料庫：
+# - trend()：單一病人、單一指標的變化趨勢（最小平方法斜率）
+# - bmi() / bmi_category()：由身高體重計算 BMI 與分級
+# - CohortSnapshot：所有病人各指標最新一筆數值的欄式快照，用來計算族群百分位數
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+# 衛福部成人 BMI 分級：< 18.5 過輕、18.5–24 正常、24–27 過重、≥ 27 肥胖
+BMI_THRESHOLDS = np.array([18.5, 24.0, 27.0])
+BMI_LABELS = ("過輕", "正常", "過重", "肥胖")
+
+COHORT_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+# datetime 序列 → 秒數（float64 陣列）
+def to_seconds(times):
+    return np.asarray(times, dtype='datetime64[us]').astype('int64') / 1e6
+
+
+# 依時間排序的一組量測值的趨勢摘要；slope_per_30d 為最小平方法求得的每 30 天變化量
+def trend(seconds, values):
+    seconds = np.asarray(seconds, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    days = (seconds - seconds[0]) / SECONDS_PER_DAY
+    if len(values) >= 2 and days[-1] > 0:
+        centered = days - days.mean()
+        slope = float(np.dot(centered, values - values.mean()) / np.dot(centered, centered)) * 30
+    else:
+        slope = 0.0
+    first, last = float(values[0]), float(values[-1])
+    return {
+        'count': len(values),
+        'first': first,
+        'last': last,
+        'change': last - first,
+        'change_pct': (last - first) / first * 100 if first else None,
+        'mean': float(values.mean()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'days': float(days[-1]),
+        'slope_per_30d': slope,
+    }
+
+
+# BMI = 體重(公斤) / 身高(公尺)²，可傳入純量或陣列
+def bmi(height_cm, weight_kg):
+    height_m = np.asarray(height_cm, dtype=np.float64) / 100
+    return np.asarray(weight_kg, dtype=np.float64) / (height_m * height_m)
+
+
+def bmi_category(value):
+    return BMI_LABELS[int(np.searchsorted(BMI_THRESHOLDS, value, side='right'))]
+
+
+# value 在 values 中的百分位等級（0–100，相同數值算一半）
+def percentile_rank(values, value):
+    below = np.count_nonzero(values < value)
+    equal = np.count_nonzero(values == value)
+    return (below + 0.5 * equal) / len(values) * 100
+
+
+# 依 record_id 對齊同一筆紀錄的身高與體重，回傳 (record_id, BMI) 陣列
+def bmi_by_record(height_records, heights, weight_records, weights):
+    records, h_index, w_index = np.intersect1d(height_records, weight_records, return_indices=True)
+    return records, bmi(np.asarray(heights)[h_index], np.asarray(weights)[w_index])
+
+
+# 族群快照：每個指標一組欄式陣列（病人ID、最新數值、年齡、性別），另外由身高體重推導出 bmi。
+# load() 回傳 [(patient_id, metric, value, age, gender)]；快照過期時在背景執行緒重新載入，
+# 查詢只讀取目前的快照，不會等待資料庫（第一次查詢除外）。
+class CohortSnapshot:
+    def __init__(self, load, refresh_interval=300.0):
+        self._load = load
+        self.refresh_interval = refresh_interval
+        self._columns = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._stats = {
+            'reloads': 0,
+            'reload_failures': 0,
+            'last_reload_ms': 0.0,
+            'patients': 0,
+        }
+
+    def _build(self, rows):
+        columns = {}
+        if not rows:
+            return columns
+        patient_ids, metrics, values, ages, genders = (np.asarray(column) for column in zip(*rows))
+        patient_ids = patient_ids.astype(np.int64)
+        values = values.astype(np.float64)
+        ages = ages.astype(np.float64)          # 沒有年齡（None）時為 nan
+        genders = np.where(genders == None, '', genders).astype(str)  # noqa: E711（逐元素比較）
+
+        order = np.argsort(patient_ids, kind='stable')
+        patient_ids, metrics, values, ages, genders = (
+            column[order] for column in (patient_ids, metrics, values, ages, genders)
+        )
+        for metric in np.unique(metrics):
+            mask = metrics == metric
+            columns[str(metric)] = {
+                'patient_id': patient_ids[mask],
+                'value': values[mask],
+                'age': ages[mask],
+                'gender': genders[mask],
+            }
+
+        # 由最新的身高與體重推導 bmi（兩者都有的病人才計算）
+        if 'height' in columns and 'weight' in columns:
+            height, weight = columns['height'], columns['weight']
+            patient_ids, h_index, w_index = np.intersect1d(
+                height['patient_id'], weight['patient_id'], assume_unique=True, return_indices=True
+            )
+            columns['bmi'] = {
+                'patient_id': patient_ids,
+                'value': bmi(height['value'][h_index], weight['value'][w_index]),
+                'age': height['age'][h_index],
+                'gender': height['gender'][h_index],
+            }
+        return columns
+
+    def reload(self):
+        start = time.monotonic()
+        try:
+            columns = self._build(self._load())
+        except Exception:
+            with self._lock:
+                self._stats['reload_failures'] += 1
+                self._refreshing = False
+            raise
+        with self._lock:
+            self._columns = columns
+            self._loaded_at = time.monotonic()
+            self._refreshing = False
+            self._stats['reloads'] += 1
+            self._stats['last_reload_ms'] = round((self._loaded_at - start) * 1000, 1)
+            self._stats['patients'] = len(np.unique(np.concatenate(
+                [column['patient_id'] for column in columns.values()]
+            ))) if columns else 0
+
+    def _reload_quietly(self):
+        try:
+            self.reload()
+        except Exception as e:
+            logger.warning('⚠️ 重新載入族群數據失敗: %s', e)
+
+    # 取得目前的快照；過期時在背景重新載入，尚未載入過時同步載入
+    def _snapshot(self):
+        with self._lock:
+            columns = self._columns
+            stale = time.monotonic() - self._loaded_at > self.refresh_interval
+            start_refresh = columns is not None and stale and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+        if columns is None:
+            self.reload()
+            with self._lock:
+                return self._columns
+        if start_refresh:
+            threading.Thread(target=self._reload_quietly, name='cohort-reload', daemon=True).start()
+        return columns
+
+    # 依性別、年齡篩選後的數值陣列；沒有資料時回傳 None
+    def values(self, metric, gender=None, min_age=None, max_age=None):
+        column = self._snapshot().get(metric)
+        if column is None:
+            return None
+        mask = np.ones(len(column['value']), dtype=bool)
+        if gender:
+            mask &= column['gender'] == gender
+        if min_age is not None:
+            mask &= column['age'] >= min_age
+        if max_age is not None:
+            mask &= column['age'] <= max_age
+        values = column['value'][mask]
+        return values if len(values) else None
+
+    # 某位病人在快照中的最新數值；沒有資料時回傳 None
+    def latest(self, metric, patient_id):
+        column = self._snapshot().get(metric)
+        if column is None:
+            return None
+        index = int(np.searchsorted(column['patient_id'], patient_id))
+        if index < len(column['patient_id']) and column['patient_id'][index] == patient_id:
+            return float(column['value'][index])
+        return None
+
+    # 族群百分位數，回傳 ({百分位: 數值}, 人數)
+    def percentiles(self, metric, gender=None, min_age=None, max_age=None, percentiles=COHORT_PERCENTILES):
+        values = self.values(metric, gender, min_age, max_age)
+        if values is None:
+            return None
+        return dict(zip(percentiles, np.percentile(values, percentiles).tolist())), len(values)
+
+    # 某位病人最新數值在族群中的百分位等級
+    def rank(self, metric, value, gender=None, min_age=None, max_age=None):
+        values = self.values(metric, gender, min_age, max_age)
+        if values is None:
+            return None
+        return percentile_rank(values, value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'metrics': sorted(self._columns) if self._columns else [],
+                'age_s': round(time.monotonic() - self._loaded_at, 1) if self._columns is not None else None,
+            }
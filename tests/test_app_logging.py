@@ -0,0 +1,64 @@
+import logging
+import sys
+
+from app_logging import RedactFilter, redact_arguments, redact_text
+
+
+def _record(msg, *args, exc_info=None, stack_info=None):
+    return logging.LogRecord('test', logging.ERROR, __file__, 1, msg, args, exc_info, sinfo=stack_info)
+
+
+def _format(record):
+    assert RedactFilter().filter(record)
+    return logging.Formatter('%(message)s').format(record)
+
+
+def test_redact_text():
+    assert redact_text('姓名: 王小明, 年齡：30') == '姓名: ***, 年齡：***'
+    assert redact_text('{"name": "王小明", "patient_id": 7}') == '{"name": ***, "patient_id": 7}'
+    assert redact_text("notes='頭痛' diet=清淡") == "notes=*** diet=***"
+
+
+def test_redact_arguments():
+    assert redact_arguments({'patient_id': 7, 'name': '王小明'}) == {'patient_id': 7, 'name': '***'}
+    assert redact_arguments('王小明') == '***'
+
+
+def test_message_args_redacted():
+    assert _format(_record('參數: %s', {'name': '王小明'})) == "參數: {'name': ***}"
+
+
+def test_exception_text_redacted():
+    try:
+        raise ValueError('Duplicate entry: {"name": "王小明"}')
+    except ValueError:
+        record = _record('寫入失敗', exc_info=sys.exc_info())
+    output = _format(record)
+    assert 'Traceback' in output
+    assert '王小明' not in output
+    assert '"name": ***' in output
+
+
+def test_existing_exc_text_and_stack_info_redacted():
+    record = _record('寫入失敗', stack_info='Stack (most recent call last):\n  姓名: 王小明')
+    record.exc_text = 'ValueError: name=王小明'
+    output = _format(record)
+    assert '王小明' not in output
+    assert 'name=***' in output
+    assert '姓名: ***' in output
+
+
+def test_filter_is_idempotent_across_handlers():
+    try:
+        raise ValueError('姓名: 王小明')
+    except ValueError:
+        record = _record('失敗', exc_info=sys.exc_info())
+    first = _format(record)
+    assert _format(record) == first
+
+
+def test_keys_inside_other_words_not_redacted():
+    text = 'message: 已連線, page=2, usage: 3, page_token=abc, filename: a.csv'
+    assert redact_text(text) == text
+    assert redact_text('username="王小明"') == 'username="王小明"'
+    assert redact_text('{"age": 30, \'name\': \'王小明\'}') == "{\"age\": ***, 'name': ***}"
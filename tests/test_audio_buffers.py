@@ -0,0 +1,281 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import audio_buffers
+from audio_buffers import AudioRingBuffer, DropOldestQueue, JitterBuffer
+
+
+# -----------------------------------------------------
+# DropOldestQueue
+# -----------------------------------------------------
+
+def test_drop_oldest_when_full():
+    queue = DropOldestQueue(3)
+    for i in range(5):
+        assert queue.put(i)
+    assert len(queue) == 3
+    batch, delay = queue.poll_batch(10, 0)
+    assert batch == [2, 3, 4]
+    assert delay is None
+    stats = queue.stats()
+    assert stats['put'] == 5
+    assert stats['dropped'] == 2
+    assert stats['max_depth'] == 3
+
+
+def test_poll_batch_waits_for_budget_then_flushes():
+    queue = DropOldestQueue(10)
+    assert queue.poll_batch(4, 0.05) == ([], None)
+    queue.put('a')
+    batch, delay = queue.poll_batch(4, 0.05)
+    assert batch == []
+    assert 0 < delay <= 0.05
+    # 湊滿 max_items 時不需要等延遲預算
+    for item in 'bcd':
+        queue.put(item)
+    assert queue.poll_batch(4, 10) == (['a', 'b', 'c', 'd'], None)
+    queue.put('e')
+    time.sleep(0.06)
+    assert queue.poll_batch(4, 0.05) == (['e'], None)
+    assert queue.stats()['batches'] == 2
+    assert queue.stats()['avg_batch'] == 2.5
+
+
+def test_get_batch_collects_items_within_budget():
+    queue = DropOldestQueue(10)
+
+    def producer():
+        for i in range(3):
+            queue.put(i)
+            time.sleep(0.01)
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    batch = queue.get_batch(3, 1.0)
+    thread.join()
+    assert batch == [0, 1, 2]
+
+
+def test_close_wakes_consumer_and_rejects_puts():
+    queue = DropOldestQueue(10)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(queue.get_batch(4, 1.0)))
+    thread.start()
+    time.sleep(0.02)
+    queue.close()
+    thread.join(1)
+    assert not thread.is_alive()
+    assert result == [[]]
+    assert queue.put('late') is False
+
+
+def test_close_flushes_remaining_items_without_waiting():
+    queue = DropOldestQueue(10)
+    queue.put('a')
+    queue.close()
+    start = time.monotonic()
+    assert queue.get_batch(4, 5) == ['a']
+    assert time.monotonic() - start < 1
+    assert queue.get_batch(4, 5) == []
+
+
+def test_on_put_and_clear():
+    calls = []
+    queue = DropOldestQueue(10, on_put=lambda: calls.append(len(queue)))
+    queue.put(1)
+    queue.put(2)
+    assert calls == [1, 2]
+    assert queue.clear() == 2
+    assert len(queue) == 0
+
+
+# -----------------------------------------------------
+# AudioRingBuffer
+# -----------------------------------------------------
+
+def test_ring_buffer_wraparound_preserves_order():
+    ring = AudioRingBuffer(8)
+    assert ring.write(b'abcdef') == 6
+    out = bytearray(4)
+    assert ring.read_into(memoryview(out)) == 4
+    assert bytes(out) == b'abcd'
+    # 寫入跨過緩衝尾端
+    assert ring.write(b'ghijkl') == 6
+    assert len(ring) == 8
+    out = bytearray(8)
+    assert ring.read_into(memoryview(out)) == 8
+    assert bytes(out) == b'efghijkl'
+    assert len(ring) == 0
+
+
+def test_ring_buffer_overrun_keeps_what_fits():
+    ring = AudioRingBuffer(4)
+    assert ring.write(b'abcdef') == 4
+    stats = ring.stats()
+    assert stats['overruns'] == 1
+    assert stats['overrun_bytes'] == 2
+    assert ring.read_padded(4) == (b'abcd', 4)
+
+
+def test_read_padded_pads_silence_and_counts_underruns():
+    ring = AudioRingBuffer(16)
+    # 尚未開始播放時讀不到資料不算 underrun
+    assert ring.read_padded(4) == (b'\0' * 4, 0)
+    assert ring.stats()['underruns'] == 0
+    ring.write(b'abcdef')
+    assert ring.read_padded(4) == (b'abcd', 4)
+    assert ring.read_padded(4) == (b'ef\0\0', 2)
+    stats = ring.stats()
+    assert stats['underruns'] == 1
+    assert stats['underrun_bytes'] == 2
+    # 停止播放後再讀不到資料不再計入
+    assert ring.read_padded(4) == (b'\0' * 4, 0)
+    assert ring.stats()['underruns'] == 1
+
+
+def test_ring_buffer_clear_and_unplayed_bytes():
+    ring = AudioRingBuffer(8)
+    ring.write(b'abcdef')
+    ring.read_padded(2)
+    assert ring.unplayed_bytes() == 4
+    ring.clear()
+    assert len(ring) == 0
+    assert ring.read_padded(2) == (b'\0\0', 0)
+    ring.write(b'xy')
+    assert ring.read_padded(2) == (b'xy', 2)
+    assert ring.stats()['written'] == 8
+
+
+# -----------------------------------------------------
+# JitterBuffer
+# -----------------------------------------------------
+
+RATE = 24000
+CHUNK = RATE * 2 * 20 // 1000      # 每次讀取 20ms
+
+
+def _tone(ms, value=10000):
+    return np.full(RATE * ms // 1000, value, dtype='<i2').tobytes()
+
+
+def _samples(data):
+    return np.frombuffer(data, dtype='<i2')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(audio_buffers.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def jitter():
+    return JitterBuffer(RATE * 2 * 10, RATE, min_ms=40, initial_jitter_ms=0)
+
+
+def test_jitter_prebuffers_until_target_depth(clock, jitter):
+    jitter.write(_tone(30))
+    data, count = jitter.read_padded(CHUNK)
+    assert count == 0 and data == bytes(CHUNK)
+
+    jitter.write(_tone(10))              # 累積到 40ms，不用再等
+    _, count = jitter.read_padded(CHUNK)
+    assert count == CHUNK
+    assert jitter.stats()['starts'] == 1
+
+
+def test_jitter_starts_after_waiting_target_ms(clock, jitter):
+    jitter.write(_tone(30))
+    clock[0] += 0.039
+    assert jitter.read_padded(CHUNK)[1] == 0
+    clock[0] += 0.011
+    assert jitter.read_padded(CHUNK)[1] == CHUNK
+    assert jitter.stats()['max_start_delay_ms'] == 50.0
+
+
+def test_jitter_end_of_stream_plays_at_once_without_underrun(clock, jitter):
+    jitter.write(_tone(30))
+    jitter.end_of_stream()
+    assert jitter.read_padded(CHUNK)[1] == CHUNK
+    data, count = jitter.read_padded(CHUNK)
+    assert count == CHUNK // 2
+    # 自然結束：沒有淡出，也不算 underrun
+    assert _samples(data)[count // 2 - 1] == 10000
+    stats = jitter.stats()
+    assert (stats['underruns'], stats['underrun_bytes']) == (0, 0)
+
+
+def test_jitter_underrun_fades_out_and_in(clock, jitter):
+    jitter.write(_tone(30))
+    clock[0] += 0.05
+    jitter.read_padded(CHUNK)
+    data, count = jitter.read_padded(CHUNK)
+    assert count == CHUNK // 2
+    tail = _samples(data)[:count // 2]
+    assert list(tail[-3:]) == [168, 84, 0]
+    assert tail[-jitter.fade_samples - 1] == 10000
+    assert not _samples(data)[count // 2:].any()
+    stats = jitter.stats()
+    assert (stats['underruns'], stats['underrun_bytes'], stats['playing']) == (1, CHUNK // 2, False)
+
+    # 重新累積後恢復播放，開頭淡入
+    jitter.write(_tone(60))
+    data, count = jitter.read_padded(CHUNK)
+    assert count == CHUNK
+    head = _samples(data)
+    assert list(head[:3]) == [0, 83, 166]
+    assert head[jitter.fade_samples] == 10000
+    # 淡入只有一次
+    assert _samples(jitter.read_padded(CHUNK)[0])[0] == 10000
+
+
+def test_jitter_clear_resets_prebuffering(clock, jitter):
+    jitter.write(_tone(60))
+    assert jitter.read_padded(CHUNK)[1] == CHUNK
+    jitter.clear()
+    assert len(jitter) == 0 and jitter.unplayed_bytes() == 0
+    assert jitter.read_padded(CHUNK)[1] == 0
+    # 清空後的下一段音訊重新累積預先緩衝，清空本身不算 underrun
+    jitter.write(_tone(20))
+    assert jitter.read_padded(CHUNK)[1] == 0
+    assert jitter.stats()['underruns'] == 0
+
+
+def test_jitter_target_follows_late_arrivals(clock, jitter):
+    assert jitter.target_ms() == 40
+    for _ in range(10):
+        jitter.write(_tone(20))
+        clock[0] += 0.06                 # 每 20ms 的音訊晚 40ms 才到
+    assert 40 < jitter.target_ms() <= jitter.max_ms
+    stats = jitter.stats()
+    assert set(stats) >= {'depth_ms', 'target_ms', 'jitter_ms', 'playing', 'starts', 'avg_start_delay_ms',
+                          'max_start_delay_ms', 'underruns', 'underrun_bytes', 'underrun_ms'}
+
+
+def test_jitter_on_clear_called_after_clear(jitter):
+    calls = []
+    jitter.on_clear = lambda: calls.append(len(jitter))
+    jitter.write(_tone(20))
+    jitter.clear()
+    assert calls == [0]
+
+
+@pytest.mark.parametrize('make', [lambda: AudioRingBuffer(4096),
+                                  lambda: JitterBuffer(4096, RATE, min_ms=0, initial_jitter_ms=0)])
+def test_read_padded_reuses_scratch_for_varying_sizes(make):
+    buffer = make()
+    buffer.reserve(1000)
+    scratch = buffer._scratch
+    for nbytes in (882, 884, 882, 1000, 2):
+        buffer.write(b'\x01\x00' * 300)
+        data, count = buffer.read_padded(nbytes)
+        assert len(data) == nbytes
+        assert data[count:] == bytes(nbytes - count)
+    assert buffer._scratch is scratch
+    # 比預先配置的更大時才重新配置
+    assert len(buffer.read_padded(1200)[0]) == 1200
+    assert len(buffer._scratch) == 1200
@@ -0,0 +1,87 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from audio_codecs import (ALAW_DECODE, ALAW_ENCODE, AUDIO_FORMATS, ULAW_DECODE, ULAW_ENCODE, alaw_decode,
+                          alaw_encode, ulaw_decode, ulaw_encode)
+
+# ITU-T G.711 的參考值：線性樣本 → (µ-law, A-law)
+ENCODE_REFERENCE = {
+    0: (0xFF, 0xD5),
+    -1: (0x7E, 0x55),
+    100: (0xF2, 0xD3),
+    -100: (0x72, 0x53),
+    1000: (0xCE, 0xFA),
+    -1000: (0x4E, 0x7A),
+    8000: (0xA0, 0x8A),
+    -8000: (0x20, 0x0A),
+    32767: (0x80, 0xAA),
+    -32768: (0x00, 0x2A),
+}
+# 編碼 → (µ-law 解碼, A-law 解碼)
+DECODE_REFERENCE = {
+    0x00: (-32124, -5504),
+    0x7F: (0, -848),
+    0x80: (32124, 5504),
+    0xFF: (0, 848),
+    0xD5: (716, 8),
+    0x55: (-716, -8),
+    0x2A: (-5372, -32256),
+    0xAA: (5372, 32256),
+}
+
+ALL_PCM = np.arange(-32768, 32768, dtype='<i2').tobytes()
+ALL_CODES = bytes(range(256))
+
+
+@pytest.mark.parametrize('sample, codes', ENCODE_REFERENCE.items())
+def test_encode_reference_values(sample, codes):
+    pcm = np.array([sample], dtype='<i2').tobytes()
+    assert (ulaw_encode(pcm)[0], alaw_encode(pcm)[0]) == codes
+
+
+@pytest.mark.parametrize('code, samples', DECODE_REFERENCE.items())
+def test_decode_reference_values(code, samples):
+    decoded = (np.frombuffer(ulaw_decode(bytes([code])), '<i2')[0],
+               np.frombuffer(alaw_decode(bytes([code])), '<i2')[0])
+    assert decoded == samples
+
+
+def test_matches_audioop_for_every_sample():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        audioop = pytest.importorskip('audioop')
+    assert ulaw_encode(ALL_PCM) == audioop.lin2ulaw(ALL_PCM, 2)
+    assert alaw_encode(ALL_PCM) == audioop.lin2alaw(ALL_PCM, 2)
+    assert ulaw_decode(ALL_CODES) == audioop.ulaw2lin(ALL_CODES, 2)
+    assert alaw_decode(ALL_CODES) == audioop.alaw2lin(ALL_CODES, 2)
+
+
+def test_tables():
+    assert ULAW_ENCODE.shape == ALAW_ENCODE.shape == (65536,)
+    assert ULAW_DECODE.shape == ALAW_DECODE.shape == (256,)
+    # 解碼後再編碼回到原本的編碼（µ-law 的 0x7F 與 0xFF 都是 0，編碼為 0xFF）
+    for encode, decode in ((ulaw_encode, ulaw_decode), (alaw_encode, alaw_decode)):
+        round_trip = encode(decode(ALL_CODES))
+        mismatched = [code for code in ALL_CODES if round_trip[code] != code]
+        assert mismatched in ([], [0x7F])
+
+
+def test_encode_is_monotonic():
+    # 依樣本大小排列時解碼值不會變小
+    for encode, decode in ((ulaw_encode, ulaw_decode), (alaw_encode, alaw_decode)):
+        decoded = np.frombuffer(decode(encode(ALL_PCM)), '<i2')
+        assert np.all(np.diff(decoded.astype(np.int32)) >= 0)
+
+
+def test_audio_formats():
+    assert AUDIO_FORMATS['pcm16'].bytes_per_second == 48000
+    assert AUDIO_FORMATS['pcm16'].encode is None
+    for name in ('g711_ulaw', 'g711_alaw'):
+        fmt = AUDIO_FORMATS[name]
+        assert (fmt.rate, fmt.sample_width, fmt.bytes_per_second) == (8000, 1, 8000)
+        pcm = np.linspace(-20000, 20000, 160).astype('<i2').tobytes()
+        encoded = fmt.encode(pcm)
+        assert len(encoded) == 160
+        assert len(fmt.decode(encoded)) == len(pcm)
@@ -0,0 +1,71 @@
+import base64
+import json
+
+import pytest
+
+from audio_framing import decode_audio, encode_append, parse_audio_delta
+
+PCM = bytes(range(256)) * 8      # base64 會包含 + 與 /
+B64 = base64.b64encode(PCM).decode('ascii')
+
+
+def _check(message):
+    expected = json.loads(message)
+    parsed = parse_audio_delta(message)
+    assert parsed is not None
+    event, delta = parsed
+    assert delta == expected.pop('delta')
+    event.pop('delta')
+    assert event == expected
+    return event, delta
+
+
+def test_encode_append_matches_json():
+    message = encode_append(PCM)
+    assert json.loads(message) == {'type': 'input_audio_buffer.append', 'audio': B64}
+    assert json.loads(encode_append(b'')) == {'type': 'input_audio_buffer.append', 'audio': ''}
+
+
+@pytest.mark.parametrize('message', [
+    # delta 在最後（API 實際的順序）
+    json.dumps({'type': 'response.audio.delta', 'event_id': 'e1', 'response_id': 'r1',
+                'item_id': 'i1', 'output_index': 0, 'content_index': 0, 'delta': B64}),
+    # delta 在最前面、type 在後面
+    json.dumps({'delta': B64, 'response_id': 'r1', 'type': 'response.audio.delta'}),
+    # 緊湊格式與多餘的空白
+    json.dumps({'type': 'response.audio.delta', 'delta': B64}, separators=(',', ':')),
+    '{ "type" : "response.audio.delta" ,\t"delta" :\t "' + B64 + '" , "item_id" : "i1" }',
+    # 非 ASCII 的欄位
+    json.dumps({'type': 'response.audio.delta', 'item_id': '項目', 'delta': B64}, ensure_ascii=False),
+])
+def test_parse_audio_delta_matches_json(message):
+    event, delta = _check(message)
+    assert event['type'] == 'response.audio.delta'
+    assert decode_audio(delta) == PCM
+
+
+@pytest.mark.parametrize('message', [
+    json.dumps({'type': 'response.audio_transcript.delta', 'delta': '你好'}),
+    json.dumps({'type': 'response.function_call_arguments.delta', 'delta': '{"a"'}),
+    json.dumps({'type': 'response.text.delta', 'delta': 'response.audio.delta'}),
+    json.dumps({'type': 'session.created', 'session': {}}),
+    json.dumps({'type': 'response.audio.delta', 'delta': None}),
+    '{"type": "response.audio.delta", "delta": "abc',      # 不完整的 JSON
+    '{"type": "response.audio.delta", "delta": ',
+    '',
+    b'{"type": "response.audio.delta", "delta": "AAAA"}',   # 二進位訊息
+])
+def test_parse_audio_delta_rejects_other_messages(message):
+    assert parse_audio_delta(message) is None
+
+
+def test_delta_type_only_inside_other_strings():
+    # 事件類型字串只出現在其他欄位的內容中時不是音訊事件
+    message = json.dumps({'type': 'response.text.delta', 'delta': 'x',
+                          'note': 'response.audio.delta'})
+    assert parse_audio_delta(message) is None
+
+
+def test_decode_audio_ignores_escaped_slashes():
+    escaped = B64.replace('/', '\\/')
+    assert decode_audio(escaped) == PCM
@@ -0,0 +1,125 @@
+import contextlib
+import json
+
+import pytest
+
+import bulk_import
+from bulk_import import BulkImporter, file_identity
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / 'patients.csv'
+    path.write_text("name,age,gender\n王小明,30,男\n李小華,25,女\n", encoding='utf-8')
+    return path
+
+
+def _importer(path, **kwargs):
+    return BulkImporter('patients', str(path), **kwargs)
+
+
+def test_checkpoint_round_trip(data_file):
+    importer = _importer(data_file)
+    importer._identity = file_identity(str(data_file))
+    importer._save_checkpoint(2)
+
+    assert _importer(data_file)._load_checkpoint(file_identity(str(data_file))) == (2, 0)
+    # --restart 不讀 checkpoint
+    assert _importer(data_file, resume=False)._load_checkpoint(file_identity(str(data_file))) == (0, 0)
+
+
+def test_no_checkpoint_starts_from_beginning(data_file):
+    assert _importer(data_file)._load_checkpoint(file_identity(str(data_file))) == (0, 0)
+
+
+@pytest.mark.parametrize('replacement', [
+    "name,age,gender\n王小明,30,男\n李小華,25,女\n張大同,40,男\n",   # 檔案變長
+    "name,age,gender\n王小明,31,男\n李小華,25,女\n",                  # 大小相同、內容不同
+])
+def test_checkpoint_for_other_file_rejected(data_file, replacement):
+    importer = _importer(data_file)
+    importer._identity = file_identity(str(data_file))
+    importer._save_checkpoint(2)
+
+    data_file.write_text(replacement, encoding='utf-8')
+    with pytest.raises(ValueError, match='--restart'):
+        _importer(data_file)._load_checkpoint(file_identity(str(data_file)))
+
+
+def test_checkpoint_for_other_kind_rejected(data_file):
+    importer = _importer(data_file)
+    importer._identity = file_identity(str(data_file))
+    importer._save_checkpoint(2)
+
+    records = BulkImporter('records', str(data_file))
+    with pytest.raises(ValueError):
+        records._load_checkpoint(file_identity(str(data_file)))
+
+
+class FakeCursor:
+    lastrowid = 1
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def executemany(self, query, rows):
+        self.pool.rows.extend(rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    def __init__(self):
+        self.rows = []
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+
+def test_resume_does_not_duplicate_errors(tmp_path, monkeypatch):
+    path = tmp_path / 'patients.csv'
+    lines = ["name,age,gender"]
+    for i in range(1, 7):
+        # 偶數列的性別錯誤
+        lines.append(f"病人{i},30,{'男' if i % 2 else '不明'}")
+    path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+
+    pool = FakePool()
+    monkeypatch.setattr(bulk_import, 'DB_POOL', pool)
+    # 第二批（第三列）寫入時中斷：第二列的錯誤已寫入錯誤報告，但 checkpoint 還停在第一列
+    original = FakeCursor.executemany
+    calls = []
+
+    def executemany(self, query, rows):
+        calls.append(rows)
+        if len(calls) == 2:
+            raise ConnectionError('資料庫連線中斷')
+        original(self, query, rows)
+
+    monkeypatch.setattr(FakeCursor, 'executemany', executemany)
+    with pytest.raises(ConnectionError):
+        _importer(path, batch_size=1).run()
+    error_path = tmp_path / 'patients.csv.errors.jsonl'
+    assert [json.loads(line)['row'] for line in error_path.read_text(encoding='utf-8').splitlines()] == [2]
+
+    stats = _importer(path, batch_size=1).run()
+    errors = [json.loads(line)['row'] for line in error_path.read_text(encoding='utf-8').splitlines()]
+    assert errors == [2, 4, 6]
+    assert [row[0] for row in pool.rows] == ['病人1', '病人3', '病人5']
+    assert stats['rows_skipped'] == 1
@@ -0,0 +1,74 @@
+import base64
+import datetime
+import json
+
+import pytest
+
+from medical_tools import _created_at_after, _decode_page_token, _encode_page_token
+
+
+def _raw_token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def test_round_trip():
+    token = _encode_page_token(42)
+    assert '=' not in token
+    assert _decode_page_token(token, 1) == [42]
+
+    created_at = datetime.datetime(2024, 5, 1, 8, 30, 15)
+    token = _encode_page_token(created_at, 7)
+    assert _decode_page_token(token, 2) == ['2024-05-01 08:30:15', 7]
+
+
+def test_token_is_urlsafe():
+    # 編碼結果含 + 或 / 的值也必須能放進網址
+    token = _encode_page_token('>>>???' * 5)
+    assert set(token) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_')
+    assert _decode_page_token(token, 1) == ['>>>???' * 5]
+
+
+@pytest.mark.parametrize('token', [
+    '!!!not-base64!!!',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode('ascii'),   # 不是 UTF-8
+    base64.urlsafe_b64encode(b'{not json').decode('ascii'),
+    _raw_token({'id': 1}),                                   # 不是陣列
+    _raw_token(5),
+    _raw_token([1, 2]),                                      # 數量不符
+    _raw_token([]),
+    _raw_token([[1]]),                                       # 陣列或物件不能當排序鍵
+    _raw_token([{'id': 1}]),
+    _raw_token([None]),
+])
+def test_tampered_token_rejected(token):
+    with pytest.raises(ValueError):
+        _decode_page_token(token, 1)
+
+
+def test_truncated_token_rejected():
+    token = _encode_page_token('2024-05-01 08:30:15', 7)
+    with pytest.raises(ValueError):
+        _decode_page_token(token[:-5], 2)
+
+
+def test_created_at_after():
+    assert _created_at_after(None) == ("", ())
+    assert _created_at_after('') == ("", ())
+
+    token = _encode_page_token('2024-05-01 08:30:15', 7)
+    condition, params = _created_at_after(token)
+    assert condition == " AND (created_at < %s OR (created_at = %s AND id < %s))"
+    assert params == ('2024-05-01 08:30:15', '2024-05-01 08:30:15', 7)
+
+    condition, _ = _created_at_after(token, newest_first=False)
+    assert condition == " AND (created_at > %s OR (created_at = %s AND id > %s))"
+
+
+@pytest.mark.parametrize('values', [
+    ['2024-05-01 08:30:15', 'abc'],       # id 不是整數
+    ['2024-05-01 08:30:15', [7]],
+    ['2024-05-01 08:30:15'],
+])
+def test_created_at_after_rejects_tampered_token(values):
+    with pytest.raises(ValueError):
+        _created_at_after(_raw_token(values))
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from realtime_server import ClientSession
+
+
+class FakeClient:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield message
+
+
+class FakeRealtime:
+    def __init__(self):
+        self.audio = []
+
+    def send_audio(self, pcm):
+        self.audio.append(pcm)
+
+
+def _client_session(messages):
+    # 不建立 RealtimeSession，只測試用戶端訊息的處理
+    session = ClientSession.__new__(ClientSession)
+    session.client = FakeClient(messages)
+    session.realtime = FakeRealtime()
+    session.session_id = 'test'
+    session.mic_gate = None
+    session.client_audio_in_bytes = 0
+    session.invalid_client_messages = 0
+    return session
+
+
+@pytest.mark.parametrize('invalid', ['[]', '1', 'null', '"stop"', '{not json', ''])
+def test_invalid_control_messages_are_ignored(invalid):
+    session = _client_session([invalid, b'\x01\x00', '{"type": "stop"}', b'\x02\x00'])
+    asyncio.run(session._client_to_realtime())
+    # 無效的訊息不會結束對話，之後的音訊照常轉送，stop 之後才結束
+    assert session.realtime.audio == [b'\x01\x00']
+    assert session.invalid_client_messages == 1
+
+
+def test_unknown_control_type_is_not_invalid():
+    session = _client_session(['{"type": "ping"}', b'\x01\x00'])
+    asyncio.run(session._client_to_realtime())
+    assert session.realtime.audio == [b'\x01\x00']
+    assert session.invalid_client_messages == 0
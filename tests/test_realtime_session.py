@@ -0,0 +1,217 @@
+import asyncio
+import base64
+import json
+import time
+
+import pytest
+
+import realtime_session
+from realtime_session import RealtimeSession
+from tool_registry import ToolRegistry
+
+
+def _delta(response_id, pcm=b'\x01\x00' * 240):
+    event = {'type': 'response.audio.delta', 'item_id': 'item_1', 'content_index': 0,
+             'delta': base64.b64encode(pcm).decode('ascii')}
+    if response_id is not None:
+        event['response_id'] = response_id
+    return event
+
+
+@pytest.fixture
+def session():
+    session = RealtimeSession('ws://localhost', 'test-key', reconnect=False)
+    session.sent = []
+
+    async def send_json(event, kind='control'):
+        session.sent.append(event)
+
+    session.send_json = send_json
+    yield session
+    session.tool_executor.shutdown()
+
+
+def _run(session, *events):
+    async def main():
+        for event in events:
+            session._handle_event(event)
+        await asyncio.gather(*session._background_tasks)
+    asyncio.run(main())
+
+
+def test_barge_in_drops_late_audio_of_cancelled_response(session):
+    _run(session,
+         {'type': 'response.created', 'response': {'id': 'resp_1'}},
+         _delta('resp_1'),
+         {'type': 'input_audio_buffer.speech_started'},
+         _delta('resp_1'))
+
+    assert [event['type'] for event in session.sent] == ['response.cancel', 'conversation.item.truncate']
+    stats = session._stats
+    assert (stats['responses_cancelled'], stats['late_deltas_dropped']) == (1, 1)
+    assert len(session.playback) == 0
+
+
+def test_barge_in_without_response_id_cancels_without_recording(session):
+    _run(session,
+         {'type': 'response.created', 'response': {}},
+         {'type': 'input_audio_buffer.speech_started'},
+         _delta(None),
+         _delta('resp_2'))
+
+    assert [event['type'] for event in session.sent] == ['response.cancel']
+    assert list(session._cancelled_responses) == []
+    # 沒有 response_id 的音訊與下一個回應的音訊都照常播放
+    assert session._stats['late_deltas_dropped'] == 0
+    assert len(session.playback) == 2 * 480
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def _tool_session(tool):
+    tools = ToolRegistry()
+    tools.tool("測試")(tool)
+    session = RealtimeSession('ws://localhost', 'test-key', tools=tools, reconnect=False)
+    session._ws = FakeWebSocket()
+    return session
+
+
+def _call_tool(session):
+    async def main():
+        session._loop = asyncio.get_running_loop()
+        session._send_lock = asyncio.Lock()
+        await session._run_function_call('lookup', 'call_1', '{}')
+    try:
+        asyncio.run(main())
+    finally:
+        session.tool_executor.shutdown()
+
+
+def test_function_call_result_sent_on_same_connection():
+    def lookup():
+        return "✅ 完成"
+
+    session = _tool_session(lookup)
+    _call_tool(session)
+    assert [event['type'] for event in session._ws.sent] == ['conversation.item.create', 'response.create']
+    assert session._ws.sent[0]['item']['call_id'] == 'call_1'
+    assert session._stats['stale_tool_results'] == 0
+
+
+def test_function_call_result_dropped_after_reconnect():
+    def lookup():
+        # 執行期間連線中斷並重新連線
+        session._generation += 1
+        session._ws = FakeWebSocket()
+        return "✅ 完成"
+
+    session = _tool_session(lookup)
+    _call_tool(session)
+    assert session._ws.sent == []
+    assert session._stats['stale_tool_results'] == 1
+
+
+class FakeTranscripts:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, session_id, patient_id, role, content, created_at):
+        self.rows.append((role, content, created_at))
+
+
+def _item_created(item_id, role):
+    return {'type': 'conversation.item.created', 'item': {'id': item_id, 'type': 'message', 'role': role}}
+
+
+@pytest.fixture
+def transcript_session(session):
+    session.transcripts = FakeTranscripts()
+    session.context.conversation_id = 'conv_1'
+    return session
+
+
+def test_transcripts_follow_item_order(transcript_session):
+    session = transcript_session
+    _run(session,
+         _item_created('user_1', 'user'),
+         _item_created('audio_1', 'assistant'),
+         {'type': 'response.audio_transcript.done', 'item_id': 'audio_1', 'transcript': '您好，請問哪裡不舒服？'})
+    # 使用者的轉錄還沒完成，AI 的逐字稿先保留
+    assert session.transcripts.rows == []
+
+    _run(session, {'type': 'conversation.item.input_audio_transcription.completed',
+                   'item_id': 'user_1', 'transcript': '我頭痛'})
+    rows = session.transcripts.rows
+    assert [(role, text) for role, text, _ in rows] == [('user', '我頭痛'), ('assistant', '您好，請問哪裡不舒服？')]
+    assert rows[0][2] < rows[1][2]
+    assert list(session._history) == [(role, text) for role, text, _ in rows]
+
+
+def test_failed_transcription_does_not_block(transcript_session):
+    session = transcript_session
+    _run(session,
+         _item_created('user_1', 'user'),
+         _item_created('audio_1', 'assistant'),
+         {'type': 'response.audio_transcript.done', 'item_id': 'audio_1', 'transcript': '請再說一次'},
+         {'type': 'conversation.item.input_audio_transcription.failed', 'item_id': 'user_1'})
+    assert [row[:2] for row in session.transcripts.rows] == [('assistant', '請再說一次')]
+
+
+def test_cancelled_response_without_transcript_does_not_block(transcript_session):
+    session = transcript_session
+    _run(session,
+         _item_created('audio_1', 'assistant'),
+         {'type': 'response.done', 'response': {'id': 'resp_1', 'output': [{'id': 'audio_1'}]}},
+         _item_created('user_2', 'user'),
+         {'type': 'conversation.item.input_audio_transcription.completed',
+          'item_id': 'user_2', 'transcript': '好'})
+    assert [row[:2] for row in session.transcripts.rows] == [('user', '好')]
+
+
+def test_missing_transcript_skipped_after_wait(transcript_session, monkeypatch):
+    session = transcript_session
+    _run(session,
+         _item_created('user_1', 'user'),
+         {'type': 'response.text.done', 'item_id': 'text_1', 'text': '收到'})
+    assert session.transcripts.rows == []
+
+    now = time.monotonic() + realtime_session.TRANSCRIPT_ORDER_WAIT_S
+    monkeypatch.setattr(realtime_session.time, 'monotonic', lambda: now)
+    session._release_transcripts()
+    assert [row[:2] for row in session.transcripts.rows] == [('assistant', '收到')]
+    assert session._stats['transcripts_missing'] == 1
+
+
+class FakeReceiveSocket:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield message
+
+
+def test_receive_loop_skips_bad_events(session):
+    session._ws = FakeReceiveSocket([
+        '{not json',
+        '{"event_id": "e1"}',                                   # 沒有 type
+        '[]',
+        json.dumps({'type': 'response.done', 'response': {'output': 5}}),   # 處理時發生例外
+        json.dumps({'type': 'response.created', 'response': {'id': 'resp_1'}}),
+        json.dumps({'type': 'response.audio.delta', 'response_id': 'resp_1', 'item_id': 'item_1',
+                    'delta': base64.b64encode(b'\x01\x00' * 10).decode('ascii')}),
+    ])
+    asyncio.run(session._receive_loop())
+
+    assert session._stats['bad_events'] == 4
+    assert session._response_id == 'resp_1' and session._response_active
+    assert len(session.playback) == 20
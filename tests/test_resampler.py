@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from resampler import StreamingResampler
+
+RATIOS = [(16000, 24000), (48000, 24000), (44100, 24000), (24000, 8000), (8000, 24000)]
+
+
+def _signal(rate, seconds=0.2):
+    t = np.arange(int(rate * seconds)) / rate
+    return (8000 * np.sin(2 * np.pi * 440 * t)).astype('<i2')
+
+
+@pytest.mark.parametrize('in_rate, out_rate', RATIOS)
+def test_chunked_equals_one_shot(in_rate, out_rate):
+    pcm = _signal(in_rate).tobytes()
+    expected = StreamingResampler(in_rate, out_rate).process(pcm)
+
+    resampler = StreamingResampler(in_rate, out_rate)
+    sizes = [1, 7, 160, 333, 1024]
+    chunks, pos, i = [], 0, 0
+    while pos < len(pcm):
+        size = sizes[i % len(sizes)] * 2
+        chunks.append(resampler.process(pcm[pos:pos + size]))
+        pos += size
+        i += 1
+    assert b''.join(chunks) == expected
+    # 輸出長度與取樣率的比例一致（扣掉濾波器延遲保留的樣本）
+    n_in = len(pcm) // 2
+    assert abs(len(expected) // 2 - n_in * out_rate / in_rate) <= resampler.taps
+
+
+@pytest.mark.parametrize('in_rate, out_rate', RATIOS)
+def test_input_needed_gives_exact_frame_count(in_rate, out_rate):
+    pcm = _signal(in_rate, 1.0).tobytes()
+    reference = StreamingResampler(in_rate, out_rate).process(pcm)
+
+    resampler = StreamingResampler(in_rate, out_rate)
+    out, pos = [], 0
+    for frame_count in [256, 441, 1, 512, 300] * 4:
+        need = resampler.input_needed(frame_count)
+        chunk = resampler.process(pcm[pos:pos + need * 2], frame_count)
+        pos += need * 2
+        assert len(chunk) == frame_count * 2
+        out.append(chunk)
+    # 播放端的讀法與一次轉換的結果相同
+    produced = b''.join(out)
+    assert produced == reference[:len(produced)]
+
+
+def test_passthrough():
+    resampler = StreamingResampler(24000, 24000)
+    pcm = _signal(24000).tobytes()
+    assert resampler.passthrough
+    assert resampler.process(pcm) is pcm
+    assert resampler.input_needed(480) == 480
+    assert resampler.delay_ms == 0.0
+
+
+def test_reset_restores_initial_state():
+    pcm = _signal(16000).tobytes()
+    resampler = StreamingResampler(16000, 24000)
+    first = resampler.process(pcm)
+    resampler.process(pcm[:334])
+    resampler.reset()
+    assert resampler.process(pcm) == first
+
+
+def test_stats():
+    resampler = StreamingResampler(48000, 24000)
+    resampler.process(_signal(48000, 0.1).tobytes())
+    stats = resampler.stats()
+    assert (stats['ratio'], stats['chunks'], stats['samples_in']) == ('1/2', 1, 4800)
+    assert 0 < stats['samples_out'] <= 2400
+
+
+@pytest.mark.parametrize('in_rate, out_rate', RATIOS + [(24000, 44100), (24000, 48000)])
+def test_max_input_needed_bounds_input_needed(in_rate, out_rate):
+    resampler = StreamingResampler(in_rate, out_rate)
+    pcm = _signal(in_rate, 1.0).tobytes()
+    frame_count = 1024 * out_rate // 24000
+    bound = resampler.max_input_needed(frame_count)
+    pos = 0
+    for _ in range(50):
+        need = resampler.input_needed(frame_count)
+        assert need <= bound
+        resampler.process(pcm[pos:pos + need * 2], frame_count)
+        pos = (pos + need * 2) % (len(pcm) - bound * 2)
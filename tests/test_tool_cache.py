@@ -0,0 +1,123 @@
+from typing import Annotated
+
+import pytest
+
+import tool_cache
+from tool_cache import ToolCache
+from tool_registry import ToolRegistry
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tool_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ToolCache(max_entries=2)
+    cache.put('a', 1, 'A', cache.generation())
+    cache.put('b', 1, 'B', cache.generation())
+    assert cache.get('a') == (True, 'A')      # a 變成最近使用
+    cache.put('c', 2, 'C', cache.generation())
+
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 'A')
+    assert cache.get('c') == (True, 'C')
+    assert len(cache) == 2
+    assert cache.stats()['evictions'] == 1
+
+
+def test_put_same_key_replaces_entry_and_tag():
+    cache = ToolCache()
+    cache.put('a', 1, 'old', cache.generation())
+    cache.put('a', 2, 'new', cache.generation())
+    assert cache.invalidate(1) == 0
+    assert cache.get('a') == (True, 'new')
+    assert cache.invalidate(2) == 1
+    assert len(cache) == 0
+
+
+def test_ttl_expiry(clock):
+    cache = ToolCache(ttl=10.0)
+    cache.put('a', 1, 'A', cache.generation())
+    clock[0] += 9.9
+    assert cache.get('a') == (True, 'A')
+    clock[0] += 0.1
+    assert cache.get('a') == (False, None)
+    assert len(cache) == 0
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expired']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_stale_generation_not_stored():
+    cache = ToolCache()
+    generation = cache.generation()
+    cache.invalidate(1)                        # 查詢期間有寫入
+    assert cache.put('a', 1, 'A', generation) is False
+    assert cache.get('a') == (False, None)
+    assert cache.stats()['stale_skipped'] == 1
+
+    assert cache.put('a', 1, 'A', cache.generation()) is True
+
+
+def test_invalidate_only_removes_tag():
+    cache = ToolCache()
+    for key, tag in (('a', 1), ('b', 1), ('c', 2)):
+        cache.put(key, tag, key.upper(), cache.generation())
+
+    assert cache.invalidate(1) == 2
+    assert cache.get('a') == (False, None)
+    assert cache.get('b') == (False, None)
+    assert cache.get('c') == (True, 'C')
+    assert cache.invalidate(1) == 0
+
+    stats = cache.stats()
+    assert (stats['invalidations'], stats['invalidated_entries']) == (2, 2)
+
+
+def test_clear_drops_everything_and_bumps_generation():
+    cache = ToolCache()
+    generation = cache.generation()
+    cache.put('a', 1, 'A', generation)
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.put('a', 1, 'A', generation) is False
+
+
+def test_registry_caches_reads_and_invalidates_on_write():
+    calls = []
+    records = {1: 'v1', 2: 'v1'}
+    tools = ToolRegistry(cache=ToolCache())
+
+    @tools.tool("查詢", cache_by="patient_id")
+    def read(patient_id: Annotated[int, "病人ID"]):
+        calls.append(patient_id)
+        return records[patient_id]
+
+    @tools.tool("修改", invalidates="patient_id")
+    def write(patient_id: Annotated[int, "病人ID"], value: Annotated[str, "值"]):
+        records[patient_id] = value
+        return "✅ 已更新"
+
+    @tools.tool("查詢錯誤", cache_by="patient_id")
+    def broken(patient_id: Annotated[int, "病人ID"]):
+        calls.append(-patient_id)
+        return "❌ 找不到病人"
+
+    assert tools.call('read', '{"patient_id": 1}') == 'v1'
+    assert tools.call('read', '{"patient_id": "1"}') == 'v1'     # 轉型後的參數相同，命中快取
+    assert tools.call('read', '{"patient_id": 2}') == 'v1'
+    assert calls == [1, 2]
+
+    tools.call('write', '{"patient_id": 1, "value": "v2"}')
+    assert tools.call('read', '{"patient_id": 1}') == 'v2'
+    assert tools.call('read', '{"patient_id": 2}') == 'v1'
+    assert calls == [1, 2, 1]
+
+    # 錯誤訊息不快取
+    tools.call('broken', '{"patient_id": 3}')
+    tools.call('broken', '{"patient_id": 3}')
+    assert calls == [1, 2, 1, -3, -3]
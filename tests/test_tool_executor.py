@@ -0,0 +1,95 @@
+import threading
+import time
+
+from tool_executor import ToolExecutor
+
+
+def _collector():
+    results = []
+    done = threading.Event()
+
+    def on_done(result):
+        results.append(result)
+        done.set()
+    return results, done, on_done
+
+
+def test_result_is_delivered_once():
+    executor = ToolExecutor(max_workers=1, max_pending=0, timeout=1)
+    results, done, on_done = _collector()
+    assert executor.submit(lambda x: x * 2, (21,), on_done)
+    assert done.wait(1)
+    time.sleep(0.05)
+    assert results == [42]
+    assert executor.stats()['completed'] == 1
+    executor.shutdown(wait=True)
+
+
+def test_exception_becomes_error_message():
+    executor = ToolExecutor(max_workers=1, max_pending=0, timeout=1)
+    results, done, on_done = _collector()
+
+    def boom():
+        raise ValueError('壞掉了')
+
+    executor.submit(boom, (), on_done)
+    assert done.wait(1)
+    assert results == ['執行函式時發生錯誤: 壞掉了']
+    assert executor.stats()['failed'] == 1
+    executor.shutdown(wait=True)
+
+
+def test_timeout_reports_first_and_drops_late_result():
+    executor = ToolExecutor(max_workers=1, max_pending=0, timeout=0.05)
+    results, done, on_done = _collector()
+    release = threading.Event()
+    executor.submit(lambda: release.wait(1) and 'late', (), on_done)
+    assert done.wait(1)
+    assert results == ['⚠️ 函式執行逾時（超過 0.05 秒）']
+    release.set()
+    executor.shutdown(wait=True)
+    assert results == ['⚠️ 函式執行逾時（超過 0.05 秒）']
+    stats = executor.stats()
+    assert stats['timeouts'] == 1
+    assert stats['late_results'] == 1
+    assert stats['completed'] == 0
+
+
+def test_timeouts_share_one_thread():
+    executor = ToolExecutor(max_workers=4, max_pending=16, timeout=5)
+    release = threading.Event()
+    finished = threading.Semaphore(0)
+    before = threading.active_count()
+    for _ in range(20):
+        executor.submit(release.wait, (1,), lambda result: finished.release())
+    # 4 條工作執行緒 + 1 條逾時執行緒，不會每個呼叫各一條
+    assert threading.active_count() - before <= 5
+    assert len(executor._timeouts) == 20
+    release.set()
+    for _ in range(20):
+        assert finished.acquire(timeout=1)
+    # 完成的呼叫會取消自己的逾時
+    assert len(executor._timeouts) == 0
+    assert executor.stats()['completed'] == 20
+    executor.shutdown(wait=True)
+
+
+def test_semaphore_bounds_running_and_pending_calls():
+    executor = ToolExecutor(max_workers=1, max_pending=1, timeout=5)
+    release = threading.Event()
+    results, _, on_done = _collector()
+    assert executor.submit(release.wait, (1,), on_done)
+    assert executor.submit(release.wait, (1,), on_done)
+    # 一個執行中 + 一個排隊，第三個直接回報忙碌
+    assert not executor.submit(release.wait, (1,), on_done)
+    assert results == ['⚠️ 系統忙碌中，請稍後再試']
+    assert executor.stats()['rejected'] == 1
+    release.set()
+    executor.shutdown(wait=True)
+    # 名額釋放後可以再提交
+    executor = ToolExecutor(max_workers=1, max_pending=0, timeout=5)
+    _, done, on_done = _collector()
+    assert executor.submit(lambda: 'ok', (), on_done)
+    assert done.wait(1)
+    assert executor.submit(lambda: 'ok', (), on_done)
+    executor.shutdown(wait=True)
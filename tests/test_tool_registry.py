@@ -0,0 +1,168 @@
+import json
+from typing import Annotated, Literal, Optional, TypedDict
+
+import pytest
+
+from tool_registry import ToolArgumentError, ToolContext, ToolRegistry
+
+
+class Sensor(TypedDict, total=False):
+    grip: Annotated[float, "握力"]
+    sit_up: int
+
+
+def _registry():
+    tools = ToolRegistry()
+
+    @tools.tool("新增紀錄")
+    def add_record(
+        patient_id: Annotated[int, "病人ID"],
+        gender: Literal["男", "女"],
+        weight: Optional[float] = None,
+        reviewed: bool = False,
+        sensor: Optional[Sensor] = None,
+    ):
+        return json.dumps({'patient_id': patient_id, 'gender': gender, 'weight': weight,
+                           'reviewed': reviewed, 'sensor': sensor}, ensure_ascii=False)
+
+    @tools.tool("目前身份")
+    def whoami(context: ToolContext):
+        return context.role
+
+    return tools
+
+
+# -----------------------------------------------------
+# schema 編譯
+# -----------------------------------------------------
+
+def test_schema_is_compiled_from_annotations():
+    schema = _registry()['add_record'].schema
+    assert schema['type'] == 'function'
+    assert schema['name'] == 'add_record'
+    assert schema['description'] == '新增紀錄'
+    parameters = schema['parameters']
+    assert parameters['required'] == ['patient_id', 'gender']
+    properties = parameters['properties']
+    assert properties['patient_id'] == {'type': 'integer', 'description': '病人ID'}
+    assert properties['gender'] == {'type': 'string', 'enum': ['男', '女']}
+    assert properties['weight'] == {'type': 'number'}
+    assert properties['reviewed'] == {'type': 'boolean'}
+    assert properties['sensor'] == {
+        'type': 'object',
+        'properties': {'grip': {'type': 'number', 'description': '握力'}, 'sit_up': {'type': 'integer'}},
+    }
+
+
+def test_context_parameter_is_hidden_from_schema():
+    tools = _registry()
+    assert tools['whoami'].schema['parameters'] == {'type': 'object', 'properties': {}}
+    assert tools.call('whoami', '{}', ToolContext('doctor')) == 'doctor'
+
+
+def test_registration_errors():
+    tools = _registry()
+
+    def add_record(patient_id: int):
+        pass
+    with pytest.raises(ValueError, match='工具名稱重複'):
+        tools.tool("重複")(add_record)
+
+    def untyped(patient_id):
+        pass
+    with pytest.raises(TypeError, match='缺少型別標註'):
+        tools.tool("沒有標註")(untyped)
+
+    def odd(value: list):
+        pass
+    with pytest.raises(TypeError, match='不支援的型別'):
+        tools.tool("不支援")(odd)
+
+
+# -----------------------------------------------------
+# 參數轉型與錯誤訊息
+# -----------------------------------------------------
+
+def test_arguments_are_coerced():
+    tools = _registry()
+    result = json.loads(tools.call('add_record', json.dumps({
+        'patient_id': '7', 'gender': '女', 'weight': '61.5', 'reviewed': 'true', 'sensor': {'grip': '30', 'sit_up': 12.0},
+    })))
+    assert result == {'patient_id': 7, 'gender': '女', 'weight': 61.5, 'reviewed': True,
+                      'sensor': {'grip': 30.0, 'sit_up': 12}}
+
+
+def test_optional_arguments_use_defaults():
+    tools = _registry()
+    result = json.loads(tools.call('add_record', '{"patient_id": 3, "gender": "男", "weight": null}'))
+    assert result['weight'] is None
+    assert result['reviewed'] is False
+
+
+@pytest.mark.parametrize('arguments, message', [
+    ({'gender': '男'}, '⚠️ 參數錯誤: 缺少必要參數 patient_id'),
+    ({'patient_id': 'abc', 'gender': '男'}, "⚠️ 參數錯誤: patient_id: 需要整數，收到 'abc'"),
+    ({'patient_id': True, 'gender': '男'}, '⚠️ 參數錯誤: patient_id: 需要整數，收到 True'),
+    ({'patient_id': 1.5, 'gender': '男'}, '⚠️ 參數錯誤: patient_id: 需要整數，收到 1.5'),
+    ({'patient_id': 1, 'gender': '其他'}, "⚠️ 參數錯誤: gender: 必須是 ['男', '女'] 其中之一，收到 '其他'"),
+    ({'patient_id': 1, 'gender': '男', 'reviewed': 'maybe'}, "⚠️ 參數錯誤: reviewed: 需要布林值，收到 'maybe'"),
+    ({'patient_id': 1, 'gender': '男', 'sensor': {'grip': 'x'}}, "⚠️ 參數錯誤: sensor: grip: 需要數字，收到 'x'"),
+    ({'patient_id': 1, 'gender': '男', 'sensor': [1]}, '⚠️ 參數錯誤: sensor: 需要物件，收到 [1]'),
+])
+def test_argument_errors(arguments, message):
+    assert _registry().call('add_record', json.dumps(arguments, ensure_ascii=False)) == message
+
+
+def test_malformed_json_and_unknown_tool():
+    tools = _registry()
+    assert tools.call('add_record', '{not json').startswith('⚠️ 參數錯誤: ')
+    assert tools.call('add_record', '[1, 2]') == '⚠️ 參數錯誤: 參數必須是 JSON 物件'
+    assert tools.call('nope', '{}') == '❌ 未知的函式: nope'
+
+
+def test_bind_raises_tool_argument_error():
+    with pytest.raises(ToolArgumentError):
+        _registry()['add_record'].bind({'patient_id': 1})
+
+
+def test_tool_exception_becomes_error_message():
+    tools = ToolRegistry()
+
+    @tools.tool("會失敗")
+    def broken(patient_id: int):
+        raise RuntimeError('資料庫斷線')
+
+    assert tools.call('broken', '{"patient_id": 1}') == '執行函式時發生錯誤: 資料庫斷線'
+
+
+# -----------------------------------------------------
+# 身份檢查
+# -----------------------------------------------------
+
+def _role_registry():
+    tools = ToolRegistry()
+
+    @tools.tool("所有人")
+    def confirm(name: str):
+        return 'ok'
+
+    @tools.tool("醫生專用", roles=('doctor',))
+    def report(patient_id: int):
+        return f'report {patient_id}'
+
+    return tools
+
+
+def test_schemas_are_filtered_by_role():
+    tools = _role_registry()
+    assert [schema['name'] for schema in tools.schemas()] == ['confirm', 'report']
+    assert [schema['name'] for schema in tools.schemas('guest')] == ['confirm']
+    assert [schema['name'] for schema in tools.schemas('doctor')] == ['confirm', 'report']
+
+
+def test_call_checks_role():
+    tools = _role_registry()
+    assert tools.call('report', '{"patient_id": 1}', ToolContext('guest')) == '❌ 目前的身份無法使用函式: report'
+    assert tools.call('report', '{"patient_id": 1}', ToolContext('doctor')) == 'report 1'
+    # 沒有 context 時（例如內部呼叫）不檢查身份
+    assert tools.call('report', '{"patient_id": 1}') == 'report 1'
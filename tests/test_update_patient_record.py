@@ -0,0 +1,83 @@
+import contextlib
+
+import pytest
+
+import medical_tools
+from medical_tools import SENSOR_METRICS, update_patient_record
+
+
+class FakeCursor:
+    def __init__(self, record_exists=True):
+        self.record_exists = record_exists
+        self.statements = []
+        self._last = None
+
+    def execute(self, query, params=()):
+        self.statements.append((' '.join(query.split()), params))
+        self._last = query
+
+    def executemany(self, query, rows):
+        self.statements.append((' '.join(query.split()), list(rows)))
+
+    def fetchone(self):
+        if 'SELECT 1' in self._last:
+            return (1,) if self.record_exists else None
+        return ('2024-05-01 08:30:15',)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def cursor(monkeypatch):
+    cursor = FakeCursor()
+
+    @contextlib.contextmanager
+    def fake_db_cursor():
+        yield FakeConnection(), cursor
+
+    monkeypatch.setattr(medical_tools, 'db_cursor', fake_db_cursor)
+    return cursor
+
+
+def _statements(cursor, verb):
+    return [s for s in cursor.statements if s[0].startswith(verb)]
+
+
+def test_empty_sensor_data_deletes_old_readings(cursor):
+    result = update_patient_record(patient_id=1, record_id=5, sensor_data={})
+    assert result.startswith("✅")
+
+    (delete,) = _statements(cursor, 'DELETE')
+    assert delete[1] == (5, *SENSOR_METRICS)
+    assert not _statements(cursor, 'INSERT')
+
+
+def test_sensor_data_replaces_readings(cursor):
+    update_patient_record(patient_id=1, record_id=5, weight=60.5, sensor_data={SENSOR_METRICS[0]: 30.0})
+
+    (delete,) = _statements(cursor, 'DELETE')
+    assert delete[1] == (5, 'weight', *SENSOR_METRICS)
+    (insert,) = _statements(cursor, 'INSERT')
+    assert insert[1] == [
+        (1, 5, 'weight', 60.5, '2024-05-01 08:30:15'),
+        (1, 5, SENSOR_METRICS[0], 30.0, '2024-05-01 08:30:15'),
+    ]
+
+
+def test_text_fields_keep_readings(cursor):
+    update_patient_record(patient_id=1, record_id=5, diet='少油')
+    assert not _statements(cursor, 'DELETE')
+    assert not _statements(cursor, 'INSERT')
+
+
+def test_missing_record_touches_nothing(cursor):
+    cursor.record_exists = False
+    result = update_patient_record(patient_id=1, record_id=5, sensor_data={})
+    assert result.startswith("❌")
+    assert [s[0].split()[0] for s in cursor.statements] == ['SELECT']
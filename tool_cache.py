@@ -0,0 +1,111 @@
+import collections
+import threading
+import time
+
+# -----------------------------------------------------
+# 函式呼叫結果的快取
+# -----------------------------------------------------
+
+# 執行緒安全的 LRU + TTL 快取，給唯讀的函式呼叫使用：
+# - 每筆資料有一個標籤（例如病人ID），寫入同一個標籤的資料時以 invalidate(tag) 一次清掉
+# - 超過 max_entries 時丟掉最久沒用的資料，超過 ttl 秒的資料視為過期
+# - 查詢期間如果有任何 invalidate，查詢結果不會被存入，避免把寫入前讀到的舊資料放回快取
+class ToolCache:
+    def __init__(self, max_entries=1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()   # key -> (到期時間, 標籤, 結果)
+        self._tags = {}                             # 標籤 -> {key}
+        self._generation = 0                        # 每次 invalidate 加一
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'stores': 0,
+            'stale_skipped': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'invalidated_entries': 0,
+        }
+
+    # 查詢快取，回傳 (是否命中, 結果)
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None
+            expires_at, tag, value = entry
+            if expires_at <= time.monotonic():
+                self._remove_locked(key, tag)
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return True, value
+
+    # 查詢資料庫前先取得目前的版本，存入時用來確認期間沒有寫入
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    # 存入結果；generation 與目前版本不同時（查詢期間有寫入）不存
+    def put(self, key, tag, value, generation):
+        with self._lock:
+            if generation != self._generation:
+                self._stats['stale_skipped'] += 1
+                return False
+            if key in self._entries:
+                self._remove_locked(key, self._entries[key][1])
+            self._entries[key] = (time.monotonic() + self.ttl, tag, value)
+            self._tags.setdefault(tag, set()).add(key)
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                old_key, (_, old_tag, _) = next(iter(self._entries.items()))
+                self._remove_locked(old_key, old_tag)
+                self._stats['evictions'] += 1
+            return True
+
+    # 清掉某個標籤的所有資料，回傳清掉的筆數
+    def invalidate(self, tag):
+        with self._lock:
+            self._generation += 1
+            keys = self._tags.pop(tag, ())
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidations'] += 1
+            self._stats['invalidated_entries'] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove_locked(self, key, tag):
+        del self._entries[key]
+        keys = self._tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    # 命中率與容量統計
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'max_entries': self.max_entries,
+                'ttl_s': self.ttl,
+                'size': len(self._entries),
+                **self._stats,
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,136 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# -----------------------------------------------------
+# 函式呼叫的背景執行緒池
+# -----------------------------------------------------
+
+# 所有呼叫共用一條逾時執行緒：截止時間放在 heap 中，只等待最早的一個，
+# 不需要為每個呼叫各開一條 threading.Timer 執行緒。
+# 取消只做標記，輪到它時直接略過；關閉後送完剩下的逾時才結束執行緒。
+class _TimeoutScheduler:
+    def __init__(self):
+        self._heap = []    # [(截止時間, 序號, 項目)]，項目為 [callback, args] 或取消後的 None
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    # delay 秒後在逾時執行緒呼叫 callback(*args)；回傳給 cancel 使用的項目
+    def schedule(self, delay, callback, args):
+        entry = [callback, args]
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), entry))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='tool-call-timeout', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    def cancel(self, entry):
+        entry[0] = None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def __len__(self):
+        with self._cond:
+            return sum(1 for _, _, entry in self._heap if entry[0] is not None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._heap and self._heap[0][2][0] is None:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    if self._closed:
+                        self._thread = None
+                        return
+                    self._cond.wait()
+                    continue
+                remaining = self._heap[0][0] - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                entry = heapq.heappop(self._heap)[2]
+                callback, args = entry
+                entry[0] = None
+            if callback is not None:
+                callback(*args)
+
+
+# 在背景執行緒池執行 AI 的函式呼叫（資料庫查詢），讓 WebSocket 接收端只負責解析與分派事件
+# - 最多 max_workers 個呼叫同時執行、另外最多 max_pending 個排隊；再多就直接回報忙碌
+# - 每個呼叫都有逾時時間：逾時先把錯誤訊息回傳給 AI，之後才完成的結果會被丟棄；
+#   逾時由共用的 _TimeoutScheduler 處理，執行緒數量不隨呼叫數增加
+# - 不論完成、失敗、逾時或被拒絕，on_done(result) 對每個呼叫都只會被呼叫一次
+class ToolExecutor:
+    def __init__(self, max_workers=4, max_pending=16, timeout=10.0):
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tool-call')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._timeouts = _TimeoutScheduler()
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'rejected': 0,
+            'late_results': 0,
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    # 提交 fn(*args)；回傳 False 表示佇列已滿，on_done 已收到忙碌訊息
+    def submit(self, fn, args, on_done, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            on_done("⚠️ 系統忙碌中，請稍後再試")
+            return False
+        self._count('submitted')
+
+        finished = threading.Event()
+        finish_lock = threading.Lock()
+
+        # 只有第一個到達的結果（完成或逾時）會被送出
+        def finish(result, outcome):
+            with finish_lock:
+                if finished.is_set():
+                    self._count('late_results')
+                    return
+                finished.set()
+            self._count(outcome)
+            on_done(result)
+
+        def run():
+            try:
+                result, outcome = fn(*args), 'completed'
+            except Exception as e:
+                result, outcome = f"執行函式時發生錯誤: {e}", 'failed'
+            finally:
+                self._timeouts.cancel(timer)
+                self._slots.release()
+            finish(result, outcome)
+
+        timer = self._timeouts.schedule(timeout, finish, (f"⚠️ 函式執行逾時（超過 {timeout} 秒）", 'timeouts'))
+        self._pool.submit(run)
+        return True
+
+    # 停止接受新呼叫；wait=False 時不等待執行中的呼叫
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+        self._timeouts.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,321 @@
+import inspect
+import json
+import logging
+import time
+from typing import Annotated, Literal, Union, get_args, get_origin, get_type_hints
+
+from app_logging import redact_arguments
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------
+# 函式（工具）註冊表
+# -----------------------------------------------------
+# 每個工具只宣告一次：一個有型別標註的 Python 函式加上 @registry.tool(...) 裝飾器。
+# 註冊時就從型別標註產生 JSON schema 與參數檢查 / 轉型函式，呼叫時以 dict 查表分派。
+#
+#     @TOOLS.tool("查詢病人資料")
+#     def query_patient(patient_id: Annotated[int, "病人ID"]):
+#         ...
+#
+# 支援的型別：int、float、str、bool、dict、Literal[...]（enum）、TypedDict（巢狀 object）、
+# Optional[...]；參數描述寫在 Annotated 的第二個參數，有預設值的參數為選填。
+#
+# roles 指定哪些使用者身份可以使用這個工具（空的代表所有身份都可以）；
+# 型別標註為 ToolContext 的參數不會出現在 schema 中，呼叫時由註冊表傳入目前對話的狀態。
+#
+# 註冊表有 cache（ToolCache）時：cache_by="patient_id" 的唯讀工具，結果以（工具名稱, 參數）為鍵快取，
+# 並以該參數的值作為標籤；invalidates="patient_id" 的寫入工具執行後清掉同一個標籤的快取。
+# 開頭為錯誤符號的結果不會被快取。
+# 每次實際執行函式的時間記錄在 tool_exec_ms{tool}（快取命中不計）。
+
+# 參數不符合 schema
+class ToolArgumentError(ValueError):
+    pass
+
+
+# 代表失敗或查無資料的結果開頭，這些結果不快取
+ERROR_PREFIXES = ("❌", "⚠️")
+
+
+# 每個對話各自一份的狀態，由 RealtimeSession 建立，傳給需要它的工具
+class ToolContext:
+    def __init__(self, role='guest'):
+        self.role = role                # 目前確認的使用者身份
+        self.patient_id = None          # 目前對話的病人ID
+        self.conversation_id = None     # 目前進行中的對話ID（conversation_sessions）
+
+
+_MISSING = object()
+
+
+def _is_typeddict(tp):
+    return isinstance(tp, type) and issubclass(tp, dict) and hasattr(tp, '__total__')
+
+
+def _coerce_int(value):
+    if isinstance(value, bool):
+        raise ToolArgumentError(f"需要整數，收到 {value!r}")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    raise ToolArgumentError(f"需要整數，收到 {value!r}")
+
+
+def _coerce_float(value):
+    if isinstance(value, bool):
+        raise ToolArgumentError(f"需要數字，收到 {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            pass
+    raise ToolArgumentError(f"需要數字，收到 {value!r}")
+
+
+def _coerce_str(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ToolArgumentError(f"需要字串，收到 {value!r}")
+
+
+def _coerce_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true'
+    raise ToolArgumentError(f"需要布林值，收到 {value!r}")
+
+
+def _coerce_dict(value):
+    if isinstance(value, dict):
+        return value
+    raise ToolArgumentError(f"需要物件，收到 {value!r}")
+
+
+_SIMPLE_TYPES = {
+    int: ('integer', _coerce_int),
+    float: ('number', _coerce_float),
+    str: ('string', _coerce_str),
+    bool: ('boolean', _coerce_bool),
+    dict: ('object', _coerce_dict),
+}
+
+
+# 依型別標註產生 (JSON schema, 轉型函式)
+def _compile_type(tp):
+    description = None
+    while get_origin(tp) in (Annotated, Union):
+        if get_origin(tp) is Annotated:
+            tp, *extras = get_args(tp)
+            description = next((extra for extra in extras if isinstance(extra, str)), description)
+        else:
+            # Optional[X] 只取 X，是否必填由預設值決定
+            args = [arg for arg in get_args(tp) if arg is not type(None)]
+            if len(args) != 1:
+                raise TypeError(f"不支援的型別: {tp}")
+            tp = args[0]
+
+    if get_origin(tp) is Literal:
+        choices = get_args(tp)
+        schema_type, base_coerce = _SIMPLE_TYPES[type(choices[0])]
+        allowed = set(choices)
+
+        def coerce(value):
+            value = base_coerce(value)
+            if value not in allowed:
+                raise ToolArgumentError(f"必須是 {list(choices)} 其中之一，收到 {value!r}")
+            return value
+
+        schema = {"type": schema_type, "enum": list(choices)}
+    elif _is_typeddict(tp):
+        fields = {
+            key: _compile_type(field_type)
+            for key, field_type in get_type_hints(tp, include_extras=True).items()
+        }
+
+        def coerce(value):
+            value = _coerce_dict(value)
+            result = dict(value)
+            for key, (_, field_coerce) in fields.items():
+                if result.get(key) is not None:
+                    try:
+                        result[key] = field_coerce(result[key])
+                    except ToolArgumentError as e:
+                        raise ToolArgumentError(f"{key}: {e}") from None
+            return result
+
+        schema = {"type": "object", "properties": {key: field_schema for key, (field_schema, _) in fields.items()}}
+    elif tp in _SIMPLE_TYPES:
+        schema_type, coerce = _SIMPLE_TYPES[tp]
+        schema = {"type": schema_type}
+    else:
+        raise TypeError(f"不支援的型別: {tp}")
+
+    if description:
+        schema = {**schema, "description": description}
+    return schema, coerce
+
+
+# 一個註冊好的工具：schema 與參數轉型都在註冊時預先編譯
+class Tool:
+    def __init__(self, fn, name, description, roles, cache_by=None, invalidates=None):
+        self.fn = fn
+        self.name = name
+        self.description = description
+        self.roles = frozenset(roles)
+        self.cache_by = cache_by
+        self.invalidates = invalidates
+        self.exec_time = METRICS.histogram('tool_exec_ms', tool=name)
+
+        hints = get_type_hints(fn, include_extras=True)
+        properties = {}
+        required = []
+        self._params = []   # [(參數名稱, 轉型函式, 預設值)]
+        self._context_param = None
+        for param in inspect.signature(fn).parameters.values():
+            if param.name not in hints:
+                raise TypeError(f"{name}: 參數 {param.name} 缺少型別標註")
+            if hints[param.name] is ToolContext:
+                self._context_param = param.name
+                continue
+            schema, coerce = _compile_type(hints[param.name])
+            properties[param.name] = schema
+            default = _MISSING if param.default is inspect.Parameter.empty else param.default
+            if default is _MISSING:
+                required.append(param.name)
+            self._params.append((param.name, coerce, default))
+
+        for option in (cache_by, invalidates):
+            if option is not None and option not in properties:
+                raise TypeError(f"{name}: 沒有參數 {option}")
+
+        parameters = {"type": "object", "properties": properties}
+        if required:
+            parameters["required"] = required
+        self.schema = {
+            "type": "function",
+            "name": name,
+            "description": description,
+            "parameters": parameters,
+        }
+
+    # 檢查並轉換參數，回傳可直接傳給函式的 kwargs
+    def bind(self, arguments, context=None):
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError("參數必須是 JSON 物件")
+        kwargs = {}
+        for name, coerce, default in self._params:
+            value = arguments.get(name)
+            if value is None:
+                if default is _MISSING:
+                    raise ToolArgumentError(f"缺少必要參數 {name}")
+                kwargs[name] = default
+                continue
+            try:
+                kwargs[name] = coerce(value)
+            except ToolArgumentError as e:
+                raise ToolArgumentError(f"{name}: {e}") from None
+        if self._context_param is not None:
+            kwargs[self._context_param] = context if context is not None else ToolContext()
+        return kwargs
+
+    def allowed(self, role):
+        return not self.roles or role in self.roles
+
+    # 快取鍵：工具名稱加上轉型後的參數（不含 ToolContext）
+    def cache_key(self, kwargs):
+        return (self.name, json.dumps([kwargs[name] for name, _, _ in self._params], default=str))
+
+    # 以轉型後的參數執行函式並記錄執行時間
+    def run(self, kwargs):
+        start = time.perf_counter()
+        try:
+            return self.fn(**kwargs)
+        finally:
+            self.exec_time.observe_since(start)
+
+    def __call__(self, arguments, context=None):
+        return self.run(self.bind(arguments, context))
+
+
+class ToolRegistry:
+    def __init__(self, cache=None):
+        self._tools = {}
+        self.cache = cache
+
+    # 裝飾器：註冊一個工具，函式本身不變
+    def tool(self, description, name=None, roles=(), cache_by=None, invalidates=None):
+        def decorator(fn):
+            tool = Tool(fn, name or fn.__name__, description, roles, cache_by, invalidates)
+            if tool.name in self._tools:
+                raise ValueError(f"工具名稱重複: {tool.name}")
+            self._tools[tool.name] = tool
+            return fn
+        return decorator
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def __getitem__(self, name):
+        return self._tools[name]
+
+    def names(self):
+        return list(self._tools)
+
+    # 工具的 JSON schema（依註冊順序）；指定 role 時只回傳該身份可用的工具
+    def schemas(self, role=None):
+        return [tool.schema for tool in self._tools.values() if role is None or tool.allowed(role)]
+
+    # 執行 AI 的函式呼叫，arguments 為 JSON 字串；回傳要交給 AI 的結果字串。
+    # 傳入 context 時會檢查目前身份是否可以使用這個工具。
+    def call(self, name, arguments, context=None):
+        tool = self._tools.get(name)
+        if tool is None:
+            return f"❌ 未知的函式: {name}"
+        if context is not None and not tool.allowed(context.role):
+            return f"❌ 目前的身份無法使用函式: {name}"
+        try:
+            function_call_args = json.loads(arguments) if arguments else {}
+            logger.info('處理函式呼叫: %s, 參數: %s', name, redact_arguments(function_call_args))
+            kwargs = tool.bind(function_call_args, context)
+            if self.cache is None:
+                return tool.run(kwargs)
+            return self._call_cached(tool, kwargs)
+        except (ToolArgumentError, json.JSONDecodeError) as e:
+            return f"⚠️ 參數錯誤: {e}"
+        except Exception as e:
+            logger.exception('處理函式呼叫 %s 時發生錯誤', name)
+            return f"執行函式時發生錯誤: {e}"
+
+    # 唯讀工具先查快取；寫入工具執行後清掉相關的快取
+    def _call_cached(self, tool, kwargs):
+        if tool.cache_by is not None:
+            key = tool.cache_key(kwargs)
+            hit, result = self.cache.get(key)
+            if hit:
+                return result
+            generation = self.cache.generation()
+            result = tool.run(kwargs)
+            if isinstance(result, str) and not result.startswith(ERROR_PREFIXES):
+                self.cache.put(key, kwargs[tool.cache_by], result, generation)
+            return result
+
+        try:
+            return tool.run(kwargs)
+        finally:
+            if tool.invalidates is not None:
+                self.cache.invalidate(kwargs[tool.invalidates])
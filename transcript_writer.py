@@ -0,0 +1,87 @@
+import logging
+import threading
+
+import mysql.connector
+
+from audio_buffers import DropOldestQueue
+
+# -----------------------------------------------------
+# 對話逐字稿的背景寫入
+# -----------------------------------------------------
+
+TRANSCRIPT_BATCH_SIZE = 50          # 累積幾筆就寫入一次
+TRANSCRIPT_FLUSH_INTERVAL = 1.0     # 最早的一筆最多等幾秒就寫入
+TRANSCRIPT_MAX_PENDING = 10000      # 最多暫存幾筆尚未寫入的資料，滿了就丟掉最舊的
+
+logger = logging.getLogger(__name__)
+
+INSERT_MESSAGE = """INSERT INTO conversation_messages
+                 (session_id, patient_id, role, content, created_at)
+                 VALUES (%s, %s, %s, %s, %s)"""
+
+
+# 把 conversation_messages 的寫入移到背景執行緒：
+# - add() 只把資料放進有上限的佇列，不碰資料庫，可以直接在事件迴圈 / 音訊路徑上呼叫
+# - 背景執行緒累積到 batch_size 筆或最早一筆等了 flush_interval 秒時，以 executemany 一次寫入多筆
+# - close() 停止接收新資料，寫完佇列中剩下的資料後才結束
+class TranscriptWriter:
+    def __init__(self, pool, batch_size=TRANSCRIPT_BATCH_SIZE, flush_interval=TRANSCRIPT_FLUSH_INTERVAL,
+                 max_pending=TRANSCRIPT_MAX_PENDING):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = DropOldestQueue(max_pending)
+        self._lock = threading.Lock()
+        self._stats = {
+            'flushes': 0,
+            'written': 0,
+            'failed': 0,
+        }
+        self._thread = threading.Thread(target=self._run, name='transcript-writer', daemon=True)
+        self._thread.start()
+
+    # 加入一筆逐字稿（不會阻塞）
+    def add(self, session_id, patient_id, role, content, created_at):
+        self._queue.put((session_id, patient_id, role, content, created_at))
+
+    def _run(self):
+        while True:
+            rows = self._queue.get_batch(self.batch_size, self.flush_interval)
+            if not rows:
+                # 佇列已關閉且已清空
+                return
+            self._flush(rows)
+
+    def _flush(self, rows):
+        try:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    cursor.executemany(INSERT_MESSAGE, rows)
+                    connection.commit()
+                finally:
+                    cursor.close()
+        except mysql.connector.Error as err:
+            logger.warning('⚠️ 寫入對話逐字稿失敗（%d 筆）: %s', len(rows), err)
+            with self._lock:
+                self._stats['failed'] += len(rows)
+            return
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['written'] += len(rows)
+
+    # 停止接收新資料並等待剩下的資料寫完（最多 timeout 秒）
+    def close(self, timeout=10.0):
+        self._queue.close()
+        self._thread.join(timeout)
+
+    def stats(self):
+        queue_stats = self._queue.stats()
+        with self._lock:
+            return {
+                **self._stats,
+                'pending': queue_stats['depth'],
+                'max_pending': queue_stats['max_depth'],
+                'dropped': queue_stats['dropped'],
+                'avg_batch': queue_stats['avg_batch'],
+            }